@@ -0,0 +1,247 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import (
+    ADMIN_PASSWORD,
+    ADMIN_USERNAME,
+    LatencyRecorder,
+    compare_results,
+    metadata,
+    print_table,
+    save_results,
+    setup_environment,
+)
+
+
+class SimulatedMiner:
+    def __init__(self, client, recorder: LatencyRecorder, username: str, key_size: int):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        self.client = client
+        self.recorder = recorder
+        self.username = username
+        self.password = f"{username}-password"
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+        self.public_key = (
+            self.private_key.public_key()
+            .public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+            .decode()
+        )
+        self.session_key = None
+        self.headers = {}
+
+    async def request(self, name: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        self.recorder.record(name, started, time.perf_counter(), response.status_code < 400)
+        return response
+
+    def decrypt(self, response: dict) -> dict:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        from security import OAEP_PADDING
+
+        if "iv" not in response:
+            return json.loads(
+                self.private_key.decrypt(base64.b64decode(response["encrypted"]), OAEP_PADDING)
+            )
+        if "encrypted_key" in response:
+            key = self.private_key.decrypt(base64.b64decode(response["encrypted_key"]), OAEP_PADDING)
+            if response.get("session"):
+                self.session_key = key
+        else:
+            key = self.session_key
+        payload = AESGCM(key).decrypt(
+            base64.b64decode(response["iv"]), base64.b64decode(response["encrypted"]), None
+        )
+        return json.loads(payload)
+
+    async def register(self):
+        await self.request(
+            "POST /register",
+            "POST",
+            "/register",
+            json={"username": self.username, "password": self.password, "public_key": self.public_key},
+        )
+
+    async def login(self):
+        response = await self.request(
+            "POST /login-db",
+            "POST",
+            "/login-db",
+            json={"username": self.username, "password": self.password},
+            headers={"X-Encryption": "session"},
+        )
+        token = self.decrypt(response.json())["access_token"]
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    async def work(self, peers: list):
+        response = await self.request("GET /task", "GET", "/task", headers=self.headers)
+        if response.status_code == 200:
+            task = self.decrypt(response.json())
+            a, b = task["a"], task["b"]
+            answer = {"+": a + b, "-": a - b, "*": a * b, "/": a / b}[task["operation"]]
+            await self.request(
+                "POST /task/{id}/result",
+                "POST",
+                f"/task/{task['task_id']}/result",
+                params={"result": answer},
+                headers=self.headers,
+            )
+
+        if peers:
+            await self.request(
+                "POST /send",
+                "POST",
+                "/send",
+                json={"to_user": random.choice(peers), "content": f"hello from {self.username}"},
+                headers=self.headers,
+            )
+        response = await self.request(
+            "POST /get-message",
+            "POST",
+            "/get-message",
+            params={"limit": 10},
+            headers=self.headers,
+        )
+        for message in response.json().get("messages", []):
+            self.decrypt(message)
+
+
+class Admin(SimulatedMiner):
+    async def login(self):
+        response = await self.request(
+            "POST /login",
+            "POST",
+            "/login",
+            json={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD, "public_key": self.public_key},
+            headers={"X-Encryption": "session"},
+        )
+        token = self.decrypt(response.json())["access_token"]
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    async def broadcast(self):
+        await self.request("POST /broadcast-task", "POST", "/broadcast-task", headers=self.headers)
+
+    async def read_history(self):
+        await self.request(
+            "GET /broadcast-tasks-history",
+            "GET",
+            "/broadcast-tasks-history",
+            headers=self.headers,
+        )
+
+
+def start_uvicorn(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"uvicorn failed to start on port {port}")
+        time.sleep(0.05)
+    # With port 0 the OS picked a free port.
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, port
+
+
+async def run_benchmark(args) -> dict:
+    import httpx
+    import main
+
+    recorder = LatencyRecorder()
+    server = None
+    if args.uvicorn:
+        # Real HTTP through uvicorn; the server runs the startup hooks itself.
+        server, thread, port = start_uvicorn(main.app, args.port)
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60)
+    else:
+        await main.app.router.startup()
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=60
+        )
+
+    try:
+        started = time.perf_counter()
+        miners = [
+            SimulatedMiner(client, recorder, f"miner{i}", args.key_size) for i in range(args.miners)
+        ]
+        admin = Admin(client, recorder, ADMIN_USERNAME, args.key_size)
+        keygen_seconds = time.perf_counter() - started
+
+        await admin.login()
+        await asyncio.gather(*(miner.register() for miner in miners))
+        await asyncio.gather(*(miner.login() for miner in miners))
+
+        usernames = [miner.username for miner in miners]
+        run_started = time.perf_counter()
+        for _ in range(args.rounds):
+            await admin.broadcast()
+            await asyncio.gather(
+                *(miner.work([name for name in usernames if name != miner.username]) for miner in miners)
+            )
+        run_seconds = time.perf_counter() - run_started
+        await admin.read_history()
+    finally:
+        await client.aclose()
+        if server is not None:
+            server.should_exit = True
+            thread.join()
+        else:
+            await main.app.router.shutdown()
+
+    return {
+        "meta": metadata(
+            miners=args.miners,
+            rounds=args.rounds,
+            key_size=args.key_size,
+            transport="uvicorn" if args.uvicorn else "asgi",
+            db_url=os.environ["DB_URL"],
+        ),
+        "summary": {
+            "keygen_seconds": round(keygen_seconds, 3),
+            "run_seconds": round(run_seconds, 3),
+            "requests": sum(len(durations) for durations in recorder.durations.values()),
+            "errors": sum(recorder.errors.values()),
+        },
+        "endpoints": recorder.report(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Simulate miners against the backend API and report latency per endpoint"
+    )
+    parser.add_argument("--miners", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--key-size", type=int, default=2048)
+    parser.add_argument("--db-url", help="Database to use (default: a new SQLite file)")
+    parser.add_argument("--uvicorn", action="store_true", help="Serve over HTTP instead of in-process")
+    parser.add_argument("--port", type=int, default=8099, help="0 picks a free port")
+    parser.add_argument("--output", default="bench_api.json")
+    parser.add_argument("--compare", help="Earlier results file to compare p95 latency with")
+    args = parser.parse_args()
+
+    setup_environment(args.db_url)
+    results = asyncio.run(run_benchmark(args))
+
+    print_table(results["endpoints"], "Endpoint latency")
+    print(f"\n{results['summary']}")
+    if args.compare:
+        compare_results(results, args.compare, "endpoints")
+    save_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
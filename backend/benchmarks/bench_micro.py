@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import (
+    compare_results,
+    metadata,
+    print_table,
+    save_results,
+    setup_environment,
+    summarize,
+    time_call,
+)
+
+
+class FakeClient:
+    def __init__(self, host: str):
+        self.host = host
+
+
+class FakeRequest:
+    def __init__(self, host: str):
+        self.client = FakeClient(host)
+        self.headers = {}
+
+
+def bench_encrypt_response(repeat: int, key_size: int) -> dict:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    from security import SecurityManager
+
+    public_key = (
+        rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+        .public_key()
+        .public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+        .decode()
+    )
+    manager = SecurityManager()
+    task = {"task_id": 1, "content": "add 1 and 2", "a": 1, "b": 2, "operation": "+"}
+    large = {"message": "x" * 4096, "from": "miner"}
+
+    results = {}
+    manager.set_public_key("rsa", public_key)
+    results["encrypt_response rsa"] = time_call(lambda: manager.encrypt_response(task, "rsa"), repeat)
+
+    manager.set_public_key("hybrid", public_key, "hybrid")
+    results["encrypt_response hybrid"] = time_call(
+        lambda: manager.encrypt_response(task, "hybrid"), repeat
+    )
+    results["encrypt_response hybrid 4KiB"] = time_call(
+        lambda: manager.encrypt_response(large, "hybrid"), repeat
+    )
+
+    manager.set_public_key("session", public_key, "session")
+    manager.start_session("sid", "session", datetime.utcnow() + timedelta(hours=1))
+    results["encrypt_response session"] = time_call(
+        lambda: manager.encrypt_response(task, "session", session_id="sid"), repeat
+    )
+    return results
+
+
+def bench_check_brute_force(repeat: int, addresses: int) -> dict:
+    from ratelimit import RateLimiter
+    from security import SecurityManager
+
+    manager = SecurityManager()
+    # The benchmark environment turns rate limits off; measure real ones.
+    manager.failed_logins = RateLimiter("failed-logins", 5, 900)
+    manager.login_rate_limiter = RateLimiter("login", repeat + 1, 60)
+    requests = [
+        FakeRequest(f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}") for i in range(addresses)
+    ]
+
+    async def run():
+        # Fill the limiter with one failed login per address first.
+        for request in requests:
+            await manager.failed_logins.record(request.client.host)
+
+        durations = []
+        for i in range(repeat):
+            started = time.perf_counter()
+            await manager.check_brute_force(requests[i % addresses])
+            durations.append(time.perf_counter() - started)
+        return durations
+
+    return {f"check_brute_force {addresses} addresses": summarize(asyncio.run(run()))}
+
+
+def fill_broadcast_tasks(rows: int):
+    from sqlalchemy import delete, insert
+
+    from db import SessionLocal
+    from models import BroadcastTaskModel
+
+    tasks = BroadcastTaskModel.__table__
+    started = datetime(2024, 1, 1)
+    with SessionLocal() as db:
+        db.execute(delete(tasks))
+        for offset in range(0, rows, 10000):
+            db.execute(
+                insert(tasks),
+                [
+                    {
+                        "content": f"add {i} and {i}",
+                        "created_at": started + timedelta(seconds=i),
+                        "a": i,
+                        "b": i,
+                        "operation": "+",
+                        "expected_result": float(i + i),
+                    }
+                    for i in range(offset, min(rows, offset + 10000))
+                ],
+            )
+        db.commit()
+
+
+def bench_history(repeat: int, table_sizes: list) -> dict:
+    from db import SessionLocal
+    from session import SessionManager
+
+    manager = SessionManager()
+    results = {}
+    for rows in table_sizes:
+        fill_broadcast_tasks(rows)
+        with SessionLocal() as db:
+            first_page = manager.get_broadcast_tasks_history(db)
+            # A cursor halfway through the table, reached by keyset seek.
+            middle = manager.get_broadcast_tasks_history(db, limit=rows // 2)["next_cursor"]
+
+            results[f"history first page {rows} rows"] = time_call(
+                lambda: manager.get_broadcast_tasks_history(db), repeat
+            )
+            if first_page["next_cursor"]:
+                results[f"history page at middle {rows} rows"] = time_call(
+                    lambda: manager.get_broadcast_tasks_history(db, cursor=middle), repeat
+                )
+
+        started = time.perf_counter()
+        streamed = sum(1 for _ in manager.stream_broadcast_tasks_history())
+        elapsed = time.perf_counter() - started
+        results[f"history stream {rows} rows"] = {
+            "count": 1,
+            "mean_ms": round(elapsed * 1000, 3),
+            "p50_ms": round(elapsed * 1000, 3),
+            "p95_ms": round(elapsed * 1000, 3),
+            "p99_ms": round(elapsed * 1000, 3),
+            "max_ms": round(elapsed * 1000, 3),
+            "rows_per_second": round(streamed / elapsed, 1) if elapsed else None,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of backend hot paths")
+    parser.add_argument("--repeat", type=int, default=200)
+    # Plain RSA mode needs at least 2048 bits to fit a task payload.
+    parser.add_argument("--key-size", type=int, default=2048)
+    parser.add_argument("--addresses", type=int, default=100000)
+    parser.add_argument(
+        "--history-rows", type=int, nargs="+", default=[10000, 100000],
+        help="broadcast_tasks table sizes to measure history queries at",
+    )
+    parser.add_argument("--db-url", help="Database to use (default: a new SQLite file)")
+    parser.add_argument("--output", default="bench_micro.json")
+    parser.add_argument("--compare", help="Earlier results file to compare p95 latency with")
+    args = parser.parse_args()
+
+    setup_environment(args.db_url)
+    from migrations import migrate
+
+    migrate()
+
+    benchmarks = {}
+    benchmarks.update(bench_encrypt_response(args.repeat, args.key_size))
+    benchmarks.update(bench_check_brute_force(args.repeat, args.addresses))
+    benchmarks.update(bench_history(args.repeat, args.history_rows))
+
+    results = {
+        "meta": metadata(
+            repeat=args.repeat,
+            key_size=args.key_size,
+            addresses=args.addresses,
+            history_rows=args.history_rows,
+            db_url=os.environ["DB_URL"],
+        ),
+        "benchmarks": benchmarks,
+    }
+    print_table(benchmarks, "Micro-benchmarks")
+    if args.compare:
+        compare_results(results, args.compare, "benchmarks")
+    save_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
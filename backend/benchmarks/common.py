@@ -0,0 +1,146 @@
+import json
+import os
+import platform
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+ADMIN_USERNAME = "admin"
+ADMIN_PASSWORD = "benchmark"
+
+
+def setup_environment(db_url: str = None) -> str:
+    # Must run before any backend module is imported: they read the
+    # environment at import time. Rate limits are off so they do not skew
+    # the numbers.
+    from passlib.context import CryptContext
+
+    if db_url is None:
+        db_url = f"sqlite:///{tempfile.mkdtemp(prefix='crypto-mining-bench-')}/bench.db"
+    os.environ.update(
+        {
+            "DB_URL": db_url,
+            "JWT_SECRET_KEY": secrets.token_hex(32),
+            "ADMIN_USERNAME": ADMIN_USERNAME,
+            "ADMIN_PASSWORD": CryptContext(schemes=["bcrypt"]).hash(ADMIN_PASSWORD),
+            "DEBUG_MODE": "0",
+            "LOGIN_RATE_LIMIT": "0",
+            "TASK_RATE_LIMIT": "0",
+            "SEND_RATE_LIMIT": "0",
+            "FAILED_ATTEMPT_LIMIT": "0",
+            "TASK_SCHEDULE_INTERVAL_SECONDS": "0",
+        }
+    )
+    sys.path.insert(0, SRC_DIR)
+    return db_url
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(durations: list) -> dict:
+    values = sorted(durations)
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.first_start = {}
+        self.last_end = {}
+
+    def record(self, name: str, started: float, ended: float, ok: bool = True):
+        self.durations[name].append(ended - started)
+        if not ok:
+            self.errors[name] += 1
+        self.first_start[name] = min(self.first_start.get(name, started), started)
+        self.last_end[name] = max(self.last_end.get(name, ended), ended)
+
+    def report(self) -> dict:
+        report = {}
+        for name, durations in sorted(self.durations.items()):
+            stats = summarize(durations)
+            elapsed = self.last_end[name] - self.first_start[name]
+            stats["errors"] = self.errors[name]
+            stats["throughput_rps"] = round(len(durations) / elapsed, 2) if elapsed > 0 else None
+            report[name] = stats
+        return report
+
+
+def time_call(function, repeat: int) -> dict:
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return summarize(durations)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(**parameters) -> dict:
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": parameters,
+    }
+
+
+def save_results(results: dict, path: str):
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to {path}")
+
+
+def print_table(section: dict, title: str):
+    print(f"\n{title}")
+    print(f"{'name':<40} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'req/s':>9}")
+    for name, stats in section.items():
+        throughput = stats.get("throughput_rps")
+        print(
+            f"{name:<40} {stats['count']:>7} {stats['p50_ms']:>10.3f} {stats['p95_ms']:>10.3f} "
+            f"{stats['p99_ms']:>10.3f} {throughput if throughput is not None else '-':>9}"
+        )
+
+
+def compare_results(current: dict, baseline_path: str, section: str):
+    # Prints the p95 change of every entry present in both runs.
+    with open(baseline_path) as file:
+        baseline = json.load(file).get(section, {})
+    print(f"\np95 compared with {baseline_path}")
+    for name, stats in current.get(section, {}).items():
+        previous = baseline.get(name)
+        if not previous or not previous["p95_ms"]:
+            continue
+        change = (stats["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100
+        print(f"{name:<40} {previous['p95_ms']:>10.3f} -> {stats['p95_ms']:>10.3f} ms ({change:+.1f}%)")
@@ -0,0 +1,299 @@
+import asyncio
+import csv
+import gzip
+import io
+import os
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from ingest import RESULT_TASK_CACHE_SIZE
+from logs import get_logger
+from models import BroadcastTaskModel, BroadcastTaskResultModel
+
+load_dotenv()
+
+logger = get_logger("archive")
+
+# Broadcast tasks older than this move, with their results, to ARCHIVE_DIR.
+RESULT_RETENTION_DAYS = float(os.getenv("RESULT_RETENTION_DAYS", 90))
+ARCHIVE_DIR = os.getenv(
+    "ARCHIVE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "archive"),
+)
+# Tasks per archive file and per delete transaction.
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", 1000))
+# 0 leaves archiving to `python manage.py archive`; like the scheduler,
+# enable it on one worker only.
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", 0))
+EXPORT_BATCH_SIZE = 500
+
+EXPORT_TABLES = ("results", "tasks")
+TASK_COLUMNS = tuple(column.name for column in BroadcastTaskModel.__table__.columns)
+RESULT_COLUMNS = tuple(
+    column.name for column in BroadcastTaskResultModel.__table__.columns
+)
+# Chunk files are named <first created_at>_<last created_at>_<first task id>,
+# so an export only opens the ones that overlap its range.
+STAMP_FORMAT = "%Y%m%dT%H%M%S%f"
+
+
+def _values(row, columns: tuple) -> list:
+    values = []
+    for column in columns:
+        value = getattr(row, column)
+        values.append(value.isoformat() if isinstance(value, datetime) else value)
+    return values
+
+
+def _write_csv_gz(path: str, columns: tuple, rows: list):
+    # Written under a temporary name, so a crash never leaves a partial
+    # chunk that looks complete.
+    partial = path + ".partial"
+    with gzip.open(partial, "wt", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(_values(row, columns) for row in rows)
+    os.replace(partial, path)
+
+
+def _read_csv_gz(path: str):
+    with gzip.open(path, "rt", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        yield from reader
+
+
+class ArchiveChunk:
+    def __init__(self, name: str):
+        first, last, first_id = name.split("_")
+        self.name = name
+        self.first = datetime.strptime(first, STAMP_FORMAT)
+        self.last = datetime.strptime(last, STAMP_FORMAT)
+        self.first_id = int(first_id)
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        return (end is None or self.first < end) and (
+            start is None or self.last >= start
+        )
+
+    def within(self, start: datetime, end: datetime) -> bool:
+        return (start is None or self.first >= start) and (
+            end is None or self.last < end
+        )
+
+
+def _in_range(created_at: datetime, start: datetime, end: datetime) -> bool:
+    return (start is None or created_at >= start) and (end is None or created_at < end)
+
+
+# Moves old broadcast tasks and their results out of the hot tables into
+# gzipped CSV chunks, and streams exports that span both.
+class ResultArchiver:
+    def __init__(self, directory: str = ARCHIVE_DIR):
+        self.directory = directory
+        self._task = None
+
+    def _path(self, chunk_name: str, table: str) -> str:
+        return os.path.join(self.directory, f"{chunk_name}.{table}.csv.gz")
+
+    def chunks(self) -> list:
+        if not os.path.isdir(self.directory):
+            return []
+        names = {
+            filename.split(".", 1)[0]
+            for filename in os.listdir(self.directory)
+            if filename.endswith(".tasks.csv.gz")
+        }
+        return sorted(
+            (ArchiveChunk(name) for name in names), key=lambda c: (c.first, c.first_id)
+        )
+
+    @staticmethod
+    def _protected_boundary(db: Session):
+        # The newest tasks may still sit in a worker's result cache and take
+        # answers, so the last RESULT_TASK_CACHE_SIZE of them always stay.
+        return (
+            db.query(BroadcastTaskModel.created_at, BroadcastTaskModel.id)
+            .filter(BroadcastTaskModel.created_at.isnot(None))
+            .order_by(
+                BroadcastTaskModel.created_at.desc(), BroadcastTaskModel.id.desc()
+            )
+            .offset(RESULT_TASK_CACHE_SIZE - 1)
+            .limit(1)
+            .first()
+        )
+
+    def archive_chunk(self, db: Session, cutoff: datetime) -> int:
+        boundary = self._protected_boundary(db)
+        if boundary is None:
+            return 0
+        tasks_table = BroadcastTaskModel
+        # Row locks keep late results of these tasks out until the chunk is
+        # gone; writers of newer tasks are never blocked.
+        tasks = (
+            db.query(tasks_table)
+            .filter(
+                tasks_table.created_at < cutoff,
+                or_(
+                    tasks_table.created_at < boundary.created_at,
+                    and_(
+                        tasks_table.created_at == boundary.created_at,
+                        tasks_table.id < boundary.id,
+                    ),
+                ),
+            )
+            .order_by(tasks_table.created_at, tasks_table.id)
+            .limit(ARCHIVE_CHUNK_SIZE)
+            .with_for_update()
+            .all()
+        )
+        if not tasks:
+            return 0
+
+        task_ids = [task.id for task in tasks]
+        results = (
+            db.query(BroadcastTaskResultModel)
+            .filter(BroadcastTaskResultModel.broadcast_task_id.in_(task_ids))
+            .order_by(
+                BroadcastTaskResultModel.broadcast_task_id, BroadcastTaskResultModel.id
+            )
+            .all()
+        )
+
+        chunk_name = "_".join(
+            (
+                tasks[0].created_at.strftime(STAMP_FORMAT),
+                tasks[-1].created_at.strftime(STAMP_FORMAT),
+                str(tasks[0].id),
+            )
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        # Left by a run that wrote its files but failed to delete the rows;
+        # this chunk starts at the same task and replaces it.
+        for stale in self.chunks():
+            if stale.first_id == tasks[0].id and stale.name != chunk_name:
+                for table in ("tasks", "results"):
+                    os.remove(self._path(stale.name, table))
+        # Results first: a chunk counts as archived once its tasks file exists.
+        _write_csv_gz(self._path(chunk_name, "results"), RESULT_COLUMNS, results)
+        _write_csv_gz(self._path(chunk_name, "tasks"), TASK_COLUMNS, tasks)
+
+        db.execute(
+            delete(BroadcastTaskResultModel).where(
+                BroadcastTaskResultModel.broadcast_task_id.in_(task_ids)
+            )
+        )
+        db.execute(delete(tasks_table).where(tasks_table.id.in_(task_ids)))
+        db.commit()
+        logger.info(
+            "chunk_archived", chunk=chunk_name, tasks=len(tasks), results=len(results)
+        )
+        return len(tasks)
+
+    def archive(self, older_than_days: float = RESULT_RETENTION_DAYS) -> dict:
+        # One short transaction per chunk, so writers of new results never
+        # wait on a long delete.
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        archived = {"tasks": 0, "chunks": 0}
+        while True:
+            with SessionLocal() as db:
+                count = self.archive_chunk(db, cutoff)
+            if not count:
+                return archived
+            archived["tasks"] += count
+            archived["chunks"] += 1
+
+    def _archived_rows(self, table: str, start: datetime, end: datetime):
+        for chunk in self.chunks():
+            if not chunk.overlaps(start, end):
+                continue
+            tasks_path = self._path(chunk.name, "tasks")
+            if chunk.within(start, end):
+                task_ids = None
+            else:
+                # Results are filtered by the broadcast time of their task.
+                created_at = TASK_COLUMNS.index("created_at")
+                task_ids = {
+                    row[0]
+                    for row in _read_csv_gz(tasks_path)
+                    if _in_range(datetime.fromisoformat(row[created_at]), start, end)
+                }
+            if table == "tasks":
+                rows = _read_csv_gz(tasks_path)
+            else:
+                rows = _read_csv_gz(self._path(chunk.name, "results"))
+            id_column = (
+                0 if table == "tasks" else RESULT_COLUMNS.index("broadcast_task_id")
+            )
+            for row in rows:
+                if task_ids is None or row[id_column] in task_ids:
+                    yield row
+
+    @staticmethod
+    def _hot_rows(table: str, start: datetime, end: datetime):
+        tasks = BroadcastTaskModel
+        criteria = [tasks.created_at.isnot(None)]
+        if start is not None:
+            criteria.append(tasks.created_at >= start)
+        if end is not None:
+            criteria.append(tasks.created_at < end)
+        if table == "tasks":
+            query = select(tasks).where(*criteria).order_by(tasks.created_at, tasks.id)
+            columns = TASK_COLUMNS
+        else:
+            results = BroadcastTaskResultModel
+            query = (
+                select(results)
+                .join(tasks, tasks.id == results.broadcast_task_id)
+                .where(*criteria)
+                .order_by(tasks.created_at, tasks.id, results.id)
+            )
+            columns = RESULT_COLUMNS
+        # Own session, as in the history stream: the request's one is closed
+        # before the response body is sent.
+        with SessionLocal() as db:
+            rows = db.execute(
+                query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+            ).scalars()
+            for row in rows:
+                yield _values(row, columns)
+
+    def export(
+        self, table: str = "results", start: datetime = None, end: datetime = None
+    ):
+        # CSV of rows whose task was broadcast in [start, end): archived
+        # chunks first, oldest first, then the hot tables.
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(TASK_COLUMNS if table == "tasks" else RESULT_COLUMNS)
+        count = 0
+        for source in (self._archived_rows, self._hot_rows):
+            for row in source(table, start, end):
+                writer.writerow(row)
+                count += 1
+                if count % EXPORT_BATCH_SIZE == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+        yield buffer.getvalue()
+
+    async def _run(self, interval: float):
+        while True:
+            try:
+                await asyncio.to_thread(self.archive)
+            except Exception:
+                logger.exception("archive_failed")
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float):
+        self.stop()
+        self._task = asyncio.get_running_loop().create_task(self._run(interval))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,39 @@
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TASK_STREAM_KEEPALIVE_SECONDS = float(os.getenv("TASK_STREAM_KEEPALIVE_SECONDS", 15))
+
+
+class TaskBroadcaster:
+    def __init__(self):
+        self.subscribers = {}
+        self.loop = None
+
+    def subscribe(self, username: str) -> asyncio.Queue:
+        self.loop = asyncio.get_running_loop()
+        # Only the latest task matters, so each miner holds at most one.
+        queue = asyncio.Queue(maxsize=1)
+        self.subscribers[queue] = username
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.pop(queue, None)
+
+    def publish(self, task: dict):
+        if not self.subscribers or self.loop is None:
+            return
+        # May be called from a worker thread, queues belong to the event loop.
+        self.loop.call_soon_threadsafe(self._fan_out, task)
+
+    def _fan_out(self, task: dict):
+        for queue in list(self.subscribers):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(task)
+
+    def connected_users(self) -> int:
+        return len(set(self.subscribers.values()))
@@ -0,0 +1,29 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class Settings:
+    # Values used on every request, read from the environment once at startup.
+    def __init__(self):
+        self.admin_username = os.getenv("ADMIN_USERNAME")
+        self.admin_password = os.getenv("ADMIN_PASSWORD")
+        self.jwt_secret_key = os.getenv("JWT_SECRET_KEY")
+        self.jwt_algorithm = os.getenv("JWT_ALGORITHM", "HS256")
+        self.jwt_expire_minutes = int(os.getenv("JWT_EXPIRE_MINUTES", 30))
+        self.token_cache_size = int(os.getenv("TOKEN_CACHE_SIZE", 100000))
+        self.lockout_minutes = int(os.getenv("LOCKOUT_MINUTES", 5))
+        self.failed_attempt_limit = int(os.getenv("FAILED_ATTEMPT_LIMIT", 5))
+        # Requests per minute, 0 disables the limit.
+        self.login_rate_limit = int(os.getenv("LOGIN_RATE_LIMIT", 60))
+        self.task_rate_limit = int(os.getenv("TASK_RATE_LIMIT", 600))
+        self.send_rate_limit = int(os.getenv("SEND_RATE_LIMIT", 120))
+        self.rate_limit_backend = os.getenv("RATE_LIMIT_BACKEND", "memory")
+        self.rate_limit_max_keys = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+        self.server_host = os.getenv("SERVER_HOST", "0.0.0.0")
+        self.server_port = int(os.getenv("SERVER_PORT", 8080))
+
+
+settings = Settings()
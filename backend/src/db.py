@@ -1,18 +1,165 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
 import os
+import threading
+import time
+
+from metrics import observe
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DB_URL")
 
-engine = create_engine(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+
+# Upserts use the ON CONFLICT insert of these dialects (see dialect_insert).
+SUPPORTED_DIALECTS = ("postgresql", "sqlite")
+
+
+class PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections_created = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self.lock:
+            self.waits += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    # Measures how long requests wait for a free connection.
+    def _do_get(self):
+        # With an idle connection or overflow room left the checkout does
+        # not block, so it is not counted as a wait.
+        if (
+            self.checkedin()
+            or self._max_overflow < 0
+            or self.overflow() < self._max_overflow
+        ):
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        waited = time.perf_counter() - start
+        pool_stats.record_wait(waited)
+        observe("db_pool_wait", waited)
+        return connection
+
+
+def _engine_options(url):
+    if url.get_backend_name() not in SUPPORTED_DIALECTS:
+        raise ValueError(
+            f"Unsupported DB_URL database '{url.get_backend_name()}'; "
+            f"use one of: {', '.join(SUPPORTED_DIALECTS)}"
+        )
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if url.get_backend_name() == "postgresql":
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+        if DB_STATEMENT_TIMEOUT_MS:
+            options["connect_args"] = {
+                "options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+            }
+    return options
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(make_url(DATABASE_URL)))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 
+@event.listens_for(engine, "connect")
+def _count_connect(dbapi_connection, connection_record):
+    with pool_stats.lock:
+        pool_stats.connections_created += 1
+
+
+@event.listens_for(engine, "checkout")
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    with pool_stats.lock:
+        pool_stats.checkouts += 1
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _start_query_timer(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _stop_query_timer(connection, cursor, statement, parameters, context, executemany):
+    observe("db_query", time.perf_counter() - connection.info["query_started"].pop())
+
+
+@event.listens_for(engine, "handle_error")
+def _drop_query_timer(context):
+    # Failed statements never reach after_cursor_execute.
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
+
+
+def get_pool_stats() -> dict:
+    pool = engine.pool
+    stats = {
+        "pool": type(pool).__name__,
+        "connections_created": pool_stats.connections_created,
+        "checkouts": pool_stats.checkouts,
+    }
+    if isinstance(pool, QueuePool):
+        stats.update(
+            {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "max_overflow": DB_MAX_OVERFLOW,
+                "waits": pool_stats.waits,
+                "wait_seconds_total": round(pool_stats.wait_seconds_total, 6),
+                "wait_seconds_max": round(pool_stats.wait_seconds_max, 6),
+                "timeouts": pool_stats.timeouts,
+            }
+        )
+    return stats
+
+
+def dialect_insert(model):
+    # INSERT supporting on_conflict_do_nothing / on_conflict_do_update; the
+    # dialect was checked against SUPPORTED_DIALECTS when the engine was made.
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
 def get_db():
     db = SessionLocal()
     try:
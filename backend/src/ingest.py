@@ -0,0 +1,256 @@
+import asyncio
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, update
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from cache import LRUCache
+from db import SessionLocal, dialect_insert
+from logs import get_logger
+from models import BroadcastTaskModel, BroadcastTaskResultModel
+
+load_dotenv()
+
+logger = get_logger("ingest")
+
+RESULT_BATCH_SIZE = int(os.getenv("RESULT_BATCH_SIZE", 500))
+RESULT_FLUSH_INTERVAL_SECONDS = float(os.getenv("RESULT_FLUSH_INTERVAL_SECONDS", 1))
+RESULT_TASK_CACHE_SIZE = int(os.getenv("RESULT_TASK_CACHE_SIZE", 64))
+# Failed batch writes before the rows are retried one by one and the ones
+# the database still rejects are dropped.
+RESULT_FLUSH_MAX_ATTEMPTS = int(os.getenv("RESULT_FLUSH_MAX_ATTEMPTS", 3))
+# Accepted results waiting for the database; past this, submissions are
+# refused until writes succeed again.
+RESULT_MAX_PENDING = int(os.getenv("RESULT_MAX_PENDING", 100000))
+
+
+class TaskResultState:
+    def __init__(self, expected_result: float, usernames: set):
+        self.expected_result = expected_result
+        self.usernames = usernames
+
+
+class ResultIngestor:
+    def __init__(self, leaderboard=None):
+        self.leaderboard = leaderboard
+        self.tasks = LRUCache(RESULT_TASK_CACHE_SIZE)
+        self.pending = []
+        # Rows taken by the flush in progress, still visible to duplicate checks.
+        self.writing = []
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.flusher = None
+
+    def _load_task_state(self, task_id: int, db: Session):
+        task = (
+            db.query(BroadcastTaskModel.expected_result)
+            .filter(
+                BroadcastTaskModel.id == task_id,
+                BroadcastTaskModel.created_at.isnot(None),
+            )
+            .first()
+        )
+        if not task:
+            return None
+
+        usernames = {
+            username
+            for (username,) in db.query(BroadcastTaskResultModel.username).filter(
+                BroadcastTaskResultModel.broadcast_task_id == task_id
+            )
+        }
+        return TaskResultState(task.expected_result, usernames)
+
+    def submit(self, task_id: int, result: float, username: str, db: Session = None):
+        with self.lock:
+            state = self.tasks.get(task_id)
+        if state is None:
+            # Loaded outside the lock, so a cache miss does not hold up every
+            # other submitter for a query.
+            if db is None:
+                with SessionLocal() as db:
+                    state = self._load_task_state(task_id, db)
+            else:
+                state = self._load_task_state(task_id, db)
+            if state is None:
+                return {"status": "Task not found"}
+
+        with self.lock:
+            cached = self.tasks.get(task_id)
+            if cached is not None:
+                state = cached
+            else:
+                # Rows of an evicted task may still be waiting for a flush. A
+                # submission racing the commit can slip past this check; the
+                # unique constraint then keeps only the first one.
+                state.usernames.update(
+                    row["username"]
+                    for row in self.pending + self.writing
+                    if row["broadcast_task_id"] == task_id
+                )
+                self.tasks.put(task_id, state)
+
+            if len(self.pending) >= RESULT_MAX_PENDING:
+                return {"status": "Result queue full"}
+            if username in state.usernames:
+                return {"status": "Task already submitted"}
+
+            is_correct = abs(result - state.expected_result) < 0.0001
+            state.usernames.add(username)
+            self.pending.append(
+                {
+                    "broadcast_task_id": task_id,
+                    "username": username,
+                    "answer": result,
+                    "is_correct": is_correct,
+                    "submitted_at": datetime.utcnow(),
+                }
+            )
+            flush_now = len(self.pending) >= RESULT_BATCH_SIZE
+
+        if flush_now:
+            try:
+                self.flush()
+            except Exception:
+                # The result is buffered either way; the next flush retries.
+                logger.exception("result_flush_failed")
+
+        return {
+            "status": "Result submitted successfully",
+            "is_correct": is_correct,
+            "task_id": task_id,
+        }
+
+    def _requeue(self, rows: list):
+        with self.lock:
+            self.pending[:0] = rows
+
+    def _commit(self, rows: list) -> int:
+        with SessionLocal() as db:
+            miner_stats = self._write(rows, db)
+            db.commit()
+        if miner_stats:
+            self.leaderboard.apply(miner_stats)
+        return len(rows)
+
+    def _commit_one_by_one(self, rows: list) -> int:
+        # Isolates the rows that fail the whole batch, e.g. a result for a
+        # task archived since it was accepted. Other errors (database down)
+        # keep the remaining rows for the next flush.
+        written = 0
+        for position, row in enumerate(rows):
+            try:
+                written += self._commit([row])
+            except (IntegrityError, DataError) as e:
+                self.dropped += 1
+                logger.error(
+                    "result_dropped",
+                    task_id=row["broadcast_task_id"],
+                    username=row["username"],
+                    answer=row["answer"],
+                    is_correct=row["is_correct"],
+                    submitted_at=row["submitted_at"].isoformat(),
+                    error=str(e.orig),
+                )
+            except Exception:
+                self._requeue(rows[position:])
+                raise
+        return written
+
+    def flush(self) -> int:
+        with self.flush_lock:
+            with self.lock:
+                rows, self.pending = self.pending, []
+                self.writing = rows
+            if not rows:
+                return 0
+
+            try:
+                written = self._commit(rows)
+            except Exception:
+                self.failed_flushes += 1
+                if self.failed_flushes < RESULT_FLUSH_MAX_ATTEMPTS:
+                    self._requeue(rows)
+                    raise
+                logger.exception("result_batch_failed", rows=len(rows))
+                self.failed_flushes = 0
+                written = self._commit_one_by_one(rows)
+            else:
+                self.failed_flushes = 0
+            finally:
+                with self.lock:
+                    self.writing = []
+            return written
+
+    def _write(self, rows: list, db: Session):
+        results = BroadcastTaskResultModel
+        # The unique (broadcast_task_id, username) constraint keeps results
+        # correct even when another worker accepted the same submission;
+        # RETURNING only reports the rows that were really inserted, in
+        # submission order so miner streaks come out right.
+        inserted = db.execute(
+            dialect_insert(results)
+            .on_conflict_do_nothing(index_elements=["broadcast_task_id", "username"])
+            .returning(
+                results.broadcast_task_id,
+                results.username,
+                results.is_correct,
+                results.submitted_at,
+                sort_by_parameter_order=True,
+            ),
+            rows,
+        ).all()
+
+        counts = defaultdict(lambda: [0, 0])
+        for task_id, _, is_correct, _ in inserted:
+            counts[task_id][0] += 1
+            counts[task_id][1] += 1 if is_correct else 0
+        if not counts:
+            return None
+
+        tasks = BroadcastTaskModel.__table__
+        db.execute(
+            update(tasks)
+            .where(tasks.c.id == bindparam("task_id"))
+            .values(
+                total_submissions=tasks.c.total_submissions + bindparam("total"),
+                correct_count=tasks.c.correct_count + bindparam("correct"),
+                incorrect_count=tasks.c.incorrect_count + bindparam("incorrect"),
+            ),
+            [
+                {
+                    "task_id": task_id,
+                    "total": total,
+                    "correct": correct,
+                    "incorrect": total - correct,
+                }
+                for task_id, (total, correct) in counts.items()
+            ],
+        )
+        if self.leaderboard is not None:
+            return self.leaderboard.record(inserted, db)
+        return None
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(RESULT_FLUSH_INTERVAL_SECONDS)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.exception("result_flush_failed")
+
+    def start(self):
+        self.flusher = asyncio.get_running_loop().create_task(self._run_flusher())
+
+    def stop(self):
+        if self.flusher:
+            self.flusher.cancel()
+            self.flusher = None
+        self.flush()
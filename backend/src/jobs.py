@@ -0,0 +1,495 @@
+import hashlib
+import json
+import math
+import os
+import random
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from logs import get_logger
+from models import JobModel, WorkUnitModel
+
+load_dotenv()
+
+logger = get_logger("jobs")
+
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 120))
+JOB_MAX_UNITS = int(os.getenv("JOB_MAX_UNITS", 100000))
+# Nonces the server rehashes to check a "none in this slice" answer.
+JOB_NONCE_SPOT_CHECK = int(os.getenv("JOB_NONCE_SPOT_CHECK", 1024))
+JOB_INSERT_BATCH = 1000
+JOB_LEASE_RETRIES = 5
+JOB_KINDS = ("operand_range", "nonce_search")
+NONCE_MAX_DIFFICULTY = 16
+
+OPERATIONS = ("+", "-", "*", "/")
+
+
+def _int_sum(start: int, end: int) -> int:
+    # Sum of the integers in [start, end).
+    return (start + end - 1) * (end - start) // 2
+
+
+def _matches(a: float, b: float) -> bool:
+    # Unit results are sums over many pairs, so the tolerance grows with them.
+    return abs(a - b) < max(0.0001, abs(b) * 1e-9)
+
+
+def nonce_hash(prefix: str, nonce: int) -> str:
+    return hashlib.sha256(f"{prefix}{nonce}".encode()).hexdigest()
+
+
+def _spot_check_finds_nonce(params: dict) -> bool:
+    # Rehashes a random window of the slice (all of it when it is small);
+    # a miner that skips slices is caught whenever the window holds a nonce.
+    start, end = params["nonce_start"], params["nonce_end"]
+    size = min(JOB_NONCE_SPOT_CHECK, end - start)
+    first = random.randrange(start, end - size + 1)
+    zeros = "0" * params["difficulty"]
+    return any(
+        nonce_hash(params["prefix"], nonce).startswith(zeros)
+        for nonce in range(first, first + size)
+    )
+
+
+def _require_int(params: dict, name: str) -> int:
+    value = params.get(name)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f"{name} must be an integer")
+    return value
+
+
+def _split(start: int, end: int, unit_size: int):
+    if end <= start:
+        raise ValueError("Range end must be greater than its start")
+    units = math.ceil((end - start) / unit_size)
+    if units > JOB_MAX_UNITS:
+        raise ValueError(
+            f"Job would have {units} work units, at most {JOB_MAX_UNITS} allowed"
+        )
+    return [(s, min(s + unit_size, end)) for s in range(start, end, unit_size)]
+
+
+def _operand_range_units(params: dict, unit_size: int) -> list:
+    # Each unit covers a slice of a values against the whole b range; the
+    # miner answers with the sum of a <operation> b over its slice.
+    operation = params.get("operation")
+    if operation not in OPERATIONS:
+        raise ValueError(f"operation must be one of {', '.join(OPERATIONS)}")
+    a_start, a_end = _require_int(params, "a_start"), _require_int(params, "a_end")
+    b_start, b_end = _require_int(params, "b_start"), _require_int(params, "b_end")
+    if b_end <= b_start:
+        raise ValueError("Range end must be greater than its start")
+    if operation == "/" and b_start <= 0 < b_end:
+        raise ValueError("The b range must not contain 0 for division")
+
+    b_count = b_end - b_start
+    b_sum = _int_sum(b_start, b_end)
+    if operation == "/":
+        b_reciprocals = math.fsum(1 / b for b in range(b_start, b_end))
+
+    units = []
+    for start, end in _split(a_start, a_end, unit_size):
+        # Closed forms, so splitting costs nothing per pair.
+        a_count, a_sum = end - start, _int_sum(start, end)
+        if operation == "+":
+            expected = b_count * a_sum + a_count * b_sum
+        elif operation == "-":
+            expected = b_count * a_sum - a_count * b_sum
+        elif operation == "*":
+            expected = a_sum * b_sum
+        else:
+            expected = a_sum * b_reciprocals
+        units.append(
+            (
+                {
+                    "operation": operation,
+                    "a_start": start,
+                    "a_end": end,
+                    "b_start": b_start,
+                    "b_end": b_end,
+                },
+                float(expected),
+            )
+        )
+    return units
+
+
+def _nonce_search_units(params: dict, unit_size: int) -> list:
+    # The miner answers with a nonce in its slice whose hash starts with
+    # `difficulty` zeros, or -1 when the slice has none.
+    prefix = params.get("prefix")
+    if not isinstance(prefix, str):
+        raise ValueError("prefix must be a string")
+    difficulty = _require_int(params, "difficulty")
+    if not 1 <= difficulty <= NONCE_MAX_DIFFICULTY:
+        raise ValueError(f"difficulty must be between 1 and {NONCE_MAX_DIFFICULTY}")
+    nonce_start, nonce_end = _require_int(params, "nonce_start"), _require_int(
+        params, "nonce_end"
+    )
+
+    return [
+        (
+            {
+                "prefix": prefix,
+                "difficulty": difficulty,
+                "nonce_start": start,
+                "nonce_end": end,
+            },
+            None,
+        )
+        for start, end in _split(nonce_start, nonce_end, unit_size)
+    ]
+
+
+def describe_unit(kind: str, params: dict) -> str:
+    if kind == "operand_range":
+        return (
+            f"sum of a {params['operation']} b for a in [{params['a_start']}, {params['a_end']})"
+            f" and b in [{params['b_start']}, {params['b_end']})"
+        )
+    return (
+        f"find n in [{params['nonce_start']}, {params['nonce_end']}) where"
+        f" sha256('{params['prefix']}' + n) starts with {params['difficulty']} zeros, or -1"
+    )
+
+
+# Splits large jobs into work units and leases each unit to a single miner,
+# so adding miners adds throughput instead of duplicate answers.
+class JobManager:
+    def __init__(self):
+        # job id -> kind; jobs never change kind.
+        self.job_kinds = {}
+
+    @staticmethod
+    def _session(db: Session):
+        # Callers passing their own session keep it open.
+        return SessionLocal() if db is None else nullcontext(db)
+
+    def create_job(
+        self,
+        db: Session,
+        name: str,
+        kind: str,
+        params: dict,
+        unit_size: int,
+        lease_seconds: int = None,
+    ) -> dict:
+        if kind not in JOB_KINDS:
+            raise ValueError(f"kind must be one of {', '.join(JOB_KINDS)}")
+        if unit_size < 1:
+            raise ValueError("unit_size must be positive")
+        # None takes JOB_LEASE_SECONDS; a lease that expires at once never completes.
+        if lease_seconds is not None and lease_seconds < 1:
+            raise ValueError("lease_seconds must be positive")
+        if kind == "operand_range":
+            units = _operand_range_units(params, unit_size)
+        else:
+            units = _nonce_search_units(params, unit_size)
+
+        job = JobModel(
+            name=name,
+            kind=kind,
+            params=json.dumps(params),
+            status="running",
+            lease_seconds=(
+                lease_seconds if lease_seconds is not None else JOB_LEASE_SECONDS
+            ),
+            total_units=len(units),
+        )
+        db.add(job)
+        db.flush()
+        rows = [
+            {
+                "job_id": job.id,
+                "params": json.dumps(unit_params),
+                "expected_result": expected,
+                "status": "pending",
+            }
+            for unit_params, expected in units
+        ]
+        for start in range(0, len(rows), JOB_INSERT_BATCH):
+            db.execute(
+                insert(WorkUnitModel.__table__), rows[start : start + JOB_INSERT_BATCH]
+            )
+        db.commit()
+        db.refresh(job)
+        self.job_kinds[job.id] = kind
+        logger.info("job_created", job_id=job.id, kind=kind, units=len(units))
+        return self._job_summary(job)
+
+    def _kind(self, db: Session, job_id: int) -> str:
+        kind = self.job_kinds.get(job_id)
+        if kind is None:
+            kind = db.query(JobModel.kind).filter(JobModel.id == job_id).scalar()
+            self.job_kinds[job_id] = kind
+        return kind
+
+    def _unit_payload(self, db: Session, unit: WorkUnitModel) -> dict:
+        kind = self._kind(db, unit.job_id)
+        params = json.loads(unit.params)
+        return {
+            "kind": "work_unit",
+            "task_id": unit.id,
+            "job_id": unit.job_id,
+            "job_kind": kind,
+            "content": describe_unit(kind, params),
+            "params": params,
+            "lease_expires_at": unit.lease_expires_at.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    def lease(self, username: str, db: Session = None):
+        # Returns the unit already leased to the miner, or leases the oldest
+        # pending or expired one; None when there is no work.
+        with self._session(db) as db:
+            now = datetime.utcnow()
+            held = (
+                db.query(WorkUnitModel)
+                .filter(
+                    WorkUnitModel.leased_to == username,
+                    WorkUnitModel.status == "leased",
+                    WorkUnitModel.lease_expires_at > now,
+                )
+                .first()
+            )
+            if held is not None:
+                return self._unit_payload(db, held)
+
+            available = or_(
+                WorkUnitModel.status == "pending",
+                and_(
+                    WorkUnitModel.status == "leased",
+                    WorkUnitModel.lease_expires_at <= now,
+                ),
+            )
+            for _ in range(JOB_LEASE_RETRIES):
+                # SKIP LOCKED spreads concurrent miners over different units;
+                # the guarded UPDATE covers databases without it.
+                candidate = db.execute(
+                    select(WorkUnitModel.id, JobModel.lease_seconds)
+                    .join(JobModel, JobModel.id == WorkUnitModel.job_id)
+                    .where(available)
+                    .order_by(WorkUnitModel.id)
+                    .limit(1)
+                    .with_for_update(skip_locked=True, of=WorkUnitModel)
+                ).first()
+                if candidate is None:
+                    db.commit()
+                    return None
+
+                unit_id, lease_seconds = candidate
+                leased = db.execute(
+                    update(WorkUnitModel)
+                    .where(WorkUnitModel.id == unit_id, available)
+                    .values(
+                        status="leased",
+                        leased_to=username,
+                        lease_expires_at=now + timedelta(seconds=lease_seconds),
+                        attempts=WorkUnitModel.attempts + 1,
+                    )
+                )
+                db.commit()
+                if leased.rowcount:
+                    unit = db.get(WorkUnitModel, unit_id)
+                    return self._unit_payload(db, unit)
+            return None
+
+    def _verify(self, kind: str, unit: WorkUnitModel, result: float) -> bool:
+        if kind == "operand_range":
+            return _matches(result, unit.expected_result)
+
+        # A claimed nonce costs one hash to check; "none in this slice" is
+        # only spot-checked, which is why exhausted jobs end "unverified".
+        params = json.loads(unit.params)
+        if result == -1:
+            return not _spot_check_finds_nonce(params)
+        nonce = int(result)
+        return params["nonce_start"] <= nonce < params["nonce_end"] and nonce_hash(
+            params["prefix"], nonce
+        ).startswith("0" * params["difficulty"])
+
+    def submit(
+        self, unit_id: int, result: float, username: str, db: Session = None
+    ) -> dict:
+        # nan and inf are never an answer and would break the nonce check.
+        if not math.isfinite(result):
+            return {"status": "Invalid result"}
+        with self._session(db) as db:
+            unit = (
+                db.query(WorkUnitModel)
+                .filter(WorkUnitModel.id == unit_id)
+                .with_for_update()
+                .first()
+            )
+            if unit is None:
+                return {"status": "Work unit not found"}
+            if unit.status == "done":
+                db.rollback()
+                return {"status": "Work unit already completed"}
+            if unit.status == "cancelled":
+                db.rollback()
+                return {"status": "Job is not running"}
+            if unit.status != "leased" or unit.leased_to != username:
+                db.rollback()
+                return {"status": "Lease not held"}
+
+            kind = self._kind(db, unit.job_id)
+            if kind == "nonce_search" and result != int(result):
+                db.rollback()
+                return {"status": "Invalid result"}
+            jobs = JobModel.__table__
+            if not self._verify(kind, unit, result):
+                # Back to the pool for another miner.
+                unit.status = "pending"
+                unit.leased_to = None
+                unit.lease_expires_at = None
+                db.execute(
+                    update(jobs)
+                    .where(jobs.c.id == unit.job_id)
+                    .values(rejected_results=jobs.c.rejected_results + 1)
+                )
+                db.commit()
+                return {
+                    "status": "Result rejected",
+                    "is_correct": False,
+                    "task_id": unit_id,
+                }
+
+            now = datetime.utcnow()
+            unit.status = "done"
+            unit.result = result
+            unit.completed_by = username
+            unit.completed_at = now
+            values = {"completed_units": jobs.c.completed_units + 1}
+            solved = kind == "nonce_search" and result != -1
+            if kind == "operand_range":
+                values["result"] = func.coalesce(jobs.c.result, 0) + result
+            elif solved:
+                values.update(result=result, status="completed", completed_at=now)
+            completed, total = db.execute(
+                update(jobs)
+                .where(jobs.c.id == unit.job_id)
+                .values(**values)
+                .returning(jobs.c.completed_units, jobs.c.total_units)
+            ).one()
+            if solved:
+                self._cancel_units(db, unit.job_id)
+            elif completed >= total:
+                # A nonce search that ran out of slices rests on -1 answers
+                # the server could not fully check.
+                status = "unverified" if kind == "nonce_search" else "completed"
+                db.execute(
+                    update(jobs)
+                    .where(jobs.c.id == unit.job_id, jobs.c.status == "running")
+                    .values(status=status, completed_at=now)
+                )
+            db.commit()
+
+            if solved or completed >= total:
+                logger.info(
+                    "job_completed",
+                    job_id=unit.job_id,
+                    solved_by=username if solved else None,
+                )
+            return {
+                "status": "Result submitted successfully",
+                "is_correct": True,
+                "task_id": unit_id,
+                "job_id": unit.job_id,
+            }
+
+    @staticmethod
+    def _cancel_units(db: Session, job_id: int):
+        db.execute(
+            update(WorkUnitModel)
+            .where(
+                WorkUnitModel.job_id == job_id,
+                WorkUnitModel.status.in_(("pending", "leased")),
+            )
+            .values(status="cancelled", leased_to=None, lease_expires_at=None)
+        )
+
+    def cancel_job(self, db: Session, job_id: int):
+        job = db.get(JobModel, job_id)
+        if job is None:
+            return None
+        if job.status == "running":
+            job.status = "cancelled"
+            job.completed_at = datetime.utcnow()
+            self._cancel_units(db, job_id)
+            db.commit()
+        return self._job_summary(job)
+
+    @staticmethod
+    def _job_summary(job: JobModel) -> dict:
+        return {
+            "id": job.id,
+            "name": job.name,
+            "kind": job.kind,
+            "status": job.status,
+            "total_units": job.total_units,
+            "completed_units": job.completed_units,
+            "progress": (
+                round(job.completed_units / job.total_units, 4)
+                if job.total_units
+                else 1.0
+            ),
+            "rejected_results": job.rejected_results,
+            "result": job.result,
+            "created_at": job.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "completed_at": (
+                job.completed_at.strftime("%Y-%m-%d %H:%M:%S")
+                if job.completed_at
+                else None
+            ),
+        }
+
+    def list_jobs(self, db: Session) -> list:
+        return [
+            self._job_summary(job)
+            for job in db.query(JobModel).order_by(JobModel.id.desc())
+        ]
+
+    def job_progress(self, db: Session, job_id: int):
+        job = db.get(JobModel, job_id)
+        if job is None:
+            return None
+
+        now = datetime.utcnow()
+        counts = dict.fromkeys(("pending", "leased", "expired", "done", "cancelled"), 0)
+        rows = (
+            db.query(
+                WorkUnitModel.status,
+                WorkUnitModel.lease_expires_at <= now,
+                func.count(WorkUnitModel.id),
+            )
+            .filter(WorkUnitModel.job_id == job_id)
+            .group_by(WorkUnitModel.status, WorkUnitModel.lease_expires_at <= now)
+        )
+        for status, expired, count in rows:
+            counts["expired" if status == "leased" and expired else status] += count
+        miners = (
+            db.query(WorkUnitModel.completed_by, func.count(WorkUnitModel.id))
+            .filter(WorkUnitModel.job_id == job_id, WorkUnitModel.status == "done")
+            .group_by(WorkUnitModel.completed_by)
+            .all()
+        )
+
+        summary = self._job_summary(job)
+        elapsed = ((job.completed_at or now) - job.created_at).total_seconds()
+        rate = job.completed_units / elapsed if elapsed > 0 else None
+        summary.update(
+            {
+                "units": counts,
+                "miners": len(miners),
+                "units_by_miner": dict(miners),
+                "elapsed_seconds": round(elapsed, 3),
+                "units_per_second": round(rate, 3) if rate is not None else None,
+            }
+        )
+        return summary
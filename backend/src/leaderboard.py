@@ -0,0 +1,266 @@
+import bisect
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from db import SessionLocal, dialect_insert
+from models import BroadcastTaskModel, BroadcastTaskResultModel, MinerStatsModel
+
+load_dotenv()
+
+# With several workers each one only sees the miners it ingested results
+# for; this re-reads miner_stats (not the results) when a read finds the
+# index older than that. 0 never reloads, fine for a single worker.
+LEADERBOARD_RELOAD_SECONDS = float(os.getenv("LEADERBOARD_RELOAD_SECONDS", 0))
+
+STATS_COLUMNS = (
+    "submissions",
+    "correct",
+    "latency_seconds_total",
+    "latency_samples",
+    "current_streak",
+    "best_streak",
+    "last_submitted_at",
+)
+# Best first: higher counts and accuracy, lower latency.
+SORT_ORDERS = ("correct", "accuracy", "submissions", "avg_latency", "best_streak")
+LEADERBOARD_MAX_LIMIT = 1000
+BACKFILL_BATCH_SIZE = 1000
+
+
+class MinerStats:
+    __slots__ = ("username",) + STATS_COLUMNS
+
+    def __init__(self, username: str, **values):
+        self.username = username
+        for column in STATS_COLUMNS:
+            default = None if column == "last_submitted_at" else 0
+            setattr(self, column, values.get(column) or default)
+
+    @classmethod
+    def from_row(cls, row: MinerStatsModel):
+        return cls(
+            row.username, **{column: getattr(row, column) for column in STATS_COLUMNS}
+        )
+
+    def add(self, is_correct: bool, latency: float, submitted_at):
+        self.submissions += 1
+        if is_correct:
+            self.correct += 1
+            self.current_streak += 1
+            self.best_streak = max(self.best_streak, self.current_streak)
+        else:
+            self.current_streak = 0
+        if latency is not None:
+            self.latency_seconds_total += latency
+            self.latency_samples += 1
+        self.last_submitted_at = submitted_at
+
+    @property
+    def accuracy(self) -> float:
+        return self.correct / self.submissions if self.submissions else 0.0
+
+    @property
+    def avg_latency(self):
+        if not self.latency_samples:
+            return None
+        return self.latency_seconds_total / self.latency_samples
+
+    def sort_key(self, order: str) -> tuple:
+        # Ascending index, so "better" sorts first.
+        if order == "correct":
+            return (-self.correct, -self.accuracy)
+        if order == "accuracy":
+            return (-self.accuracy, -self.correct)
+        if order == "submissions":
+            return (-self.submissions,)
+        if order == "best_streak":
+            return (-self.best_streak, -self.current_streak)
+        # Miners without a measured answer go last.
+        latency = self.avg_latency
+        return (latency is None, latency or 0.0)
+
+    def to_row(self) -> dict:
+        row = {column: getattr(self, column) for column in STATS_COLUMNS}
+        row["username"] = self.username
+        return row
+
+    def to_dict(self) -> dict:
+        latency = self.avg_latency
+        return {
+            "username": self.username,
+            "submissions": self.submissions,
+            "correct": self.correct,
+            "incorrect": self.submissions - self.correct,
+            "accuracy": round(self.accuracy, 4),
+            "avg_latency_seconds": round(latency, 3) if latency is not None else None,
+            "current_streak": self.current_streak,
+            "best_streak": self.best_streak,
+            "last_submitted_at": (
+                self.last_submitted_at.strftime("%Y-%m-%d %H:%M:%S")
+                if self.last_submitted_at
+                else None
+            ),
+        }
+
+
+# Per-miner stats kept in miner_stats and mirrored in memory, with one
+# sorted index per order so top-N reads never touch the database.
+class Leaderboard:
+    def __init__(self):
+        self.stats = {}
+        self.keys = {}
+        self.indexes = {order: [] for order in SORT_ORDERS}
+        self.lock = threading.Lock()
+        self.loaded_at = time.monotonic()
+
+    def _index(self, stats: MinerStats):
+        # Keys are remembered rather than recomputed, so an entry changed
+        # in place can still be found at its old position.
+        old = self.keys.get(stats.username)
+        keys = {}
+        for order, index in self.indexes.items():
+            if old is not None:
+                del index[bisect.bisect_left(index, (old[order], stats.username))]
+            keys[order] = stats.sort_key(order)
+            bisect.insort(index, (keys[order], stats.username))
+        self.keys[stats.username] = keys
+        self.stats[stats.username] = stats
+
+    def apply(self, updated: list):
+        # Rows just written by this worker; they already include updates
+        # from other workers because they were read under a row lock.
+        with self.lock:
+            for stats in updated:
+                self._index(stats)
+
+    def load(self, db: Session):
+        stats = [MinerStats.from_row(row) for row in db.query(MinerStatsModel)]
+        keys = {
+            entry.username: {order: entry.sort_key(order) for order in SORT_ORDERS}
+            for entry in stats
+        }
+        indexes = {
+            order: sorted(
+                (keys[entry.username][order], entry.username) for entry in stats
+            )
+            for order in SORT_ORDERS
+        }
+        with self.lock:
+            self.stats = {entry.username: entry for entry in stats}
+            self.keys = keys
+            self.indexes = indexes
+            self.loaded_at = time.monotonic()
+
+    def stale(self) -> bool:
+        return bool(LEADERBOARD_RELOAD_SECONDS) and (
+            time.monotonic() - self.loaded_at >= LEADERBOARD_RELOAD_SECONDS
+        )
+
+    def reload(self):
+        with SessionLocal() as db:
+            self.load(db)
+
+    def top(self, order: str = "correct", limit: int = 10, worst: bool = False) -> list:
+        with self.lock:
+            index = self.indexes[order]
+            if worst:
+                positions = range(len(index) - 1, max(len(index) - 1 - limit, -1), -1)
+            else:
+                positions = range(min(limit, len(index)))
+            ranked = [
+                (position + 1, self.stats[index[position][1]]) for position in positions
+            ]
+        return [{"rank": rank, **stats.to_dict()} for rank, stats in ranked]
+
+    def get(self, username: str):
+        stats = self.stats.get(username)
+        return stats.to_dict() if stats else None
+
+    @staticmethod
+    def record(results: list, db: Session) -> list:
+        # results: (task_id, username, is_correct, submitted_at) in
+        # submission order, as inserted by the result ingestor.
+        task_ids = {task_id for task_id, _, _, _ in results}
+        created = dict(
+            db.query(BroadcastTaskModel.id, BroadcastTaskModel.created_at).filter(
+                BroadcastTaskModel.id.in_(task_ids)
+            )
+        )
+
+        usernames = sorted({username for _, username, _, _ in results})
+        # Rows exist before they are locked, so two workers counting a new
+        # miner's first answers cannot overwrite each other.
+        db.execute(
+            dialect_insert(MinerStatsModel).on_conflict_do_nothing(
+                index_elements=["username"]
+            ),
+            [{"username": username} for username in usernames],
+        )
+        stats = {
+            row.username: MinerStats.from_row(row)
+            for row in db.query(MinerStatsModel)
+            .filter(MinerStatsModel.username.in_(usernames))
+            .order_by(MinerStatsModel.username)
+            .with_for_update()
+        }
+
+        for task_id, username, is_correct, submitted_at in results:
+            created_at = created.get(task_id)
+            latency = (
+                (submitted_at - created_at).total_seconds() if created_at else None
+            )
+            stats[username].add(is_correct, latency, submitted_at)
+
+        insert = dialect_insert(MinerStatsModel)
+        db.execute(
+            insert.on_conflict_do_update(
+                index_elements=["username"],
+                set_={column: insert.excluded[column] for column in STATS_COLUMNS},
+            ),
+            [entry.to_row() for entry in stats.values()],
+        )
+        return list(stats.values())
+
+
+def backfill_miner_stats(db: Session) -> int:
+    # Rebuilds miner_stats from every stored result; a one-off scan for
+    # results recorded before the table existed. Results already moved to
+    # the archive are not read back, so their counts would be lost.
+    results = BroadcastTaskResultModel
+    rows = (
+        db.query(
+            results.username,
+            results.is_correct,
+            results.submitted_at,
+            BroadcastTaskModel.created_at,
+        )
+        .join(BroadcastTaskModel, BroadcastTaskModel.id == results.broadcast_task_id)
+        .order_by(results.username, results.submitted_at, results.id)
+        .yield_per(BACKFILL_BATCH_SIZE)
+    )
+    stats = {}
+    for username, is_correct, submitted_at, created_at in rows:
+        entry = stats.get(username)
+        if entry is None:
+            entry = stats[username] = MinerStats(username)
+        latency = (
+            (submitted_at - created_at).total_seconds()
+            if submitted_at and created_at
+            else None
+        )
+        entry.add(bool(is_correct), latency, submitted_at)
+
+    db.execute(delete(MinerStatsModel))
+    rows = [entry.to_row() for entry in stats.values()]
+    for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        db.execute(
+            MinerStatsModel.__table__.insert(),
+            rows[start : start + BACKFILL_BATCH_SIZE],
+        )
+    db.commit()
+    return len(rows)
@@ -1,20 +1,49 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Request, Query
 from fastapi.security import HTTPBearer
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import json
 import os
+from datetime import datetime, timezone
 from dotenv import load_dotenv
-from sqlalchemy import text
 from sqlalchemy.orm import Session
 from security import SecurityManager
-from session import SessionManager
-from message import MessageManager
-from db import get_db, Base, engine, SessionLocal
-from schemas import UserSchema, Message, UserLoginSchema
+from session import SessionManager, HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE
+from message import (
+    MessageManager,
+    MESSAGE_MAX_WAIT_SECONDS,
+    MESSAGE_MAX_BATCH,
+    BULK_MAX_RECIPIENTS,
+)
+from archive import ResultArchiver, ARCHIVE_INTERVAL_SECONDS, EXPORT_TABLES
+from config import settings
+from broadcast import TaskBroadcaster, TASK_STREAM_KEEPALIVE_SECONDS
+from notify import PgTaskNotifier
+from ratelimit import RateLimiter
+from leaderboard import LEADERBOARD_MAX_LIMIT, SORT_ORDERS
+from scheduler import (
+    TaskScheduler,
+    TASK_SCHEDULE_INTERVAL_SECONDS,
+    TASK_POOL_MAX_ENQUEUE,
+)
+from db import get_db, get_pool_stats, engine, SessionLocal
+from metrics import Gauge, MetricsMiddleware, registry
+from migrations import migrate, AUTO_MIGRATE
+from provisioning import detect_format, parse_users, register_users, shutdown_hash_pool
+from schemas import UserSchema, Message, BulkMessage, UserLoginSchema, JobCreate
 
-Base.metadata.drop_all(bind=engine)
-Base.metadata.create_all(bind=engine)
 load_dotenv()
 
+if AUTO_MIGRATE:
+    migrate(engine)
+
 app = FastAPI()
 
 app.add_middleware(
@@ -23,96 +52,568 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
+)
+app.add_middleware(MetricsMiddleware)
+
+security_manager = SecurityManager()
+session_manager = SessionManager()
+message_manager = MessageManager()
+task_broadcaster = TaskBroadcaster()
+task_rate_limiter = RateLimiter("task", settings.task_rate_limit, 60)
+send_rate_limiter = RateLimiter("send", settings.send_rate_limit, 60)
+task_scheduler = TaskScheduler(session_manager)
+result_archiver = ResultArchiver()
+session_manager.add_task_listener(task_broadcaster.publish)
+registry.register(
+    Gauge(
+        "active_sessions",
+        "Users seen within the session TTL on this worker.",
+        lambda: len(session_manager.presence.sessions),
+    )
 )
 
+task_notifier = None
+if os.getenv("TASK_NOTIFY_CHANNEL") and engine.dialect.name == "postgresql":
+    task_notifier = PgTaskNotifier(engine, os.getenv("TASK_NOTIFY_CHANNEL"))
+    session_manager.set_invalidation_hook(task_notifier.publish)
+
+
 @app.on_event("startup")
-def truncate_sessions():
+def load_current_task():
     db: Session = SessionLocal()
     try:
-        db.execute(text("TRUNCATE TABLE active_sessions RESTART IDENTITY;"))
-        db.commit()
+        session_manager.load_current_task(db)
+        session_manager.presence.load(db)
+        session_manager.leaderboard.load(db)
     finally:
         db.close()
+    if task_notifier:
+        task_notifier.start(session_manager.receive_task)
 
-security_manager = SecurityManager()
-session_manager = SessionManager()
-message_manager = MessageManager()
+
+@app.on_event("startup")
+async def start_result_ingestor():
+    session_manager.result_ingestor.start()
+    session_manager.presence.start()
+
+
+@app.on_event("startup")
+async def start_task_scheduler():
+    if TASK_SCHEDULE_INTERVAL_SECONDS > 0:
+        task_scheduler.start(TASK_SCHEDULE_INTERVAL_SECONDS)
+
+
+@app.on_event("startup")
+async def start_result_archiver():
+    if ARCHIVE_INTERVAL_SECONDS > 0:
+        result_archiver.start(ARCHIVE_INTERVAL_SECONDS)
 
 
-async def get_current_user(credentials=Depends(HTTPBearer())):
-    return await SecurityManager.validate_token(credentials)
+@app.on_event("shutdown")
+async def stop_task_scheduler():
+    task_scheduler.stop()
+
+
+@app.on_event("shutdown")
+async def stop_result_archiver():
+    result_archiver.stop()
+
+
+@app.on_event("shutdown")
+def stop_hash_pool():
+    shutdown_hash_pool()
+
+
+@app.on_event("shutdown")
+def stop_task_notifier():
+    if task_notifier:
+        task_notifier.stop()
+
+
+@app.on_event("shutdown")
+async def stop_result_ingestor():
+    session_manager.result_ingestor.stop()
+    session_manager.presence.stop()
+
+
+bearer_scheme = HTTPBearer()
+
+
+async def get_current_user(request: Request, credentials=Depends(bearer_scheme)):
+    username = await security_manager.validate_token(credentials)
+    session_manager.presence.touch(username, request.client.host)
+    return username
+
+
+def get_session_id(credentials=Depends(bearer_scheme)) -> str:
+    # Session keys belong to the token that authenticated the request.
+    return security_manager.session_id(credentials.credentials)
+
 
 @app.post("/register")
 async def register(user: UserSchema, db: Session = Depends(get_db)):
-    return security_manager.register_user(user, db)
+    return await security_manager.register_user(user, db)
+
+
+@app.post("/register-bulk")
+async def register_bulk(
+    request: Request,
+    format: str = Query(None, pattern="^(ndjson|csv)$"),
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    if current_user != settings.admin_username:
+        raise HTTPException(
+            status_code=403, detail="Only admin can register users in bulk"
+        )
+
+    # NDJSON or CSV with username, password and public_key per row.
+    try:
+        text = (await request.body()).decode("utf-8-sig")
+        format = format or detect_format(
+            content_type=request.headers.get("content-type")
+        )
+        rows = parse_users(text, format)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await run_in_threadpool(register_users, rows, db, security_manager)
+
 
 @app.post("/login")
-async def login(request: Request, user: UserSchema, db: Session = Depends(get_db)):
-    return await security_manager.login(request, user, db)
+async def login(request: Request, user: UserSchema):
+    return await security_manager.login(request, user)
+
 
 @app.post("/login-db")
-def login_db(request: Request, user: UserLoginSchema, db: Session = Depends(get_db)):
-    return security_manager.login_db(request, user, db)
+async def login_db(
+    request: Request, user: UserLoginSchema, db: Session = Depends(get_db)
+):
+    response = await security_manager.login_db(request, user, db)
+    session_manager.presence.login(user.username, request.client.host)
+    return response
+
+
+@app.post("/logout")
+async def logout(credentials=Depends(bearer_scheme)):
+    username = await security_manager.validate_token(credentials)
+    security_manager.revoke_token(credentials.credentials)
+    session_manager.presence.remove(username)
+    return {"status": "Logged out"}
+
+
+@app.post("/sessions/{username}/revoke")
+async def revoke_user_sessions(
+    username: str, current_user: str = Depends(get_current_user)
+):
+    if current_user != settings.admin_username:
+        raise HTTPException(status_code=403, detail="Only admin can revoke sessions")
+
+    security_manager.revoke_user(username)
+    session_manager.presence.remove(username)
+    return {"status": "Sessions revoked", "username": username}
+
+
+def task_etag(task_id: int) -> str:
+    # Weak: every response is encrypted afresh, only the task is the same.
+    return f'W/"task-{task_id}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
 
 @app.get("/task")
-async def get_task(current_user: str = Depends(get_current_user), db: Session = Depends(get_db)):
-    task = session_manager.get_latest_broadcast_task(db)
+async def get_task(
+    request: Request,
+    since_task_id: int = Query(None),
+    kind: str = Query("broadcast", pattern="^(broadcast|work_unit)$"),
+    current_user: str = Depends(get_current_user),
+    session_id: str = Depends(get_session_id),
+):
+    await task_rate_limiter.hit(current_user)
+    if kind == "work_unit":
+        # A slice of a job leased to this miner alone.
+        unit = await run_in_threadpool(session_manager.jobs.lease, current_user)
+        if unit is None:
+            raise HTTPException(status_code=404, detail="No work unit available")
+        # Unit parameters do not fit in one RSA-OAEP block.
+        return await security_manager.encrypt_response_async(
+            unit, current_user, session_id=session_id, envelope=True
+        )
+
+    if session_manager.current_task_loaded:
+        task, task_json = session_manager.get_latest_broadcast_task_entry()
+    else:
+        task, task_json = await run_in_threadpool(
+            session_manager.get_latest_broadcast_task_entry
+        )
     if not task:
         raise HTTPException(status_code=404, detail="No broadcasted task available")
-    return security_manager.encrypt_response(task, current_user, db)
+
+    # Unchanged task: answer before any serialization or encryption.
+    headers = {"ETag": task_etag(task["task_id"]), "Cache-Control": "private, no-cache"}
+    if since_task_id == task["task_id"]:
+        return Response(status_code=204, headers=headers)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    encrypted = await security_manager.encrypt_response_async(
+        task_json, current_user, session_id=session_id
+    )
+    return JSONResponse(encrypted, headers=headers)
+
+
+@app.get("/task/stream")
+async def stream_tasks(
+    request: Request,
+    current_user: str = Depends(get_current_user),
+    session_id: str = Depends(get_session_id),
+    credentials=Depends(bearer_scheme),
+):
+    queue = task_broadcaster.subscribe(current_user)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    task = await asyncio.wait_for(
+                        queue.get(), TASK_STREAM_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    task = None
+                # The token may have expired or been revoked since the stream
+                # opened; verified tokens are cached, so this check is cheap.
+                try:
+                    await security_manager.validate_token(credentials)
+                except HTTPException:
+                    break
+                if task is None:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                try:
+                    payload = await security_manager.encrypt_response_async(
+                        task, current_user, session_id=session_id
+                    )
+                except HTTPException:
+                    break
+                yield f"event: task\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            task_broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/task/{task_id}/result")
 async def submit_result(
-    task_id: int, result: float, current_user: str = Depends(get_current_user), db: Session = Depends(get_db)
+    task_id: int,
+    result: float,
+    kind: str = Query("broadcast", pattern="^(broadcast|work_unit)$"),
+    current_user: str = Depends(get_current_user),
+    session_id: str = Depends(get_session_id),
 ):
-    response = session_manager.validate_broadcast_task_result(task_id, result, current_user, db)
+    if kind == "work_unit":
+        response = await run_in_threadpool(
+            session_manager.jobs.submit, task_id, result, current_user
+        )
+        if response.get("status") == "Work unit not found":
+            raise HTTPException(status_code=404, detail="Work unit not found")
+        if response.get("status") in ("Work unit already completed", "Invalid result"):
+            raise HTTPException(status_code=400, detail=response["status"])
+        if response.get("status") in ("Lease not held", "Job is not running"):
+            raise HTTPException(status_code=409, detail=response["status"])
+        return await security_manager.encrypt_response_async(
+            response, current_user, session_id=session_id
+        )
+
+    response = await run_in_threadpool(
+        session_manager.validate_broadcast_task_result, task_id, result, current_user
+    )
 
     if response.get("status") == "Task not found":
         raise HTTPException(status_code=404, detail="Task not found")
     if response.get("status") == "Task already submitted":
         raise HTTPException(status_code=400, detail="Task already submitted")
+    if response.get("status") == "Result queue full":
+        raise HTTPException(status_code=503, detail="Result queue full, retry later")
+
+    return await security_manager.encrypt_response_async(
+        response, current_user, session_id=session_id
+    )
+
+
+@app.post("/jobs")
+async def create_job(
+    job: JobCreate,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    if current_user != settings.admin_username:
+        raise HTTPException(status_code=403, detail="Only admin can create jobs")
+
+    try:
+        return await run_in_threadpool(
+            session_manager.jobs.create_job,
+            db,
+            job.name,
+            job.kind,
+            job.params,
+            job.unit_size,
+            job.lease_seconds,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/jobs")
+async def list_jobs(
+    current_user: str = Depends(get_current_user), db: Session = Depends(get_db)
+):
+    if current_user != settings.admin_username:
+        raise HTTPException(status_code=403, detail="Only admin can access jobs")
+
+    return await run_in_threadpool(session_manager.jobs.list_jobs, db)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_progress(
+    job_id: int,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    if current_user != settings.admin_username:
+        raise HTTPException(status_code=403, detail="Only admin can access jobs")
+
+    progress = await run_in_threadpool(session_manager.jobs.job_progress, db, job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return progress
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(
+    job_id: int,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    if current_user != settings.admin_username:
+        raise HTTPException(status_code=403, detail="Only admin can cancel jobs")
+
+    job = await run_in_threadpool(session_manager.jobs.cancel_job, db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
-    return security_manager.encrypt_response(response, current_user, db)
 
 @app.post("/broadcast-task")
 async def broadcast_task(
-    current_user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: str = Depends(get_current_user), db: Session = Depends(get_db)
 ):
-    if current_user != os.getenv("ADMIN_USERNAME"):
+    if current_user != settings.admin_username:
         raise HTTPException(status_code=403, detail="Only admin can broadcast tasks")
 
-    task = session_manager.create_broadcast_task(db)
+    task = await run_in_threadpool(session_manager.create_broadcast_task, db)
     return {"status": "Task broadcasted", "task_id": task["task_id"]}
 
+
+@app.post("/broadcast-tasks/pool")
+async def enqueue_broadcast_tasks(
+    count: int = Query(..., ge=1, le=TASK_POOL_MAX_ENQUEUE),
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    if current_user != settings.admin_username:
+        raise HTTPException(status_code=403, detail="Only admin can enqueue tasks")
+
+    await run_in_threadpool(session_manager.enqueue_tasks, db, count)
+    return {"status": "Tasks enqueued", "count": count}
+
+
+@app.get("/broadcast-tasks/pool")
+async def get_broadcast_task_pool(
+    current_user: str = Depends(get_current_user), db: Session = Depends(get_db)
+):
+    if current_user != settings.admin_username:
+        raise HTTPException(
+            status_code=403, detail="Only admin can access this endpoint"
+        )
+
+    pooled = await run_in_threadpool(session_manager.pooled_task_count, db)
+    return {"pooled": pooled, "scheduler": task_scheduler.status()}
+
+
+@app.post("/broadcast-tasks/scheduler/start")
+async def start_broadcast_scheduler(
+    interval: float = Query(None, gt=0),
+    rate: float = Query(None, gt=0),
+    current_user: str = Depends(get_current_user),
+):
+    if current_user != settings.admin_username:
+        raise HTTPException(
+            status_code=403, detail="Only admin can schedule broadcasts"
+        )
+    if (interval is None) == (rate is None):
+        raise HTTPException(status_code=400, detail="Pass either interval or rate")
+
+    task_scheduler.start(interval if interval is not None else 1 / rate)
+    return task_scheduler.status()
+
+
+@app.post("/broadcast-tasks/scheduler/stop")
+async def stop_broadcast_scheduler(current_user: str = Depends(get_current_user)):
+    if current_user != settings.admin_username:
+        raise HTTPException(
+            status_code=403, detail="Only admin can schedule broadcasts"
+        )
+
+    task_scheduler.stop()
+    return task_scheduler.status()
+
+
 @app.get("/broadcast-tasks-history")
 async def get_broadcast_tasks_history(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: str = None,
+    stream: bool = False,
     current_user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
 ):
-    if current_user != os.getenv("ADMIN_USERNAME"):
-        raise HTTPException(status_code=403, detail="Only admin can access this endpoint")
+    if current_user != settings.admin_username:
+        raise HTTPException(
+            status_code=403, detail="Only admin can access this endpoint"
+        )
 
-    return session_manager.get_broadcast_tasks_history(db)
+    if stream:
+        return StreamingResponse(
+            session_manager.stream_broadcast_tasks_history(),
+            media_type="application/x-ndjson",
+        )
 
-@app.get("/sessions")
-def list_sessions(db: Session = Depends(get_db)):
-    return session_manager.list_active_sessions(db)
+    try:
+        return await run_in_threadpool(
+            session_manager.get_broadcast_tasks_history, db, limit, cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
-@app.post("/send")
-async def send_message(
-    message: Message,
+@app.get("/export")
+async def export_results(
+    table: str = Query("results", pattern=f"^({'|'.join(EXPORT_TABLES)})$"),
+    start: datetime = None,
+    end: datetime = None,
     current_user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
 ):
+    if current_user != settings.admin_username:
+        raise HTTPException(
+            status_code=403, detail="Only admin can access this endpoint"
+        )
+
+    # Stored times are naive UTC.
+    start, end = (
+        (
+            value.astimezone(timezone.utc).replace(tzinfo=None)
+            if value and value.tzinfo
+            else value
+        )
+        for value in (start, end)
+    )
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    return StreamingResponse(
+        result_archiver.export(table, start, end),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{table}.csv"'},
+    )
+
+
+@app.get("/security/key-cache")
+async def get_key_cache_stats(current_user: str = Depends(get_current_user)):
+    if current_user != settings.admin_username:
+        raise HTTPException(
+            status_code=403, detail="Only admin can access this endpoint"
+        )
+
+    return security_manager.public_key_cache.stats()
+
+
+@app.get("/db/pool")
+async def get_db_pool_stats(current_user: str = Depends(get_current_user)):
+    if current_user != settings.admin_username:
+        raise HTTPException(
+            status_code=403, detail="Only admin can access this endpoint"
+        )
+
+    return get_pool_stats()
+
+
+@app.get("/metrics")
+async def get_metrics(current_user: str = Depends(get_current_user)):
+    if current_user != settings.admin_username:
+        raise HTTPException(
+            status_code=403, detail="Only admin can access this endpoint"
+        )
+
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/leaderboard")
+async def get_leaderboard(
+    sort: str = Query("correct", pattern=f"^({'|'.join(SORT_ORDERS)})$"),
+    limit: int = Query(10, ge=1, le=LEADERBOARD_MAX_LIMIT),
+    worst: bool = False,
+    current_user: str = Depends(get_current_user),
+):
+    if current_user != settings.admin_username:
+        raise HTTPException(
+            status_code=403, detail="Only admin can access this endpoint"
+        )
+
+    # worst=true reads the same index from the other end: slowest or least
+    # accurate miners first.
+    if session_manager.leaderboard.stale():
+        await run_in_threadpool(session_manager.leaderboard.reload)
+    return session_manager.leaderboard.top(sort, limit, worst)
+
+
+@app.get("/miners/{username}/stats")
+async def get_miner_stats(username: str, current_user: str = Depends(get_current_user)):
+    if current_user != settings.admin_username:
+        raise HTTPException(
+            status_code=403, detail="Only admin can access this endpoint"
+        )
+
+    if session_manager.leaderboard.stale():
+        await run_in_threadpool(session_manager.leaderboard.reload)
+    stats = session_manager.leaderboard.get(username)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No results from this miner")
+    return stats
+
+
+@app.get("/sessions")
+async def list_sessions():
+    return session_manager.list_active_sessions()
+
+
+@app.post("/send")
+async def send_message(message: Message, current_user: str = Depends(get_current_user)):
+    await send_rate_limiter.hit(current_user)
     try:
         return await message_manager.send_message(
             message=message,
             security_manager=security_manager,
-            db=db,
-            current_user=current_user
+            current_user=current_user,
         )
     except HTTPException as e:
         raise e
@@ -120,14 +621,58 @@ async def send_message(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/send-bulk")
+async def send_bulk_message(
+    message: BulkMessage, current_user: str = Depends(get_current_user)
+):
+    is_admin = current_user == settings.admin_username
+    if message.all_active_sessions:
+        if not is_admin:
+            raise HTTPException(
+                status_code=403, detail="Only admin can message all sessions"
+            )
+        recipients = session_manager.presence.active_usernames()
+    else:
+        recipients = message.to_users or []
+        if len(recipients) > BULK_MAX_RECIPIENTS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {BULK_MAX_RECIPIENTS} recipients per request",
+            )
+        if not is_admin and 0 < settings.send_rate_limit < len(set(recipients)):
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {settings.send_rate_limit} recipients per minute",
+            )
+
+    if not recipients:
+        raise HTTPException(status_code=400, detail="No recipients")
+
+    # Each recipient counts as one /send, so bulk sends cannot multiply a
+    # miner's message rate; the admin's fan-out is charged once.
+    await send_rate_limiter.hit(
+        current_user, cost=1 if is_admin else len(set(recipients))
+    )
+
+    return await message_manager.send_bulk(
+        message, recipients, security_manager, current_user
+    )
+
+
 @app.post("/get-message")
-async def get_message(current_user: str = Depends(get_current_user)):
-    return await message_manager.get_message(current_user)
+async def get_message(
+    wait: float = Query(0, ge=0, le=MESSAGE_MAX_WAIT_SECONDS),
+    limit: int = Query(None, ge=1, le=MESSAGE_MAX_BATCH),
+    current_user: str = Depends(get_current_user),
+):
+    return await message_manager.get_message(current_user, wait, limit)
+
 
 if __name__ == "__main__":
     import uvicorn
+
     uvicorn.run(
         app,
-        host=os.getenv("SERVER_HOST", "0.0.0.0"),
-        port=int(os.getenv("SERVER_PORT", 8080)),
+        host=settings.server_host,
+        port=settings.server_port,
     )
@@ -0,0 +1,101 @@
+import argparse
+
+from archive import ResultArchiver, ARCHIVE_DIR, RESULT_RETENTION_DAYS
+from db import SessionLocal
+from leaderboard import backfill_miner_stats
+from migrations import migrate as apply_migrations, latest_version
+from provisioning import (
+    detect_format,
+    parse_users,
+    register_users as register_user_rows,
+    shutdown_hash_pool,
+)
+from session import SessionManager
+
+
+def migrate(args):
+    applied = apply_migrations()
+    for name in applied:
+        print(f"Applied migration: {name}")
+    print(f"Schema is at version {latest_version()}")
+
+
+def backfill_task_stats(args):
+    with SessionLocal() as db:
+        updated = SessionManager.backfill_broadcast_task_stats(db)
+    print(f"Updated statistics of {updated} broadcast tasks")
+
+
+def backfill_stats_of_miners(args):
+    with SessionLocal() as db:
+        miners = backfill_miner_stats(db)
+    print(f"Rebuilt statistics of {miners} miners")
+
+
+def archive(args):
+    archived = ResultArchiver(args.directory).archive(args.older_than_days)
+    print(
+        f"Archived {archived['tasks']} broadcast tasks in {archived['chunks']} chunks"
+    )
+
+
+def register_users(args):
+    with open(args.file, encoding="utf-8-sig") as f:
+        rows = parse_users(f.read(), args.format or detect_format(filename=args.file))
+    try:
+        with SessionLocal() as db:
+            report = register_user_rows(rows, db)
+    finally:
+        shutdown_hash_pool()
+
+    for error in report["errors"]:
+        print(f"Row {error['row']} ({error['username']}): {error['error']}")
+    print(f"Registered {report['created']} users, {report['failed']} rows failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crypto mining backend maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser(
+        "migrate", help="Create missing tables and apply pending schema migrations"
+    ).set_defaults(func=migrate)
+
+    commands.add_parser(
+        "backfill-task-stats",
+        help="Recount per-task result counters from broadcast_task_results",
+    ).set_defaults(func=backfill_task_stats)
+
+    commands.add_parser(
+        "backfill-miner-stats", help="Rebuild miner_stats from results not yet archived"
+    ).set_defaults(func=backfill_stats_of_miners)
+
+    archive_parser = commands.add_parser(
+        "archive",
+        help="Move old broadcast tasks and their results to gzipped CSV files",
+    )
+    archive_parser.add_argument(
+        "--older-than-days",
+        type=float,
+        default=RESULT_RETENTION_DAYS,
+        help=f"Default: RESULT_RETENTION_DAYS ({RESULT_RETENTION_DAYS:g})",
+    )
+    archive_parser.add_argument("--directory", default=ARCHIVE_DIR)
+    archive_parser.set_defaults(func=archive)
+
+    register = commands.add_parser(
+        "register-users",
+        help="Register users from NDJSON or CSV (username, password, public_key)",
+    )
+    register.add_argument("file")
+    register.add_argument(
+        "--format", choices=["ndjson", "csv"], help="Default: from the file extension"
+    )
+    register.set_defaults(func=register_users)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
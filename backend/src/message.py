@@ -1,47 +1,203 @@
-from fastapi import HTTPException
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
 import os
+import time
 
-from sqlalchemy.orm import Session
-
-from schemas import Message
+from logs import get_logger
+from schemas import Message, BulkMessage
+from state import create_message_store
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = get_logger("message")
+
 DEBUG_MODE = os.getenv("DEBUG_MODE", "0") == "1"
 
+MESSAGE_MAX_WAIT_SECONDS = 30
+MESSAGE_MAX_BATCH = 100
+BULK_MAX_RECIPIENTS = int(os.getenv("BULK_MAX_RECIPIENTS", 1000))
+BULK_ENCRYPT_CHUNK_SIZE = 50
+
+# Per-recipient RSA for bulk sends runs here instead of on the event loop.
+encrypt_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("MESSAGE_ENCRYPT_WORKERS", os.cpu_count() or 2)),
+    thread_name_prefix="encrypt",
+)
+
 
 class MessageManager:
-    def __init__(self):
-        self.user_inboxes = {}
+    def __init__(self, store=None):
+        self.store = store or create_message_store()
+        self.inbox_conditions = {}
+        self.waiters = {}
 
-    async def send_message(self, message: Message, security_manager, current_user: str, db: Session):
-        if message.to_user == current_user:
+    async def _call(self, method, *args):
+        # SQL-backed stores run in the threadpool, the in-memory one inline.
+        if self.store.blocking:
+            return await run_in_threadpool(method, *args)
+        return method(*args)
+
+    async def _enqueue(self, user: str, encrypted: dict):
+        if not await self._call(self.store.append, user, encrypted):
             raise HTTPException(
-                status_code=400, 
-                detail="Cannot send message to yourself"
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Recipient inbox is full",
             )
 
-        if message.to_user not in security_manager.user_public_keys:
+    async def _take(self, user: str, limit: int) -> list:
+        return await self._call(self.store.take, user, limit)
+
+    async def _notify(self, user: str):
+        condition = self.inbox_conditions.get(user)
+        if condition is not None:
+            async with condition:
+                condition.notify_all()
+
+    async def _wait_for_messages(self, user: str, timeout: float):
+        condition = self.inbox_conditions.get(user)
+        if condition is None:
+            condition = self.inbox_conditions[user] = asyncio.Condition()
+        self.waiters[user] = self.waiters.get(user, 0) + 1
+        try:
+            async with condition:
+                if self.store.poll_interval is None:
+                    await asyncio.wait_for(
+                        condition.wait_for(lambda: self.store.has_messages(user)),
+                        timeout,
+                    )
+                else:
+                    # Other workers cannot notify us, so wake up to poll the store.
+                    await asyncio.wait_for(
+                        condition.wait(), min(timeout, self.store.poll_interval)
+                    )
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.waiters[user] -= 1
+            if not self.waiters[user]:
+                self.waiters.pop(user, None)
+                self.inbox_conditions.pop(user, None)
+
+    async def send_message(self, message: Message, security_manager, current_user: str):
+        if message.to_user == current_user:
             raise HTTPException(
-                status_code=404, 
-                detail="Recipient not available"
+                status_code=400, detail="Cannot send message to yourself"
             )
-        encrypted = security_manager.encrypt_response(
-                {"message": message.content, "from": current_user}, message.to_user, db
+
+        if not await security_manager.has_public_key(message.to_user):
+            raise HTTPException(status_code=404, detail="Recipient not available")
+        # Queued for later delivery, so never under a session key.
+        encrypted = await security_manager.encrypt_response_async(
+            {"message": message.content, "from": current_user}, message.to_user
         )
 
+        await self._enqueue(message.to_user, encrypted)
+        await self._notify(message.to_user)
         if DEBUG_MODE:
-            print(f"Odszyfrowana wiadomość dla {message.to_user}: {message.content}")
-            print(f"Odszyfrowana wiadomość dla {message.to_user}: {encrypted}")
+            logger.info(
+                "message_stored",
+                from_user=current_user,
+                to_user=message.to_user,
+                content=message.content,
+                encrypted=encrypted["encrypted"],
+            )
+        else:
+            logger.info(
+                "message_stored", from_user=current_user, to_user=message.to_user
+            )
+        return {"status": "message stored"}
 
-        if message.to_user not in self.user_inboxes:
-            self.user_inboxes[message.to_user] = []
+    @staticmethod
+    def _encrypt_chunk(security_manager, payload: bytes, recipients: list) -> list:
+        encrypted = []
+        for recipient in recipients:
+            try:
+                encrypted.append(security_manager.encrypt_response(payload, recipient))
+            except HTTPException:
+                encrypted.append(None)
+        return encrypted
 
-        self.user_inboxes[message.to_user].append(encrypted)
-        return {"status": "message stored"}
+    async def send_bulk(
+        self,
+        message: BulkMessage,
+        recipients: list,
+        security_manager,
+        current_user: str,
+    ):
+        # The payload is serialized once, encrypted per recipient on the
+        # executor and enqueued with a single store call.
+        payload = json.dumps(
+            {"message": message.content, "from": current_user}
+        ).encode()
+        results = dict.fromkeys(recipients)
+        targets = []
+        for recipient in results:
+            if recipient == current_user:
+                results[recipient] = "Cannot send message to yourself"
+            else:
+                targets.append(recipient)
+
+        loop = asyncio.get_running_loop()
+        chunks = [
+            targets[i : i + BULK_ENCRYPT_CHUNK_SIZE]
+            for i in range(0, len(targets), BULK_ENCRYPT_CHUNK_SIZE)
+        ]
+        encrypted_chunks = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    encrypt_executor,
+                    self._encrypt_chunk,
+                    security_manager,
+                    payload,
+                    chunk,
+                )
+                for chunk in chunks
+            )
+        )
+
+        deliveries = []
+        for chunk, encrypted_chunk in zip(chunks, encrypted_chunks):
+            for recipient, encrypted in zip(chunk, encrypted_chunk):
+                if encrypted is None:
+                    results[recipient] = "Recipient not available"
+                else:
+                    deliveries.append((recipient, encrypted))
+
+        accepted = (
+            await self._call(self.store.append_many, deliveries) if deliveries else []
+        )
+        for (recipient, _), stored in zip(deliveries, accepted):
+            results[recipient] = (
+                "message stored" if stored else "Recipient inbox is full"
+            )
+            if stored:
+                await self._notify(recipient)
+
+        logger.info(
+            "bulk_message_stored",
+            from_user=current_user,
+            recipients=len(results),
+            sent=sum(accepted),
+        )
+        return {
+            "sent": sum(accepted),
+            "failed": len(results) - sum(accepted),
+            "results": results,
+        }
+
+    async def get_message(self, user: str, wait: float = 0, limit: int = None):
+        # Without limit a single message is returned (legacy format),
+        # with limit up to that many as {"messages": [...]}.
+        deadline = time.monotonic() + wait
+        messages = await self._take(user, limit or 1)
+        while not messages and time.monotonic() < deadline:
+            await self._wait_for_messages(user, deadline - time.monotonic())
+            messages = await self._take(user, limit or 1)
 
-    async def get_message(self, user: str):
-        if user not in self.user_inboxes or not self.user_inboxes[user]:
-            return {"message": None}
-        return self.user_inboxes[user].pop(0)
+        if limit is None:
+            return messages[0] if messages else {"message": None}
+        return {"messages": messages}
@@ -0,0 +1,224 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Upper bounds in seconds, from a session-key AES call to a slow bcrypt login.
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts (non-cumulative, last is +Inf), sum, count]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float, *label_values):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [
+                    [0] * (len(self.buckets) + 1),
+                    0.0,
+                    0,
+                ]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            series = [
+                (values, list(counts), total, count)
+                for values, (counts, total, count) in self.series.items()
+            ]
+        for values, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}"
+                )
+            lines.append(
+                f"{self.name}_sum{_format_labels(self.labels, values)} {_format_value(total)}"
+            )
+            lines.append(
+                f"{self.name}_count{_format_labels(self.labels, values)} {count}"
+            )
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str, function=None):
+        self.name = name
+        self.help_text = help_text
+        # Gauges read from elsewhere (e.g. the presence tracker) pass a function.
+        self.function = function
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: int = 1):
+        with self.lock:
+            self.value -= amount
+
+    def render(self) -> list:
+        value = self.function() if self.function else self.value
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {_format_value(value)}",
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+request_latency = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Request latency by route template, method and status code.",
+        ("method", "route", "status"),
+    )
+)
+requests_in_flight = registry.register(
+    Gauge("http_requests_in_flight", "Requests currently being handled.")
+)
+operation_latency = registry.register(
+    Histogram(
+        "operation_duration_seconds",
+        "Time spent in hot-path operations: encryption, password hashing, DB calls.",
+        ("operation",),
+    )
+)
+
+
+def observe(operation: str, seconds: float):
+    if METRICS_ENABLED:
+        operation_latency.observe(seconds, operation)
+
+
+@contextmanager
+def timed(operation: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(operation, time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware, so streaming responses pass through untouched.
+    # Latency covers the time until the response body is fully sent.
+    def __init__(self, app):
+        self.app = app
+        self.route_paths = None
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            # 404s and requests rejected before routing; the raw path would
+            # give every scanned URL its own series.
+            return "unmatched"
+        if self.route_paths is None:
+            self.route_paths = {
+                route.endpoint: route.path
+                for route in scope["app"].routes
+                if hasattr(route, "endpoint")
+            }
+        return self.route_paths.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            requests_in_flight.dec()
+            request_latency.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                self._route(scope),
+                str(status_code),
+            )
@@ -0,0 +1,212 @@
+import os
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from sqlalchemy import inspect, text, func, select, delete
+from sqlalchemy.orm import Session
+
+from db import Base, engine as default_engine
+from models import (
+    SchemaVersionModel,
+    BroadcastTaskModel,
+    BroadcastTaskResultModel,
+    ActiveSessionModel,
+    JobModel,
+    MinerStatsModel,
+    WorkUnitModel,
+)
+
+load_dotenv()
+
+# Lets each worker bring the schema up to date on import; set to 0 when
+# `python manage.py migrate` runs before the workers start.
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1") == "1"
+# Arbitrary key of the Postgres advisory lock held while migrating.
+MIGRATION_LOCK_KEY = 72194311
+
+
+def _indexes(connection, table: str) -> dict:
+    inspector = inspect(connection)
+    indexes = {
+        index["name"]: bool(index["unique"]) for index in inspector.get_indexes(table)
+    }
+    for constraint in inspector.get_unique_constraints(table):
+        indexes[constraint["name"]] = True
+    return indexes
+
+
+def _create_index(
+    connection, table: str, name: str, columns: tuple, unique: bool = False
+):
+    # Plain DDL: an Index bound to the model tables would join their metadata.
+    if name not in _indexes(connection, table):
+        connection.execute(
+            text(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({', '.join(columns)})"
+            )
+        )
+
+
+def _add_columns(connection, model, names: tuple) -> list:
+    table = model.__table__
+    existing = {
+        column["name"] for column in inspect(connection).get_columns(table.name)
+    }
+    added = []
+    for name in names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        ddl = f"ALTER TABLE {table.name} ADD COLUMN {name} {column.type.compile(connection.dialect)}"
+        if column.server_default is not None:
+            ddl += f" DEFAULT {column.server_default.arg}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+        connection.execute(text(ddl))
+        added.append(name)
+    return added
+
+
+def _create_tables(connection):
+    # Tables that exist keep their data; only missing ones are created.
+    Base.metadata.create_all(connection, checkfirst=True)
+
+
+def _add_task_counters(connection):
+    added = _add_columns(
+        connection,
+        BroadcastTaskModel,
+        ("total_submissions", "correct_count", "incorrect_count"),
+    )
+    if added:
+        from session import SessionManager
+
+        SessionManager.backfill_broadcast_task_stats(Session(bind=connection))
+
+
+def _add_hot_query_indexes(connection):
+    tasks = BroadcastTaskModel.__table__
+    results = BroadcastTaskResultModel.__table__
+    _create_index(
+        connection, tasks.name, "ix_broadcast_tasks_created_at_id", ("created_at", "id")
+    )
+
+    if "uq_broadcast_task_results_task_user" not in _indexes(connection, results.name):
+        # Older schemas allowed duplicate submissions; the first one counts.
+        first_results = select(func.min(results.c.id)).group_by(
+            results.c.broadcast_task_id, results.c.username
+        )
+        connection.execute(delete(results).where(results.c.id.not_in(first_results)))
+        _create_index(
+            connection,
+            results.name,
+            "uq_broadcast_task_results_task_user",
+            ("broadcast_task_id", "username"),
+            unique=True,
+        )
+
+
+def _one_session_per_user(connection):
+    sessions = ActiveSessionModel.__table__
+    if _add_columns(connection, ActiveSessionModel, ("last_seen",)):
+        connection.execute(sessions.update().values(last_seen=sessions.c.timestamp))
+
+    if not _indexes(connection, sessions.name).get("ix_active_sessions_username"):
+        latest_sessions = select(func.max(sessions.c.id)).group_by(sessions.c.username)
+        connection.execute(
+            delete(sessions).where(sessions.c.id.not_in(latest_sessions))
+        )
+        if "ix_active_sessions_username" in _indexes(connection, sessions.name):
+            connection.execute(text("DROP INDEX ix_active_sessions_username"))
+        _create_index(
+            connection,
+            sessions.name,
+            "ix_active_sessions_username",
+            ("username",),
+            unique=True,
+        )
+    _create_index(
+        connection, sessions.name, "ix_active_sessions_last_seen", ("last_seen",)
+    )
+
+
+# Append only; every step must be safe to run against a schema that
+# create_all already brought up to date.
+def _create_job_tables(connection):
+    JobModel.__table__.create(connection, checkfirst=True)
+    WorkUnitModel.__table__.create(connection, checkfirst=True)
+
+
+def _create_miner_stats(connection):
+    # Migration 1 may have just created the table empty on a legacy schema,
+    # so the stats are always rebuilt from the stored results.
+    MinerStatsModel.__table__.create(connection, checkfirst=True)
+    from leaderboard import backfill_miner_stats
+
+    backfill_miner_stats(Session(bind=connection))
+
+
+MIGRATIONS = [
+    (1, "create missing tables", _create_tables),
+    (2, "hot query indexes", _add_hot_query_indexes),
+    (3, "broadcast task result counters", _add_task_counters),
+    (4, "one active session per user", _one_session_per_user),
+    (5, "jobs and work units", _create_job_tables),
+    (6, "miner stats", _create_miner_stats),
+]
+
+
+@contextmanager
+def _migration_lock(engine):
+    # Workers booting together wait here; SQLite serializes writers itself.
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as connection:
+        connection.execute(
+            text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+        )
+        try:
+            yield
+        finally:
+            connection.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY}
+            )
+
+
+def current_version(connection) -> int:
+    if not inspect(connection).has_table(SchemaVersionModel.__tablename__):
+        return 0
+    return (
+        connection.execute(select(func.max(SchemaVersionModel.version))).scalar() or 0
+    )
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0]
+
+
+def migrate(engine=default_engine) -> list:
+    # Up-to-date schemas cost one query, so every worker can call this.
+    with engine.connect() as connection:
+        if current_version(connection) >= latest_version():
+            return []
+
+    applied = []
+    with _migration_lock(engine):
+        with engine.begin() as connection:
+            SchemaVersionModel.__table__.create(connection, checkfirst=True)
+            version = current_version(connection)
+
+        for number, name, step in MIGRATIONS:
+            if number <= version:
+                continue
+            with engine.begin() as connection:
+                step(connection)
+                connection.execute(
+                    SchemaVersionModel.__table__.insert().values(
+                        version=number, name=name
+                    )
+                )
+            applied.append(name)
+    return applied
@@ -1,8 +1,26 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Float
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Text,
+    DateTime,
+    ForeignKey,
+    Boolean,
+    Float,
+    UniqueConstraint,
+    Index,
+)
 from datetime import datetime
 from db import Base
 
 
+class SchemaVersionModel(Base):
+    __tablename__ = "schema_version"
+    version = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+
 class UserModel(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -15,26 +33,115 @@ class UserModel(Base):
 class ActiveSessionModel(Base):
     __tablename__ = "active_sessions"
     id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, index=True)
+    username = Column(String, unique=True, index=True, nullable=False)
     ip = Column(String)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    last_seen = Column(DateTime, default=datetime.utcnow, index=True)
 
 
 class BroadcastTaskModel(Base):
     __tablename__ = "broadcast_tasks"
+    __table_args__ = (Index("ix_broadcast_tasks_created_at_id", "created_at", "id"),)
     id = Column(Integer, primary_key=True, index=True)
     content = Column(String, nullable=False)
+    # NULL while the task waits in the pre-generated pool.
     created_at = Column(DateTime, default=datetime.utcnow)
     a = Column(Integer)
     b = Column(Integer)
     operation = Column(String)
     expected_result = Column(Float)
+    total_submissions = Column(Integer, nullable=False, default=0, server_default="0")
+    correct_count = Column(Integer, nullable=False, default=0, server_default="0")
+    incorrect_count = Column(Integer, nullable=False, default=0, server_default="0")
+
 
 class BroadcastTaskResultModel(Base):
     __tablename__ = "broadcast_task_results"
+    __table_args__ = (
+        UniqueConstraint(
+            "broadcast_task_id", "username", name="uq_broadcast_task_results_task_user"
+        ),
+    )
     id = Column(Integer, primary_key=True, index=True)
     broadcast_task_id = Column(Integer, ForeignKey("broadcast_tasks.id"))
     username = Column(String, nullable=False)
     answer = Column(Float, nullable=False)
     submitted_at = Column(DateTime, default=datetime.utcnow)
     is_correct = Column(Boolean)
+
+
+class MinerStatsModel(Base):
+    __tablename__ = "miner_stats"
+    username = Column(String, primary_key=True)
+    submissions = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+    # Seconds from a task's broadcast to the answer, summed for the average.
+    latency_seconds_total = Column(Float, nullable=False, default=0)
+    latency_samples = Column(Integer, nullable=False, default=0)
+    current_streak = Column(Integer, nullable=False, default=0)
+    best_streak = Column(Integer, nullable=False, default=0)
+    last_submitted_at = Column(DateTime)
+
+
+class JobModel(Base):
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    kind = Column(String, nullable=False)
+    # JSON of the whole job, e.g. the operand ranges or the nonce space.
+    params = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="running")
+    lease_seconds = Column(Integer, nullable=False)
+    total_units = Column(Integer, nullable=False)
+    completed_units = Column(Integer, nullable=False, default=0, server_default="0")
+    rejected_results = Column(Integer, nullable=False, default=0, server_default="0")
+    # Sum of the unit results, or the nonce that solved the job.
+    result = Column(Float)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime)
+
+
+class WorkUnitModel(Base):
+    __tablename__ = "work_units"
+    __table_args__ = (
+        Index("ix_work_units_status_id", "status", "id"),
+        Index("ix_work_units_job_id_status", "job_id", "status"),
+    )
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey("jobs.id"), nullable=False)
+    # JSON slice of the job handed to the miner.
+    params = Column(Text, nullable=False)
+    expected_result = Column(Float)
+    status = Column(String, nullable=False, default="pending")
+    leased_to = Column(String, index=True)
+    lease_expires_at = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    result = Column(Float)
+    completed_by = Column(String)
+    completed_at = Column(DateTime)
+
+
+class InboxMessageModel(Base):
+    __tablename__ = "inbox_messages"
+    __table_args__ = (Index("ix_inbox_messages_recipient_id", "recipient", "id"),)
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class PublicKeyModel(Base):
+    __tablename__ = "public_keys"
+    username = Column(String, primary_key=True)
+    public_key = Column(Text, nullable=False)
+    fingerprint = Column(String, nullable=False)
+    encryption_mode = Column(String)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class RateLimitCounterModel(Base):
+    __tablename__ = "rate_limit_counters"
+    key = Column(String, primary_key=True)
+    window = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,66 @@
+import json
+import select
+import threading
+import time
+
+from sqlalchemy import text
+
+from logs import get_logger
+
+logger = get_logger("notify")
+
+RECONNECT_DELAY_SECONDS = 5
+
+
+# Shares newly created broadcast tasks between uvicorn workers via Postgres
+# LISTEN/NOTIFY, so every worker can refresh its cached task.
+class PgTaskNotifier:
+    def __init__(self, engine, channel: str):
+        if not channel.isidentifier():
+            raise ValueError(f"Invalid notification channel: {channel}")
+        self.engine = engine
+        self.channel = channel
+        self._stop = threading.Event()
+        self._thread = None
+
+    def publish(self, payload: dict):
+        with self.engine.connect() as connection:
+            connection.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": self.channel, "payload": json.dumps(payload)},
+            )
+            connection.commit()
+
+    def start(self, callback):
+        self._thread = threading.Thread(target=self._run, args=(callback,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, callback):
+        while not self._stop.is_set():
+            try:
+                self._listen(callback)
+            except Exception:
+                logger.exception("task_notification_listener_failed")
+                time.sleep(RECONNECT_DELAY_SECONDS)
+
+    def _listen(self, callback):
+        connection = self.engine.raw_connection()
+        # Keep the LISTEN session out of the pool.
+        connection.detach()
+        try:
+            dbapi_connection = connection.driver_connection
+            dbapi_connection.autocommit = True
+            dbapi_connection.cursor().execute(f'LISTEN "{self.channel}"')
+
+            while not self._stop.is_set():
+                if select.select([dbapi_connection], [], [], 5) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notification = dbapi_connection.notifies.pop(0)
+                    callback(json.loads(notification.payload))
+        finally:
+            connection.close()
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import threading
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from db import SessionLocal, dialect_insert
+from logs import get_logger
+from models import ActiveSessionModel
+
+load_dotenv()
+
+logger = get_logger("presence")
+
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", 1800))
+# A user's last_seen is written at most this often.
+PRESENCE_TOUCH_INTERVAL_SECONDS = float(
+    os.getenv("PRESENCE_TOUCH_INTERVAL_SECONDS", 60)
+)
+PRESENCE_FLUSH_INTERVAL_SECONDS = float(os.getenv("PRESENCE_FLUSH_INTERVAL_SECONDS", 5))
+PRESENCE_UPSERT_BATCH = 1000
+
+
+class PresenceEntry:
+    def __init__(self, ip: str, timestamp: datetime, last_seen: datetime):
+        self.ip = ip
+        self.timestamp = timestamp
+        self.last_seen = last_seen
+        self.persisted_at = None
+
+
+# Keeps the active sessions in memory and upserts one row per user into
+# active_sessions in batches; /sessions is served from here.
+class PresenceTracker:
+    def __init__(self):
+        self.sessions = {}
+        self.dirty = set()
+        self.removed = set()
+        self.lock = threading.Lock()
+        self.flusher = None
+
+    def login(self, username: str, ip: str):
+        now = datetime.utcnow()
+        with self.lock:
+            self.sessions[username] = PresenceEntry(ip, now, now)
+            self.dirty.add(username)
+            self.removed.discard(username)
+
+    def touch(self, username: str, ip: str = None):
+        now = datetime.utcnow()
+        entry = self.sessions.get(username)
+        if entry is None:
+            # Logged in on another worker or before a restart, so the login
+            # time is unknown here.
+            with self.lock:
+                self.sessions[username] = PresenceEntry(ip, None, now)
+                self.dirty.add(username)
+            return
+
+        entry.last_seen = now
+        if ip:
+            entry.ip = ip
+        if (
+            entry.persisted_at is None
+            or (now - entry.persisted_at).total_seconds()
+            >= PRESENCE_TOUCH_INTERVAL_SECONDS
+        ):
+            with self.lock:
+                self.dirty.add(username)
+
+    def remove(self, username: str):
+        with self.lock:
+            self.sessions.pop(username, None)
+            self.dirty.discard(username)
+            self.removed.add(username)
+
+    def _expire(self, now: datetime) -> datetime:
+        cutoff = now - timedelta(seconds=SESSION_TTL_SECONDS)
+        with self.lock:
+            for username, entry in list(self.sessions.items()):
+                if entry.last_seen < cutoff:
+                    self.sessions.pop(username, None)
+                    self.dirty.discard(username)
+        return cutoff
+
+    def active_sessions(self) -> list:
+        cutoff = datetime.utcnow() - timedelta(seconds=SESSION_TTL_SECONDS)
+        return [
+            {
+                "username": username,
+                "ip": entry.ip,
+                "timestamp": entry.timestamp,
+                "last_seen": entry.last_seen,
+            }
+            for username, entry in list(self.sessions.items())
+            if entry.last_seen >= cutoff
+        ]
+
+    def active_usernames(self) -> list:
+        return [session["username"] for session in self.active_sessions()]
+
+    def load(self, db: Session):
+        cutoff = datetime.utcnow() - timedelta(seconds=SESSION_TTL_SECONDS)
+        rows = db.query(ActiveSessionModel).filter(
+            ActiveSessionModel.last_seen >= cutoff
+        )
+        with self.lock:
+            for row in rows:
+                entry = PresenceEntry(row.ip, row.timestamp, row.last_seen)
+                entry.persisted_at = row.last_seen
+                self.sessions.setdefault(row.username, entry)
+
+    @staticmethod
+    def _upsert(db: Session, rows: list, columns: tuple):
+        for start in range(0, len(rows), PRESENCE_UPSERT_BATCH):
+            insert = dialect_insert(ActiveSessionModel).values(
+                rows[start : start + PRESENCE_UPSERT_BATCH]
+            )
+            db.execute(
+                insert.on_conflict_do_update(
+                    index_elements=["username"],
+                    set_={column: insert.excluded[column] for column in columns},
+                )
+            )
+
+    def flush(self) -> int:
+        now = datetime.utcnow()
+        cutoff = self._expire(now)
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            removed, self.removed = self.removed, set()
+            logins, touches = [], []
+            for username in dirty:
+                entry = self.sessions.get(username)
+                if entry is None:
+                    continue
+                entry.persisted_at = entry.last_seen
+                row = {
+                    "username": username,
+                    "ip": entry.ip,
+                    "timestamp": entry.timestamp or entry.last_seen,
+                    "last_seen": entry.last_seen,
+                }
+                (logins if entry.timestamp else touches).append(row)
+            rows = logins + touches
+
+        try:
+            with SessionLocal() as db:
+                self._upsert(db, logins, ("ip", "timestamp", "last_seen"))
+                self._upsert(db, touches, ("ip", "last_seen"))
+                db.execute(
+                    delete(ActiveSessionModel).where(
+                        (ActiveSessionModel.last_seen < cutoff)
+                        | ActiveSessionModel.username.in_(removed)
+                    )
+                )
+                db.commit()
+        except Exception:
+            with self.lock:
+                self.dirty |= {row["username"] for row in rows}
+                self.removed |= removed
+            raise
+        return len(rows)
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(PRESENCE_FLUSH_INTERVAL_SECONDS)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.exception("presence_flush_failed")
+
+    def start(self):
+        self.flusher = asyncio.get_running_loop().create_task(self._run_flusher())
+
+    def stop(self):
+        if self.flusher:
+            self.flusher.cancel()
+            self.flusher = None
+        self.flush()
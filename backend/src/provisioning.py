@@ -0,0 +1,188 @@
+import csv
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from db import dialect_insert
+from models import UserModel
+from security import SecurityManager
+from utils import hash_password
+
+load_dotenv()
+
+BULK_REGISTER_MAX_USERS = int(os.getenv("BULK_REGISTER_MAX_USERS", 10000))
+BULK_REGISTER_INSERT_BATCH = 1000
+# Usernames per IN (...) query; stays below SQLite's variable limit.
+BULK_REGISTER_LOOKUP_BATCH = 500
+BCRYPT_BULK_WORKERS = int(os.getenv("BCRYPT_BULK_WORKERS", os.cpu_count() or 2))
+
+USER_FIELDS = ("username", "password", "public_key")
+FORMATS = ("ndjson", "csv")
+
+_hash_pool = None
+
+
+def _get_hash_pool() -> ThreadPoolExecutor:
+    # bcrypt dominates a bulk import and releases the GIL, so threads use
+    # every core. Not a process pool: forking a threaded server can copy a
+    # held lock into the child, and spawned children re-import the app.
+    # Separate from utils.bcrypt_executor, so logins never queue behind it.
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ThreadPoolExecutor(
+            max_workers=BCRYPT_BULK_WORKERS, thread_name_prefix="bcrypt-bulk"
+        )
+    return _hash_pool
+
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown()
+        _hash_pool = None
+
+
+def hash_passwords(passwords: list) -> list:
+    if len(passwords) < 2:
+        return [hash_password(password) for password in passwords]
+    return list(_get_hash_pool().map(hash_password, passwords))
+
+
+def detect_format(filename: str = None, content_type: str = None) -> str:
+    if content_type and "csv" in content_type:
+        return "csv"
+    if filename and filename.lower().endswith(".csv"):
+        return "csv"
+    return "ndjson"
+
+
+def parse_users(text: str, format: str) -> list:
+    # Returns (row number, fields or None, error or None) per input row.
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format: {format}")
+
+    rows = []
+    if format == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        for number, record in enumerate(reader, start=1):
+            rows.append((number, record, None))
+    else:
+        for number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                rows.append((number, None, f"Invalid JSON: {e.msg}"))
+                continue
+            if not isinstance(record, dict):
+                rows.append((number, None, "Expected a JSON object"))
+                continue
+            rows.append((number, record, None))
+
+    if len(rows) > BULK_REGISTER_MAX_USERS:
+        raise ValueError(f"At most {BULK_REGISTER_MAX_USERS} users per request")
+    return rows
+
+
+def _validate(record: dict):
+    for field in USER_FIELDS:
+        value = record.get(field)
+        if not isinstance(value, str) or not value:
+            return f"Missing field: {field}"
+    try:
+        SecurityManager.parse_public_key(record["public_key"])
+    except HTTPException as e:
+        return e.detail
+    return None
+
+
+def _existing_usernames(db: Session, usernames: list) -> set:
+    existing = set()
+    for start in range(0, len(usernames), BULK_REGISTER_LOOKUP_BATCH):
+        batch = usernames[start : start + BULK_REGISTER_LOOKUP_BATCH]
+        existing.update(
+            username
+            for (username,) in db.query(UserModel.username).filter(
+                UserModel.username.in_(batch)
+            )
+        )
+    return existing
+
+
+def register_users(
+    rows: list, db: Session, security_manager: SecurityManager = None
+) -> dict:
+    errors = []
+    candidates = {}
+    # Cheap checks first, so no bcrypt time goes to rows that fail anyway.
+    for number, record, error in rows:
+        if error is None:
+            error = _validate(record)
+        if error is None and record["username"] in candidates:
+            error = "Duplicate username in input"
+        if error is not None:
+            username = record.get("username") if record else None
+            errors.append({"row": number, "username": username, "error": error})
+            continue
+        candidates[record["username"]] = (number, record)
+
+    for username in _existing_usernames(db, list(candidates)):
+        number, _ = candidates.pop(username)
+        errors.append(
+            {
+                "row": number,
+                "username": username,
+                "error": "Username already registered",
+            }
+        )
+
+    entries = list(candidates.values())
+    hashes = hash_passwords([record["password"] for _, record in entries])
+
+    created = []
+    for start in range(0, len(entries), BULK_REGISTER_INSERT_BATCH):
+        batch = entries[start : start + BULK_REGISTER_INSERT_BATCH]
+        values = [
+            {
+                "username": record["username"],
+                "hashed_password": hashed,
+                "public_key": record["public_key"],
+            }
+            for (_, record), hashed in zip(
+                batch, hashes[start : start + BULK_REGISTER_INSERT_BATCH]
+            )
+        ]
+        # Users registered concurrently since the lookup are skipped, not fatal.
+        inserted = set(
+            db.scalars(
+                dialect_insert(UserModel)
+                .values(values)
+                .on_conflict_do_nothing(index_elements=["username"])
+                .returning(UserModel.username)
+            )
+        )
+        db.commit()
+        for number, record in batch:
+            if record["username"] in inserted:
+                created.append(record["username"])
+            else:
+                errors.append(
+                    {
+                        "row": number,
+                        "username": record["username"],
+                        "error": "Username already registered",
+                    }
+                )
+
+    if security_manager is not None:
+        for username in created:
+            security_manager.drop_public_key(username)
+
+    errors.sort(key=lambda error: error["row"])
+    return {"created": len(created), "failed": len(errors), "errors": errors}
@@ -0,0 +1,194 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import delete
+
+from config import settings
+from db import SessionLocal, dialect_insert
+from models import RateLimitCounterModel
+
+
+# Sliding window approximated from two fixed windows: the previous window's
+# count is weighted by how much of it still overlaps the sliding window.
+# Each key costs one small entry and every check is O(1).
+class WindowCounter:
+    blocking = False
+
+    def __init__(self, name: str, window_seconds: float, max_keys: int):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        # key -> [window index, count in that window, count in the one before],
+        # least recently updated first
+        self.entries = OrderedDict()
+        self.evictions = 0
+        self.last_sweep = 0.0
+        self.lock = threading.Lock()
+
+    def _window(self, now: float) -> int:
+        return int(now // self.window_seconds)
+
+    @staticmethod
+    def _roll(entry: list, window: int):
+        if entry[0] == window:
+            return
+        entry[2] = entry[1] if entry[0] == window - 1 else 0
+        entry[1] = 0
+        entry[0] = window
+
+    def counts(self, key: str, now: float) -> tuple:
+        window = self._window(now)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < window - 1:
+            return 0, 0
+        if entry[0] == window - 1:
+            return entry[1], 0
+        return entry[2], entry[1]
+
+    def add(self, key: str, now: float, amount: int = 1):
+        window = self._window(now)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = [window, 0, 0]
+            else:
+                self._roll(entry, window)
+                self.entries.move_to_end(key)
+            entry[1] += amount
+
+            while len(self.entries) > self.max_keys:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            self._sweep(window, now)
+
+    def _sweep(self, window: int, now: float):
+        # Keys untouched for two windows count as zero, so they can go.
+        if now - self.last_sweep < self.window_seconds:
+            return
+        self.last_sweep = now
+        while self.entries:
+            entry = next(iter(self.entries.values()))
+            if entry[0] >= window - 1:
+                break
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SqlWindowCounter:
+    # Counters shared between workers, one row per key and window.
+    blocking = True
+
+    def __init__(self, name: str, window_seconds: float, session_factory=SessionLocal):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.session_factory = session_factory
+        self.last_sweep = 0.0
+
+    def _window(self, now: float) -> int:
+        return int(now // self.window_seconds)
+
+    def _key(self, key: str) -> str:
+        return f"{self.name}:{key}"
+
+    def counts(self, key: str, now: float) -> tuple:
+        window = self._window(now)
+        with self.session_factory() as db:
+            rows = dict(
+                db.query(RateLimitCounterModel.window, RateLimitCounterModel.count)
+                .filter(
+                    RateLimitCounterModel.key == self._key(key),
+                    RateLimitCounterModel.window.in_((window - 1, window)),
+                )
+                .all()
+            )
+        return rows.get(window - 1, 0), rows.get(window, 0)
+
+    def add(self, key: str, now: float, amount: int = 1):
+        window = self._window(now)
+        with self.session_factory() as db:
+            db.execute(
+                dialect_insert(RateLimitCounterModel)
+                .values(key=self._key(key), window=window, count=amount)
+                .on_conflict_do_update(
+                    index_elements=["key", "window"],
+                    set_={"count": RateLimitCounterModel.count + amount},
+                )
+            )
+            if now - self.last_sweep >= self.window_seconds:
+                self.last_sweep = now
+                db.execute(
+                    delete(RateLimitCounterModel).where(
+                        RateLimitCounterModel.key.startswith(f"{self.name}:"),
+                        RateLimitCounterModel.window < window - 1,
+                    )
+                )
+            db.commit()
+
+
+class RateLimiter:
+    def __init__(
+        self, name: str, limit: int, window_seconds: float, backend: str = None
+    ):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        backend = backend or settings.rate_limit_backend
+        if backend == "sql":
+            self.counter = SqlWindowCounter(name, window_seconds)
+        elif backend == "memory":
+            self.counter = WindowCounter(
+                name, window_seconds, settings.rate_limit_max_keys
+            )
+        else:
+            raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+    async def _call(self, method, *args):
+        if self.counter.blocking:
+            return await run_in_threadpool(method, *args)
+        return method(*args)
+
+    def _estimate(self, previous: int, current: int, now: float) -> float:
+        elapsed = (now % self.window_seconds) / self.window_seconds
+        return previous * (1 - elapsed) + current
+
+    def _retry_after(self, previous: int, current: int, now: float, limit: int) -> int:
+        # Fraction of the window after which the estimate drops below the limit.
+        elapsed = (now % self.window_seconds) / self.window_seconds
+        if current >= limit:
+            free_at = 2 - limit / current
+        else:
+            free_at = 1 - (limit - current) / previous
+        return max(1, math.ceil((free_at - elapsed) * self.window_seconds))
+
+    async def check(self, key: str, detail: str = "Too many requests", cost: int = 1):
+        # cost > 1 for requests that count as several, e.g. one per recipient.
+        if self.limit <= 0:
+            return
+        limit = self.limit - cost + 1
+        if limit <= 0:
+            # Larger than a whole window; waiting would not help.
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=detail
+            )
+        now = time.time()
+        previous, current = await self._call(self.counter.counts, key, now)
+        if self._estimate(previous, current, now) >= limit:
+            retry_after = self._retry_after(previous, current, now, limit)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=detail,
+                headers={"Retry-After": str(retry_after)},
+            )
+
+    async def record(self, key: str, cost: int = 1):
+        if self.limit > 0:
+            await self._call(self.counter.add, key, time.time(), cost)
+
+    async def hit(self, key: str, cost: int = 1):
+        await self.check(key, cost=cost)
+        await self.record(key, cost)
@@ -0,0 +1,67 @@
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from db import SessionLocal
+from logs import get_logger
+
+load_dotenv()
+
+logger = get_logger("scheduler")
+
+# 0 leaves the scheduler stopped until an admin starts it.
+TASK_SCHEDULE_INTERVAL_SECONDS = float(os.getenv("TASK_SCHEDULE_INTERVAL_SECONDS", 0))
+TASK_SCHEDULE_MIN_INTERVAL_SECONDS = 0.01
+TASK_POOL_SIZE = int(os.getenv("TASK_POOL_SIZE", 1000))
+TASK_POOL_MAX_ENQUEUE = 100000
+
+
+# Broadcasts pooled tasks at a fixed rate; the pool is refilled in bulk
+# whenever it runs dry.
+class TaskScheduler:
+    def __init__(self, session_manager):
+        self.session_manager = session_manager
+        self.interval = None
+        self.broadcasts = 0
+        self._task = None
+
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, interval: float):
+        self.stop()
+        self.interval = max(interval, TASK_SCHEDULE_MIN_INTERVAL_SECONDS)
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _broadcast(self):
+        with SessionLocal() as db:
+            self.session_manager.create_broadcast_task(db, refill=TASK_POOL_SIZE)
+        self.broadcasts += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_run = loop.time()
+        while True:
+            try:
+                await run_in_threadpool(self._broadcast)
+            except Exception:
+                logger.exception("scheduled_broadcast_failed")
+
+            # Keeps the rate steady; after falling behind it restarts from now
+            # instead of firing a burst of catch-up broadcasts.
+            next_run = max(next_run + self.interval, loop.time())
+            await asyncio.sleep(next_run - loop.time())
+
+    def status(self) -> dict:
+        return {
+            "running": self.running(),
+            "interval": self.interval,
+            "broadcasts": self.broadcasts,
+        }
@@ -1,3 +1,5 @@
+from typing import Any, Dict, List, Literal, Optional
+
 from pydantic import BaseModel
 
 
@@ -6,6 +8,7 @@ class UserSchema(BaseModel):
     password: str
     public_key: str
 
+
 class UserLoginSchema(BaseModel):
     username: str
     password: str
@@ -24,3 +27,20 @@ class Task(BaseModel):
 class Message(BaseModel):
     to_user: str
     content: str
+
+
+class BulkMessage(BaseModel):
+    content: str
+    to_users: Optional[List[str]] = None
+    all_active_sessions: bool = False
+
+
+class JobCreate(BaseModel):
+    name: str
+    kind: Literal["operand_range", "nonce_search"]
+    # operand_range: operation, a_start, a_end, b_start, b_end
+    # nonce_search: prefix, difficulty, nonce_start, nonce_end
+    params: Dict[str, Any]
+    unit_size: int
+    # Seconds a miner holds a unit; None uses JOB_LEASE_SECONDS.
+    lease_seconds: Optional[int] = None
@@ -1,87 +1,341 @@
 from datetime import datetime
+import itertools
 
 from fastapi import HTTPException, status, Request
+from starlette.concurrency import run_in_threadpool
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 from sqlalchemy.orm import Session
-from collections import defaultdict
 from dotenv import load_dotenv
 import base64
+import hashlib
 import json
 import time
 import os
-from models import UserModel, ActiveSessionModel
+from cache import LRUCache
+from config import settings
+from logs import get_logger
+from metrics import observe
+from ratelimit import RateLimiter
+from models import UserModel
 from schemas import UserSchema, UserLoginSchema
+from state import PublicKeyRecord, create_key_store
 from utils import (
-    verify_password,
+    verify_password_async,
     create_access_token,
+    access_token_expiry,
     decode_token,
     secure_compare,
-    hash_password,
+    hash_password_async,
 )
 
 load_dotenv()
 
-DEBUG_MODE = os.getenv("DEBUG_MODE", "0") == 1
+logger = get_logger("security")
 
+DEBUG_MODE = os.getenv("DEBUG_MODE", "0") == "1"
+PUBLIC_KEY_CACHE_SIZE = int(os.getenv("PUBLIC_KEY_CACHE_SIZE", 10000))
 
-class SecurityManager:
-    def __init__(self):
-        self.user_public_keys = {}
-        self.failed_attempts = defaultdict(list)
+# "rsa" puts the whole payload through RSA-OAEP (legacy clients), "hybrid"
+# wraps a fresh AES-256-GCM key with RSA-OAEP and encrypts the payload with it,
+# "session" hands out one wrapped AES key at login and reuses it until the JWT
+# expires, so later responses need no RSA at all. Session keys belong to the
+# token they were issued with, so every login of an account has its own.
+ENCRYPTION_MODES = ("rsa", "hybrid", "session")
+SESSION_KEY_SWEEP_SECONDS = 60
+ENCRYPTION_HEADER = "X-Encryption"
 
-    def check_brute_force(self, request: Request):
-        client_ip = request.client.host
-        now = time.time()
+OAEP_PADDING = padding.OAEP(
+    mgf=padding.MGF1(algorithm=hashes.SHA256()),
+    algorithm=hashes.SHA256(),
+    label=None,
+)
 
-        recent_attempts = [
-            t
-            for t in self.failed_attempts[client_ip]
-            if now - t < int(os.getenv("LOCKOUT_MINUTES", 5)) * 60
-        ]
-        self.failed_attempts[client_ip] = recent_attempts
-
-        if len(recent_attempts) >= int(os.getenv("FAILED_ATTEMPT_LIMIT", 5)):
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail=f"Account locked for {os.getenv('LOCKOUT_MINUTES', 5)} minutes",
-            )
 
-    def encrypt_response(self, data: dict, current_user: str, db: Session) -> dict:
-        public_key_pem = self.user_public_keys.get(current_user)
-        if not public_key_pem:
-            raise HTTPException(status_code=400, detail="Public key missing")
+def b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode()
 
-        try:
-            if "BEGIN PUBLIC KEY" not in public_key_pem:
-                public_key_pem = f"-----BEGIN PUBLIC KEY-----\n{public_key_pem}\n-----END PUBLIC KEY-----"
 
-            public_key = serialization.load_pem_public_key(
-                public_key_pem.encode(), backend=default_backend()
+def normalize_public_key(public_key_pem: str) -> str:
+    if "BEGIN PUBLIC KEY" not in public_key_pem:
+        return f"-----BEGIN PUBLIC KEY-----\n{public_key_pem}\n-----END PUBLIC KEY-----"
+    return public_key_pem
+
+
+def key_fingerprint(public_key_pem: str) -> str:
+    return hashlib.sha256(public_key_pem.encode()).hexdigest()
+
+
+class SessionKey:
+    def __init__(self, username: str, expires_at: datetime):
+        self.username = username
+        self.key = AESGCM.generate_key(bit_length=256)
+        self.aesgcm = AESGCM(self.key)
+        self.expires_at = expires_at
+        # 4 random bytes + 8 byte counter: nonces never repeat under one key.
+        self.nonce_prefix = os.urandom(4)
+        self.counter = itertools.count()
+
+    def expired(self) -> bool:
+        return datetime.utcnow() >= self.expires_at
+
+    def encrypt(self, payload: bytes) -> dict:
+        nonce = self.nonce_prefix + next(self.counter).to_bytes(8, "big")
+        return {
+            "encrypted": b64encode(self.aesgcm.encrypt(nonce, payload, None)),
+            "iv": b64encode(nonce),
+        }
+
+
+class SecurityManager:
+    def __init__(self):
+        # Shared between workers when STATE_BACKEND=sql.
+        self.user_public_keys = create_key_store()
+        self.failed_logins = RateLimiter(
+            "failed-logins",
+            settings.failed_attempt_limit,
+            settings.lockout_minutes * 60,
+        )
+        self.login_rate_limiter = RateLimiter("login", settings.login_rate_limit, 60)
+        # Parsed key objects keyed by (username, fingerprint), so a new key
+        # for the same user never hits a stale entry.
+        self.public_key_cache = LRUCache(PUBLIC_KEY_CACHE_SIZE)
+        # Session id -> SessionKey, and username -> session ids for revocation.
+        self.session_keys = {}
+        self.user_sessions = {}
+        self.last_session_key_sweep = time.time()
+        self.token_cache = LRUCache(settings.token_cache_size)
+        self.revoked_tokens = {}
+        self.revoked_users = {}
+
+    async def check_brute_force(self, request: Request):
+        await self.failed_logins.check(
+            request.client.host,
+            f"Account locked for {settings.lockout_minutes} minutes",
+        )
+        await self.login_rate_limiter.hit(request.client.host)
+
+    @staticmethod
+    def parse_public_key(public_key_pem: str):
+        try:
+            return serialization.load_pem_public_key(
+                normalize_public_key(public_key_pem).encode(), backend=default_backend()
             )
         except ValueError as e:
             raise HTTPException(status_code=400, detail=f"Invalid public key: {str(e)}")
 
-        payload = json.dumps(data).encode()
-        ciphertext = public_key.encrypt(
-            payload,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None,
-            ),
+    def set_public_key(
+        self, username: str, public_key_pem: str, encryption_mode: str = None
+    ):
+        fingerprint = key_fingerprint(public_key_pem)
+        old_record = self.user_public_keys.get(username)
+        if old_record is not None and old_record.fingerprint != fingerprint:
+            self.public_key_cache.pop((username, old_record.fingerprint))
+
+        cache_key = (username, fingerprint)
+        if cache_key not in self.public_key_cache:
+            self.public_key_cache.put(cache_key, self.parse_public_key(public_key_pem))
+
+        self.user_public_keys.set(
+            username, PublicKeyRecord(public_key_pem, fingerprint, encryption_mode)
         )
-        encrypted = base64.b64encode(ciphertext).decode()
+
+    def drop_public_key(self, username: str):
+        record = self.user_public_keys.get(username)
+        self.user_public_keys.pop(username)
+        self.drop_user_sessions(username)
+        if record is not None:
+            self.public_key_cache.pop((username, record.fingerprint))
+
+    def get_public_key_record(self, username: str) -> PublicKeyRecord:
+        record = self.user_public_keys.get(username)
+        if record is None:
+            raise HTTPException(status_code=400, detail="Public key missing")
+        return record
+
+    def get_public_key(self, username: str, record: PublicKeyRecord = None):
+        record = record or self.get_public_key_record(username)
+        cache_key = (username, record.fingerprint)
+        public_key = self.public_key_cache.get(cache_key)
+        if public_key is None:
+            public_key = self.parse_public_key(record.public_key)
+            self.public_key_cache.put(cache_key, public_key)
+        return public_key
+
+    @staticmethod
+    def negotiate_encryption(request: Request):
+        # Returns the mode to store with the user's public key.
+        mode = request.headers.get(ENCRYPTION_HEADER, "rsa").lower()
+        if mode not in ENCRYPTION_MODES or mode == "rsa":
+            return None
+        return mode
+
+    @classmethod
+    def session_id(cls, token: str) -> str:
+        # Short id of the token a session key belongs to; responses carry it
+        # as "kid" so clients can tell a key they do not hold.
+        return cls.token_digest(token).hex()[:16]
+
+    def start_session(self, session_id: str, username: str, expires_at: datetime):
+        self.sweep_session_keys()
+        session_key = SessionKey(username, expires_at)
+        self.session_keys[session_id] = session_key
+        self.user_sessions.setdefault(username, set()).add(session_id)
+        return session_key
+
+    def drop_session(self, session_id: str):
+        session_key = self.session_keys.pop(session_id, None)
+        if session_key is None:
+            return
+        session_ids = self.user_sessions.get(session_key.username)
+        if session_ids is not None:
+            session_ids.discard(session_id)
+            if not session_ids:
+                self.user_sessions.pop(session_key.username, None)
+
+    def drop_user_sessions(self, username: str):
+        for session_id in self.user_sessions.pop(username, ()):
+            self.session_keys.pop(session_id, None)
+
+    def sweep_session_keys(self):
+        now = time.time()
+        if now - self.last_session_key_sweep < SESSION_KEY_SWEEP_SECONDS:
+            return
+        self.last_session_key_sweep = now
+        for session_id, session_key in list(self.session_keys.items()):
+            if session_key.expired():
+                self.drop_session(session_id)
+
+    def get_session_key(self, session_id: str):
+        session_key = self.session_keys.get(session_id)
+        if session_key is not None and session_key.expired():
+            self.drop_session(session_id)
+            return None
+        return session_key
+
+    @staticmethod
+    def encrypt_hybrid(public_key, payload: bytes) -> dict:
+        data_key = AESGCM.generate_key(bit_length=256)
+        nonce = os.urandom(12)
+        ciphertext = AESGCM(data_key).encrypt(nonce, payload, None)
+        return {
+            "encrypted": b64encode(ciphertext),
+            "encrypted_key": b64encode(public_key.encrypt(data_key, OAEP_PADDING)),
+            "iv": b64encode(nonce),
+        }
+
+    def encrypt_response(
+        self,
+        data,
+        current_user: str,
+        db: Session = None,
+        session_id: str = None,
+        envelope: bool = False,
+    ) -> dict:
+        started = time.perf_counter()
+        # Callers holding pre-serialized JSON pass bytes to skip json.dumps.
+        payload = data if isinstance(data, bytes) else json.dumps(data).encode()
+
+        # Only replies to the token holding the session key pass its id;
+        # messages queued for later delivery never use a session key.
+        session_key = self.get_session_key(session_id) if session_id else None
+        if session_key is not None and session_key.username == current_user:
+            response = session_key.encrypt(payload)
+            response["kid"] = session_id
+            mode = "session"
+        else:
+            record = self.get_public_key_record(current_user)
+            public_key = self.get_public_key(current_user, record)
+            # Session mode falls back to the envelope on workers without the key;
+            # envelope=True is for payloads that may not fit in one RSA block,
+            # clients tell the formats apart by the encrypted_key field.
+            if envelope or record.encryption_mode in ("hybrid", "session"):
+                response = self.encrypt_hybrid(public_key, payload)
+                mode = "hybrid"
+            else:
+                try:
+                    encrypted = public_key.encrypt(payload, OAEP_PADDING)
+                except ValueError:
+                    raise HTTPException(
+                        status_code=406,
+                        detail="Response too large for RSA encryption; "
+                        f"log in with {ENCRYPTION_HEADER}: hybrid",
+                    )
+                response = {"encrypted": b64encode(encrypted)}
+                mode = "rsa"
+        observe(f"encrypt_response_{mode}", time.perf_counter() - started)
 
         if DEBUG_MODE:
-            print(f"[DEBUG] Odszyfrowana wiadomość dla {current_user}: {data}")
-            print(f"[DEBUG] Zaszyfrowana wiadomość dla {current_user}: {encrypted}")
+            logger.info(
+                "response_encrypted",
+                user=current_user,
+                mode=mode,
+                data=data.decode() if isinstance(data, bytes) else data,
+                encrypted=response["encrypted"],
+            )
+
+        return response
+
+    async def encrypt_response_async(self, data, current_user: str, **options) -> dict:
+        # For async handlers: with the sql key store a cache miss would run
+        # a query on the event loop.
+        if self.user_public_keys.blocking:
+            return await run_in_threadpool(
+                self.encrypt_response, data, current_user, **options
+            )
+        return self.encrypt_response(data, current_user, **options)
+
+    async def has_public_key(self, username: str) -> bool:
+        if self.user_public_keys.blocking:
+            return await run_in_threadpool(self.user_public_keys.has, username)
+        return self.user_public_keys.has(username)
 
-        return {"encrypted": encrypted}
+    def encrypt_login_response(
+        self, access_token: str, username: str, mode: str, expires_at: datetime
+    ) -> dict:
+        data = {"access_token": access_token, "token_type": "bearer"}
+        if mode != "session":
+            return self.encrypt_response(data, username)
+
+        session_id = self.session_id(access_token)
+        session_key = self.start_session(session_id, username, expires_at)
+        public_key = self.get_public_key(username)
+        response = session_key.encrypt(json.dumps(data).encode())
+        response["encrypted_key"] = b64encode(
+            public_key.encrypt(session_key.key, OAEP_PADDING)
+        )
+        response["session"] = True
+        response["kid"] = session_id
+        return response
 
     @staticmethod
-    async def validate_token(credentials):
+    def token_digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def is_token_revoked(self, digest: bytes, username: str, issued_at: int) -> bool:
+        if digest in self.revoked_tokens:
+            return True
+        # Whole seconds, like "iat": a login in the same second as the kick
+        # stays valid.
+        revoked_at = self.revoked_users.get(username)
+        return revoked_at is not None and issued_at < revoked_at
+
+    async def validate_token(self, credentials):
+        # Verified tokens are cached by digest until their exp, so repeated
+        # requests skip the JWT signature check.
+        digest = self.token_digest(credentials.credentials)
+        cached = self.token_cache.get(digest)
+        if cached is not None:
+            username, expires_at, issued_at = cached
+            if expires_at > time.time() and not self.is_token_revoked(
+                digest, username, issued_at
+            ):
+                return username
+            self.token_cache.pop(digest)
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+
         try:
             payload = decode_token(credentials.credentials)
             if not payload:
@@ -89,66 +343,102 @@ class SecurityManager:
             username: str = payload.get("sub")
             if not username:
                 raise HTTPException(status_code=401, detail="Invalid credentials")
-            return username
+            expires_at = float(payload["exp"])
+            # Tokens from before "iat" was added count as the oldest possible.
+            issued_at = int(payload.get("iat", 0))
         except Exception:
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    def register_user(self, user: UserSchema, db: Session):
-        if db.query(UserModel).filter(UserModel.username == user.username).first():
+        if self.is_token_revoked(digest, username, issued_at):
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+
+        self.token_cache.put(digest, (username, expires_at, issued_at))
+        return username
+
+    def _prune_revoked_tokens(self):
+        now = time.time()
+        for digest, expires_at in list(self.revoked_tokens.items()):
+            if expires_at <= now:
+                self.revoked_tokens.pop(digest, None)
+
+    def revoke_token(self, token: str):
+        payload = decode_token(token)
+        if not payload:
+            return
+        self._prune_revoked_tokens()
+        digest = self.token_digest(token)
+        self.revoked_tokens[digest] = float(payload["exp"])
+        self.token_cache.pop(digest)
+        self.drop_session(self.session_id(token))
+
+    def revoke_user(self, username: str):
+        # Rejects every token issued to the user before this second.
+        self.revoked_users[username] = int(time.time())
+        self.drop_user_sessions(username)
+
+    @staticmethod
+    def _find_user(username: str, db: Session):
+        return db.query(UserModel).filter(UserModel.username == username).first()
+
+    @staticmethod
+    def _save(instance, db: Session):
+        db.add(instance)
+        db.commit()
+        db.refresh(instance)
+
+    # Database calls run in the threadpool and bcrypt in its own executor,
+    # so neither blocks the event loop.
+    async def register_user(self, user: UserSchema, db: Session):
+        if await run_in_threadpool(self._find_user, user.username, db):
             raise HTTPException(status_code=400, detail="Username already registered")
 
         new_user = UserModel(
             username=user.username,
-            hashed_password=hash_password(user.password),
+            hashed_password=await hash_password_async(user.password),
             public_key=user.public_key,
         )
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await run_in_threadpool(self._save, new_user, db)
+        await run_in_threadpool(self.drop_public_key, user.username)
         return {"status": "Pomyślnie zarejestrowano użytkownika"}
 
-    async def login(self, request: Request, user: UserSchema, db: Session):
-        self.check_brute_force(request)
+    async def login(self, request: Request, user: UserSchema):
+        await self.check_brute_force(request)
 
         if not (
-            secure_compare(user.username, os.getenv("ADMIN_USERNAME"))
-            and verify_password(user.password, os.getenv("ADMIN_PASSWORD"))
+            secure_compare(user.username, settings.admin_username)
+            and await verify_password_async(user.password, settings.admin_password)
         ):
-            self.failed_attempts[request.client.host].append(time.time())
+            await self.failed_logins.record(request.client.host)
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
-        try:
-            self.user_public_keys[user.username] = user.public_key
-        except Exception as e:
-            raise HTTPException(
-                status_code=400, detail=f"Invalid public key format: {str(e)}"
-            )
-
-        access_token = create_access_token(data={"sub": user.username})
-        return self.encrypt_response(
-            {"access_token": access_token, "token_type": "bearer"}, user.username, db
+        expire = access_token_expiry()
+        mode = self.negotiate_encryption(request)
+        await run_in_threadpool(
+            self.set_public_key, user.username, user.public_key, mode
         )
 
-    def login_db(self, request: Request, user: UserLoginSchema, db: Session):
-        self.check_brute_force(request)
+        access_token = create_access_token(data={"sub": user.username}, expire=expire)
+        return self.encrypt_login_response(access_token, user.username, mode, expire)
 
-        fetched_user = db.query(UserModel).filter(UserModel.username == user.username).first()
-        if not fetched_user or not verify_password(user.password, fetched_user.hashed_password):
-            self.failed_attempts[request.client.host].append(time.time())
-            raise HTTPException(status_code=401, detail="Invalid credentials")
+    async def login_db(self, request: Request, user: UserLoginSchema, db: Session):
+        await self.check_brute_force(request)
 
-        self.user_public_keys[fetched_user.username] = fetched_user.public_key
+        fetched_user = await run_in_threadpool(self._find_user, user.username, db)
+        if not fetched_user or not await verify_password_async(
+            user.password, fetched_user.hashed_password
+        ):
+            await self.failed_logins.record(request.client.host)
+            raise HTTPException(status_code=401, detail="Invalid credentials")
 
-        access_token = create_access_token(data={"sub": fetched_user.username})
-        active_session = ActiveSessionModel(
-            username=fetched_user.username,
-            ip=request.client.host,
-            timestamp=datetime.fromtimestamp(time.time())
+        expire = access_token_expiry()
+        mode = self.negotiate_encryption(request)
+        await run_in_threadpool(
+            self.set_public_key, fetched_user.username, fetched_user.public_key, mode
         )
-        db.add(active_session)
-        db.commit()
-        db.refresh(active_session)
 
-        return self.encrypt_response(
-            {"access_token": access_token, "token_type": "bearer"}, fetched_user.username, db
+        access_token = create_access_token(
+            data={"sub": fetched_user.username}, expire=expire
+        )
+        return self.encrypt_login_response(
+            access_token, fetched_user.username, mode, expire
         )
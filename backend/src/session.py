@@ -1,10 +1,25 @@
-import secrets
+import base64
+import json
 from datetime import datetime
-from models import BroadcastTaskModel, BroadcastTaskResultModel, ActiveSessionModel
-from sqlalchemy import func, and_, Integer
+from db import SessionLocal
+from ingest import ResultIngestor
+from jobs import JobManager
+from leaderboard import Leaderboard
+from logs import get_logger
+from models import BroadcastTaskModel, BroadcastTaskResultModel
+from presence import PresenceTracker
+from sqlalchemy import func, and_, or_, select, update, insert
 from sqlalchemy.orm import Session
+import os
 import random
 
+logger = get_logger("session")
+
+TASK_POOL_INSERT_BATCH = int(os.getenv("TASK_POOL_INSERT_BATCH", 1000))
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+HISTORY_STREAM_BATCH_SIZE = 500
+
 
 class SessionManager:
     def __init__(self):
@@ -14,151 +29,281 @@ class SessionManager:
             ("*", lambda x, y: x * y, "multiply"),
             ("/", lambda x, y: x / y, "divide"),
         ]
+        self.task_listeners = []
+        self.invalidation_hook = None
+        # (payload, pre-serialized JSON) of the latest broadcast task, swapped
+        # as one tuple so readers never see a mismatched pair.
+        self._current_task = (None, None)
+        self.current_task_loaded = False
+        self.leaderboard = Leaderboard()
+        self.result_ingestor = ResultIngestor(self.leaderboard)
+        self.presence = PresenceTracker()
+        self.jobs = JobManager()
+        self.random = random.SystemRandom()
 
-    @staticmethod
-    def _generate_numbers(operation: str):
-        if operation == "/":
-            b = secrets.randbelow(9) + 1
-            a = b * (secrets.randbelow(10) + 1)
-            return a, b
-        else:
-            a = secrets.randbelow(100) + 1
-            b = secrets.randbelow(100) + 1
-            return a, b
-
-    def create_broadcast_task(self, db: Session):
-        op_symbol, op_func, op_name = random.choice(self.operations)
-        a, b = self._generate_numbers(op_symbol)
-        content = f"{op_name} {a} and {b}"
-
-        task = BroadcastTaskModel(
-            content=content,
-            a=a,
-            b=b,
-            operation=op_symbol,
-            expected_result=float(op_func(a, b))
-        )
-
-        db.add(task)
-        db.commit()
-        db.refresh(task)
-
-        return {
-            "task_id": task.id,
-            "content": content,
-            "a": a,
-            "b": b,
-            "operation": op_symbol
-        }
+    def add_task_listener(self, listener):
+        self.task_listeners.append(listener)
 
-    def get_latest_broadcast_task(self, db: Session):
-        task = db.query(BroadcastTaskModel).order_by(BroadcastTaskModel.created_at.desc()).first()
-        if not task:
-            return None
+    def set_invalidation_hook(self, hook):
+        self.invalidation_hook = hook
 
+    @staticmethod
+    def _task_payload(task: BroadcastTaskModel):
         return {
             "task_id": task.id,
             "content": task.content,
             "a": task.a,
             "b": task.b,
-            "operation": task.operation
+            "operation": task.operation,
         }
 
-    def validate_broadcast_task_result(self, task_id: int, result: float, username: str, db: Session):
-        task = db.query(BroadcastTaskModel).filter(BroadcastTaskModel.id == task_id).first()
-        if not task:
-            return {"status": "Task not found"}
+    def set_current_task(self, task):
+        self._current_task = (task, json.dumps(task).encode() if task else None)
+        self.current_task_loaded = True
 
-        existing_result = (
-            db.query(BroadcastTaskResultModel)
-            .filter(
-                BroadcastTaskResultModel.broadcast_task_id == task_id,
-                BroadcastTaskResultModel.username == username
-            )
+    def invalidate_current_task(self):
+        self.current_task_loaded = False
+
+    def load_current_task(self, db: Session):
+        task = (
+            db.query(BroadcastTaskModel)
+            .filter(BroadcastTaskModel.created_at.isnot(None))
+            .order_by(BroadcastTaskModel.created_at.desc())
             .first()
         )
+        self.set_current_task(self._task_payload(task) if task else None)
+
+    def receive_task(self, task: dict):
+        # Called for tasks created by other workers.
+        current, _ = self._current_task
+        if current and current["task_id"] == task["task_id"]:
+            return
+        self.set_current_task(task)
+        for listener in self.task_listeners:
+            listener(task)
+
+    def _get_current_task(self, db: Session = None):
+        if not self.current_task_loaded:
+            if db is None:
+                with SessionLocal() as db:
+                    self.load_current_task(db)
+            else:
+                self.load_current_task(db)
+        return self._current_task
+
+    def generate_task_rows(self, count: int) -> list:
+        # Builds whole columns at once; divisions get b in 1..9 and a as a
+        # multiple of b, so every expected result is exact.
+        operations = self.random.choices(self.operations, k=count)
+        a_values = self.random.choices(range(1, 101), k=count)
+        b_values = self.random.choices(range(1, 101), k=count)
+        divisors = self.random.choices(range(1, 10), k=count)
+        multipliers = self.random.choices(range(1, 11), k=count)
+
+        rows = []
+        for (op_symbol, op_func, op_name), a, b, divisor, multiplier in zip(
+            operations, a_values, b_values, divisors, multipliers
+        ):
+            if op_symbol == "/":
+                a, b = divisor * multiplier, divisor
+            rows.append(
+                {
+                    "content": f"{op_name} {a} and {b}",
+                    "a": a,
+                    "b": b,
+                    "operation": op_symbol,
+                    "expected_result": float(op_func(a, b)),
+                    # Pooled tasks get created_at when they are broadcast.
+                    "created_at": None,
+                }
+            )
+        return rows
 
-        if existing_result:
-            return {"status": "Task already submitted"}
+    def enqueue_tasks(self, db: Session, count: int) -> int:
+        # Core insert: the ORM bulk path would fill created_at from its default.
+        tasks = BroadcastTaskModel.__table__
+        rows = self.generate_task_rows(count)
+        for start in range(0, count, TASK_POOL_INSERT_BATCH):
+            db.execute(insert(tasks), rows[start : start + TASK_POOL_INSERT_BATCH])
+        db.commit()
+        return count
 
-        is_correct = abs(result - task.expected_result) < 0.0001
-        task_result = BroadcastTaskResultModel(
-            broadcast_task_id=task_id,
-            username=username,
-            answer=result,
-            is_correct=is_correct
+    @staticmethod
+    def pooled_task_count(db: Session) -> int:
+        return (
+            db.query(func.count(BroadcastTaskModel.id))
+            .filter(BroadcastTaskModel.created_at.is_(None))
+            .scalar()
         )
 
-        db.add(task_result)
+    @staticmethod
+    def _take_pooled_task(db: Session):
+        # SKIP LOCKED lets several workers broadcast from the pool at once.
+        pooled = (
+            select(BroadcastTaskModel.id)
+            .where(BroadcastTaskModel.created_at.is_(None))
+            .order_by(BroadcastTaskModel.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        task = db.execute(
+            update(BroadcastTaskModel)
+            .where(BroadcastTaskModel.id == pooled)
+            .values(created_at=datetime.utcnow())
+            .returning(BroadcastTaskModel),
+            execution_options={"synchronize_session": False},
+        ).scalar_one_or_none()
         db.commit()
+        return task
+
+    def create_broadcast_task(self, db: Session, refill: int = 0):
+        # Broadcasts the oldest pooled task; with refill an empty pool is
+        # topped up in bulk first, otherwise a single task is generated.
+        task = self._take_pooled_task(db)
+        if task is None and refill:
+            self.enqueue_tasks(db, refill)
+            task = self._take_pooled_task(db)
+        pooled = task is not None
+        if task is None:
+            row = self.generate_task_rows(1)[0]
+            row["created_at"] = datetime.utcnow()
+            task = BroadcastTaskModel(**row)
+            db.add(task)
+            db.commit()
+            db.refresh(task)
+
+        payload = self._task_payload(task)
+        self.set_current_task(payload)
+        for listener in self.task_listeners:
+            listener(payload)
+        if self.invalidation_hook:
+            self.invalidation_hook(payload)
 
+        logger.info("broadcast_task_created", task_id=task.id, pooled=pooled)
+        return payload
+
+    def get_latest_broadcast_task(self, db: Session = None):
+        return self._get_current_task(db)[0]
+
+    def get_latest_broadcast_task_json(self, db: Session = None):
+        return self._get_current_task(db)[1]
+
+    def get_latest_broadcast_task_entry(self, db: Session = None):
+        # (payload, pre-serialized JSON) as one consistent pair.
+        return self._get_current_task(db)
+
+    def validate_broadcast_task_result(
+        self, task_id: int, result: float, username: str, db: Session = None
+    ):
+        return self.result_ingestor.submit(task_id, result, username, db)
+
+    @staticmethod
+    def _history_row(task: BroadcastTaskModel):
         return {
-            "status": "Result submitted successfully",
-            "is_correct": is_correct,
-            "task_id": task_id
+            "id": task.id,
+            "content": task.content,
+            "a": task.a,
+            "b": task.b,
+            "operation": task.operation,
+            "expected_result": task.expected_result,
+            "created_at": task.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "total_submissions": task.total_submissions,
+            "correct_count": task.correct_count,
+            "incorrect_count": task.incorrect_count,
+            "accuracy": round(
+                task.correct_count / max(task.total_submissions, 1) * 100, 2
+            ),
         }
 
-    def get_broadcast_tasks_history(self, db: Session):
-        # Query to get task details with result counts
-        tasks = db.query(
-            BroadcastTaskModel.id,
-            BroadcastTaskModel.content,
-            BroadcastTaskModel.a,
-            BroadcastTaskModel.b,
-            BroadcastTaskModel.operation,
-            BroadcastTaskModel.expected_result,
-            BroadcastTaskModel.created_at,
-            func.count(BroadcastTaskResultModel.id).label('total_submissions'),
-            func.sum(func.cast(BroadcastTaskResultModel.is_correct, Integer)).label('correct_count'),
-            func.sum(func.cast(BroadcastTaskResultModel.is_correct == False, Integer)).label('incorrect_count')
-        ).outerjoin(
-            BroadcastTaskResultModel,
-            BroadcastTaskModel.id == BroadcastTaskResultModel.broadcast_task_id
-        ).group_by(BroadcastTaskModel.id).order_by(BroadcastTaskModel.created_at.desc()).all()
-
-        # Format the results
-        history = []
-        for task in tasks:
-            history.append({
-                "id": task.id,
-                "content": task.content,
-                "a": task.a,
-                "b": task.b,
-                "operation": task.operation,
-                "expected_result": task.expected_result,
-                "created_at": task.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                "total_submissions": task.total_submissions,
-                "correct_count": task.correct_count or 0,
-                "incorrect_count": task.incorrect_count or 0,
-                "accuracy": round((task.correct_count or 0) / max(task.total_submissions, 1) * 100, 2)
-            })
-
-        return history
+    @staticmethod
+    def encode_history_cursor(task: BroadcastTaskModel) -> str:
+        return base64.urlsafe_b64encode(
+            f"{task.created_at.isoformat()}|{task.id}".encode()
+        ).decode()
 
     @staticmethod
-    def list_active_sessions(db: Session):
-        subquery = (
-            db.query(
-                ActiveSessionModel.username,
-                func.max(ActiveSessionModel.timestamp).label(
-                    "latest_timestamp")
+    def decode_history_cursor(cursor: str):
+        try:
+            created_at, task_id = (
+                base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
             )
-            .group_by(ActiveSessionModel.username)
-            .subquery()
-        )
+            return datetime.fromisoformat(created_at), int(task_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("Invalid cursor")
 
-        latest_sessions = (
-            db.query(ActiveSessionModel)
-            .join(
-                subquery,
-                and_(
-                    ActiveSessionModel.username == subquery.c.username,
-                    ActiveSessionModel.timestamp == subquery.c.latest_timestamp,
+    def get_broadcast_tasks_history(
+        self, db: Session, limit: int = HISTORY_PAGE_SIZE, cursor: str = None
+    ):
+        # Keyset pagination on (created_at, id), newest first; result counts
+        # are kept on the task row as results are accepted
+        query = db.query(BroadcastTaskModel).filter(
+            BroadcastTaskModel.created_at.isnot(None)
+        )
+        if cursor:
+            created_at, task_id = self.decode_history_cursor(cursor)
+            query = query.filter(
+                or_(
+                    BroadcastTaskModel.created_at < created_at,
+                    and_(
+                        BroadcastTaskModel.created_at == created_at,
+                        BroadcastTaskModel.id < task_id,
+                    ),
                 )
             )
+
+        tasks = (
+            query.order_by(
+                BroadcastTaskModel.created_at.desc(), BroadcastTaskModel.id.desc()
+            )
+            .limit(limit + 1)
             .all()
         )
+        page = tasks[:limit]
+
+        return {
+            "items": [self._history_row(task) for task in page],
+            "next_cursor": (
+                self.encode_history_cursor(page[-1]) if len(tasks) > limit else None
+            ),
+        }
+
+    def stream_broadcast_tasks_history(self):
+        # Uses its own session: the request's session is closed before a
+        # streaming response is sent. yield_per reads through a server-side cursor.
+        with SessionLocal() as db:
+            tasks = db.execute(
+                select(BroadcastTaskModel)
+                .where(BroadcastTaskModel.created_at.isnot(None))
+                .order_by(
+                    BroadcastTaskModel.created_at.desc(), BroadcastTaskModel.id.desc()
+                )
+                .execution_options(yield_per=HISTORY_STREAM_BATCH_SIZE)
+            ).scalars()
+            for task in tasks:
+                yield json.dumps(self._history_row(task)) + "\n"
+
+    @staticmethod
+    def backfill_broadcast_task_stats(db: Session):
+        results = BroadcastTaskResultModel
 
-        print(latest_sessions)
+        def count_results(*criteria):
+            return (
+                select(func.count(results.id))
+                .where(results.broadcast_task_id == BroadcastTaskModel.id, *criteria)
+                .scalar_subquery()
+            )
+
+        updated = db.execute(
+            update(BroadcastTaskModel).values(
+                total_submissions=count_results(),
+                correct_count=count_results(results.is_correct.is_(True)),
+                incorrect_count=count_results(results.is_correct.is_(False)),
+            ),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        db.commit()
+        return updated
 
-        return latest_sessions
+    def list_active_sessions(self):
+        return self.presence.active_sessions()
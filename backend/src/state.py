@@ -0,0 +1,299 @@
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, insert, select
+
+from db import SessionLocal, dialect_insert
+from models import InboxMessageModel, PublicKeyModel
+
+load_dotenv()
+
+# "memory" keeps inboxes and public keys in the process, "sql" shares them
+# between uvicorn workers through the database.
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+
+INBOX_MAX_MESSAGES = int(os.getenv("INBOX_MAX_MESSAGES", 100))
+# "drop_oldest" makes room for the new message, "reject" refuses it.
+INBOX_OVERFLOW_POLICY = os.getenv("INBOX_OVERFLOW_POLICY", "drop_oldest")
+INBOX_MESSAGE_TTL_SECONDS = float(os.getenv("INBOX_MESSAGE_TTL_SECONDS", 3600))
+INBOX_POLL_INTERVAL_SECONDS = float(os.getenv("INBOX_POLL_INTERVAL_SECONDS", 0.5))
+INBOX_SWEEP_SECONDS = 60
+KEY_STORE_CACHE_SECONDS = float(os.getenv("KEY_STORE_CACHE_SECONDS", 2))
+
+
+class PublicKeyRecord:
+    def __init__(self, public_key: str, fingerprint: str, encryption_mode: str = None):
+        self.public_key = public_key
+        self.fingerprint = fingerprint
+        self.encryption_mode = encryption_mode
+
+
+class InMemoryMessageStore:
+    # Calls never block, so long-polls wait on the in-process condition only.
+    blocking = False
+    poll_interval = None
+
+    def __init__(
+        self,
+        max_messages: int = INBOX_MAX_MESSAGES,
+        overflow_policy: str = INBOX_OVERFLOW_POLICY,
+        ttl_seconds: float = INBOX_MESSAGE_TTL_SECONDS,
+    ):
+        self.max_messages = max_messages
+        self.overflow_policy = overflow_policy
+        self.ttl_seconds = ttl_seconds
+        # user -> deque of (expires_at, encrypted message), oldest first
+        self.inboxes = {}
+
+    @staticmethod
+    def _drop_expired(inbox: deque):
+        now = time.monotonic()
+        while inbox and inbox[0][0] <= now:
+            inbox.popleft()
+
+    def append_many(self, messages: list) -> list:
+        # Returns one flag per (recipient, encrypted) pair, False if rejected.
+        accepted = []
+        expires_at = time.monotonic() + self.ttl_seconds
+        for recipient, encrypted in messages:
+            inbox = self.inboxes.get(recipient)
+            if inbox is None:
+                inbox = self.inboxes[recipient] = deque()
+            self._drop_expired(inbox)
+
+            if len(inbox) >= self.max_messages:
+                if self.overflow_policy == "reject":
+                    accepted.append(False)
+                    continue
+                inbox.popleft()
+
+            inbox.append((expires_at, encrypted))
+            accepted.append(True)
+        return accepted
+
+    def append(self, recipient: str, encrypted: dict) -> bool:
+        return self.append_many([(recipient, encrypted)])[0]
+
+    def take(self, recipient: str, limit: int) -> list:
+        inbox = self.inboxes.get(recipient)
+        if not inbox:
+            return []
+        self._drop_expired(inbox)
+
+        messages = []
+        while inbox and len(messages) < limit:
+            messages.append(inbox.popleft()[1])
+        if not inbox:
+            self.inboxes.pop(recipient, None)
+        return messages
+
+    def has_messages(self, recipient: str) -> bool:
+        return bool(self.inboxes.get(recipient))
+
+
+class SqlMessageStore:
+    # Messages from other workers are only seen by polling the table.
+    blocking = True
+    poll_interval = INBOX_POLL_INTERVAL_SECONDS
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        max_messages: int = INBOX_MAX_MESSAGES,
+        overflow_policy: str = INBOX_OVERFLOW_POLICY,
+        ttl_seconds: float = INBOX_MESSAGE_TTL_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.max_messages = max_messages
+        self.overflow_policy = overflow_policy
+        self.ttl_seconds = ttl_seconds
+        self.last_sweep = 0.0
+
+    def _sweep_expired(self, db, now: datetime):
+        if time.time() - self.last_sweep < INBOX_SWEEP_SECONDS:
+            return
+        self.last_sweep = time.time()
+        db.execute(delete(InboxMessageModel).where(InboxMessageModel.expires_at <= now))
+
+    @staticmethod
+    def _count(db, recipients: set, now: datetime) -> dict:
+        return dict(
+            db.query(InboxMessageModel.recipient, func.count())
+            .filter(
+                InboxMessageModel.recipient.in_(recipients),
+                InboxMessageModel.expires_at > now,
+            )
+            .group_by(InboxMessageModel.recipient)
+            .all()
+        )
+
+    def _trim(self, db, recipient: str):
+        keep = (
+            select(InboxMessageModel.id)
+            .where(InboxMessageModel.recipient == recipient)
+            .order_by(InboxMessageModel.id.desc())
+            .limit(self.max_messages)
+        )
+        db.execute(
+            delete(InboxMessageModel).where(
+                InboxMessageModel.recipient == recipient,
+                InboxMessageModel.id.not_in(keep),
+            )
+        )
+
+    def append_many(self, messages: list) -> list:
+        # All accepted messages go into the table with one INSERT.
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl_seconds)
+        accepted = []
+        rows = []
+        with self.session_factory() as db:
+            self._sweep_expired(db, now)
+            counts = self._count(db, {recipient for recipient, _ in messages}, now)
+
+            for recipient, encrypted in messages:
+                count = counts.get(recipient, 0)
+                if count >= self.max_messages and self.overflow_policy == "reject":
+                    accepted.append(False)
+                    continue
+                counts[recipient] = count + 1
+                rows.append(
+                    {
+                        "recipient": recipient,
+                        "payload": json.dumps(encrypted),
+                        "created_at": now,
+                        "expires_at": expires_at,
+                    }
+                )
+                accepted.append(True)
+
+            if rows:
+                db.execute(insert(InboxMessageModel), rows)
+                for recipient, count in counts.items():
+                    if count > self.max_messages:
+                        self._trim(db, recipient)
+            db.commit()
+        return accepted
+
+    def append(self, recipient: str, encrypted: dict) -> bool:
+        return self.append_many([(recipient, encrypted)])[0]
+
+    def take(self, recipient: str, limit: int) -> list:
+        # SKIP LOCKED lets workers polling the same inbox never hand out
+        # a message twice.
+        batch = (
+            select(InboxMessageModel.id)
+            .where(
+                InboxMessageModel.recipient == recipient,
+                InboxMessageModel.expires_at > datetime.utcnow(),
+            )
+            .order_by(InboxMessageModel.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        with self.session_factory() as db:
+            rows = db.execute(
+                delete(InboxMessageModel)
+                .where(InboxMessageModel.id.in_(batch))
+                .returning(InboxMessageModel.id, InboxMessageModel.payload)
+                .execution_options(synchronize_session=False)
+            ).all()
+            db.commit()
+        return [json.loads(payload) for _, payload in sorted(rows)]
+
+
+class InMemoryKeyStore:
+    blocking = False
+
+    def __init__(self):
+        self.keys = {}
+
+    def get(self, username: str):
+        return self.keys.get(username)
+
+    def set(self, username: str, record: PublicKeyRecord):
+        self.keys[username] = record
+
+    def pop(self, username: str):
+        self.keys.pop(username, None)
+
+    def has(self, username: str) -> bool:
+        return username in self.keys
+
+
+class SqlKeyStore:
+    # Reads are cached for KEY_STORE_CACHE_SECONDS, so a key replaced on
+    # another worker is picked up within that window. A miss queries the
+    # database, so async callers go through a thread.
+    blocking = True
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        cache_seconds: float = KEY_STORE_CACHE_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.cache_seconds = cache_seconds
+        self.cache = {}
+
+    def get(self, username: str):
+        cached = self.cache.get(username)
+        if cached is not None and time.monotonic() - cached[0] < self.cache_seconds:
+            return cached[1]
+
+        with self.session_factory() as db:
+            row = db.get(PublicKeyModel, username)
+            record = (
+                PublicKeyRecord(row.public_key, row.fingerprint, row.encryption_mode)
+                if row
+                else None
+            )
+        self.cache[username] = (time.monotonic(), record)
+        return record
+
+    def set(self, username: str, record: PublicKeyRecord):
+        values = {
+            "public_key": record.public_key,
+            "fingerprint": record.fingerprint,
+            "encryption_mode": record.encryption_mode,
+            "updated_at": datetime.utcnow(),
+        }
+        with self.session_factory() as db:
+            db.execute(
+                dialect_insert(PublicKeyModel)
+                .values(username=username, **values)
+                .on_conflict_do_update(index_elements=["username"], set_=values)
+            )
+            db.commit()
+        self.cache[username] = (time.monotonic(), record)
+
+    def pop(self, username: str):
+        with self.session_factory() as db:
+            db.execute(
+                delete(PublicKeyModel).where(PublicKeyModel.username == username)
+            )
+            db.commit()
+        self.cache.pop(username, None)
+
+    def has(self, username: str) -> bool:
+        return self.get(username) is not None
+
+
+def create_message_store():
+    if STATE_BACKEND == "sql":
+        return SqlMessageStore()
+    if STATE_BACKEND == "memory":
+        return InMemoryMessageStore()
+    raise ValueError(f"Unknown STATE_BACKEND: {STATE_BACKEND}")
+
+
+def create_key_store():
+    if STATE_BACKEND == "sql":
+        return SqlKeyStore()
+    if STATE_BACKEND == "memory":
+        return InMemoryKeyStore()
+    raise ValueError(f"Unknown STATE_BACKEND: {STATE_BACKEND}")
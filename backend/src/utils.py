@@ -1,33 +1,70 @@
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import os
 from dotenv import load_dotenv
 import secrets
+from config import settings
+from metrics import timed
 
 load_dotenv()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Cost factor of new hashes; existing hashes keep verifying at their own cost.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+)
+
+# bcrypt releases the GIL, so a small dedicated pool keeps logins off the
+# event loop without letting a login storm take over the default threadpool.
+bcrypt_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BCRYPT_WORKERS", os.cpu_count() or 2)),
+    thread_name_prefix="bcrypt",
+)
 
 
 def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
+    with timed("password_verify"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 
 def hash_password(password: str):
-    return pwd_context.hash(password)
+    with timed("password_hash"):
+        return pwd_context.hash(password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str):
+    return await asyncio.get_running_loop().run_in_executor(
+        bcrypt_executor, verify_password, plain_password, hashed_password
+    )
+
+
+async def hash_password_async(password: str):
+    return await asyncio.get_running_loop().run_in_executor(
+        bcrypt_executor, hash_password, password
+    )
+
+
+def access_token_expiry() -> datetime:
+    return datetime.utcnow() + timedelta(minutes=settings.jwt_expire_minutes)
 
 
-def create_access_token(data: dict):
+def create_access_token(data: dict, expire: datetime = None):
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(
-        minutes=int(os.getenv("JWT_EXPIRE_MINUTES", 30))
+    if expire is None:
+        expire = access_token_expiry()
+    # "iat" dates the token for revoke_user; the random id keeps two logins
+    # within the same second apart, as session keys are looked up by token.
+    to_encode.update(
+        {"exp": expire, "iat": datetime.utcnow(), "jti": secrets.token_urlsafe(6)}
     )
-    to_encode.update({"exp": expire})
     return jwt.encode(
         to_encode,
-        os.getenv("JWT_SECRET_KEY"),
-        algorithm=os.getenv("JWT_ALGORITHM", "HS256"),
+        settings.jwt_secret_key,
+        algorithm=settings.jwt_algorithm,
     )
 
 
@@ -35,8 +72,8 @@ def decode_token(token: str):
     try:
         return jwt.decode(
             token,
-            os.getenv("JWT_SECRET_KEY"),
-            algorithms=[os.getenv("JWT_ALGORITHM", "HS256")],
+            settings.jwt_secret_key,
+            algorithms=[settings.jwt_algorithm],
         )
     except JWTError:
         return None
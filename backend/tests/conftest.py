@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+
+# Modules in src import each other by bare name (e.g. "from db import Base").
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+# A file rather than sqlite://: requests under TestClient query from other
+# threads, and an in-memory database is private to each thread.
+os.environ.setdefault("DB_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret")
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from db import Base, engine, SessionLocal
+
+
+@pytest.fixture
+def db():
+    # Fresh tables for every test that asks for a session.
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+def _generate_key_pair():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_key_pem = (
+        private_key.public_key()
+        .public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        .decode()
+    )
+    return private_key, public_key_pem
+
+
+@pytest.fixture
+def make_key_pair():
+    # Each call returns a new (private key, public key PEM) pair.
+    return _generate_key_pair
+
+
+@pytest.fixture
+def make_public_key_pem():
+    return lambda: _generate_key_pair()[1]
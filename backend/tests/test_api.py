@@ -0,0 +1,135 @@
+import base64
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from fastapi.testclient import TestClient
+
+import main
+import utils
+from models import UserModel
+from security import OAEP_PADDING
+from utils import create_access_token
+
+
+@pytest.fixture
+def client(db):
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def miner(make_public_key_pem):
+    main.security_manager.set_public_key("miner", make_public_key_pem())
+    yield {"Authorization": f"Bearer {create_access_token({'sub': 'miner'})}"}
+    main.security_manager.drop_public_key("miner")
+
+
+def test_task_polls_skip_unchanged_task(db, client, miner):
+    task = main.session_manager.create_broadcast_task(db)
+
+    response = client.get("/task", headers=miner)
+    assert response.status_code == 200
+    assert "encrypted" in response.json()
+    etag = response.headers["ETag"]
+    assert etag == f'W/"task-{task["task_id"]}"'
+
+    current = client.get("/task", params={"since_task_id": task["task_id"]}, headers=miner)
+    assert current.status_code == 204
+    assert current.headers["ETag"] == etag
+    stale = client.get("/task", params={"since_task_id": task["task_id"] - 1}, headers=miner)
+    assert stale.status_code == 200
+    assert "encrypted" in stale.json()
+
+    unchanged = client.get("/task", headers={**miner, "If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+
+    newer = main.session_manager.create_broadcast_task(db)
+    changed = client.get("/task", headers={**miner, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] == f'W/"task-{newer["task_id"]}"' != etag
+
+
+def test_register_and_login_hash_on_bcrypt_executor(
+    db, client, monkeypatch, make_public_key_pem
+):
+    threads = []
+    for name in ("hash_password", "verify_password"):
+        original = getattr(utils, name)
+
+        def recorded(*args, original=original):
+            threads.append(threading.current_thread().name)
+            return original(*args)
+
+        monkeypatch.setattr(utils, name, recorded)
+
+    user = {"username": "hasher", "password": "pw", "public_key": make_public_key_pem()}
+    assert client.post("/register", json=user).status_code == 200
+    stored = db.query(UserModel).filter_by(username="hasher").one().hashed_password
+    assert stored.startswith(f"$2b${utils.BCRYPT_ROUNDS:02d}$")
+
+    login = {"username": "hasher", "password": "pw"}
+    hybrid = {"X-Encryption": "hybrid"}
+    assert client.post("/login-db", json=login, headers=hybrid).status_code == 200
+    main.security_manager.drop_public_key("hasher")
+    wrong = client.post("/login-db", json={**login, "password": "nope"})
+    assert wrong.status_code == 401
+
+    assert len(threads) == 3
+    assert all(name.startswith("bcrypt") for name in threads)
+
+
+def test_bcrypt_rounds_setting_sets_the_hash_cost():
+    # Read once at import, so it is checked in a fresh interpreter.
+    src = os.path.dirname(utils.__file__)
+    stored = subprocess.run(
+        [sys.executable, "-c", "import utils; print(utils.hash_password('pw'))"],
+        cwd=src,
+        env={**os.environ, "BCRYPT_ROUNDS": "5"},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+    assert stored.startswith("$2b$05$")
+    assert utils.verify_password("pw", stored)
+
+
+def test_each_session_login_gets_its_own_key(db, client, make_key_pair):
+    private_key, public_key_pem = make_key_pair()
+    user = {"username": "tabs", "password": "pw", "public_key": public_key_pem}
+    assert client.post("/register", json=user).status_code == 200
+    main.session_manager.create_broadcast_task(db)
+
+    def decrypt(response, key):
+        return json.loads(
+            AESGCM(key).decrypt(
+                base64.b64decode(response["iv"]),
+                base64.b64decode(response["encrypted"]),
+                None,
+            )
+        )
+
+    # Two tabs or machines on one account, both logged in before either polls.
+    logins = []
+    for _ in range(2):
+        response = client.post(
+            "/login-db",
+            json={"username": "tabs", "password": "pw"},
+            headers={"X-Encryption": "session"},
+        ).json()
+        key = private_key.decrypt(base64.b64decode(response["encrypted_key"]), OAEP_PADDING)
+        logins.append((decrypt(response, key)["access_token"], key, response["kid"]))
+    assert logins[0][2] != logins[1][2]
+
+    try:
+        for token, key, kid in logins:
+            task = client.get("/task", headers={"Authorization": f"Bearer {token}"}).json()
+            assert task["kid"] == kid
+            assert "task_id" in decrypt(task, key)
+    finally:
+        main.security_manager.drop_public_key("tabs")
+    assert main.security_manager.session_keys == {}
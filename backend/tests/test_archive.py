@@ -0,0 +1,48 @@
+import csv
+import io
+from datetime import datetime, timedelta
+
+import archive
+from archive import ResultArchiver
+from models import BroadcastTaskModel, BroadcastTaskResultModel
+
+
+def export(archiver: ResultArchiver, table: str, start=None, end=None) -> list:
+    rows = list(csv.reader(io.StringIO("".join(archiver.export(table, start, end)))))
+    return rows[1:]
+
+
+def test_archive_moves_old_tasks_and_export_reads_both(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_CHUNK_SIZE", 2)
+    monkeypatch.setattr(archive, "RESULT_TASK_CACHE_SIZE", 2)
+    now = datetime.utcnow()
+    days = [40, 35, 31, 30.5, 20, 0]
+    tasks = [
+        BroadcastTaskModel(content=f"t{i}", created_at=now - timedelta(days=age))
+        for i, age in enumerate(days)
+    ]
+    db.add_all(tasks)
+    db.commit()
+    for task in tasks:
+        db.add(BroadcastTaskResultModel(broadcast_task_id=task.id, username="m1", answer=1))
+        db.add(BroadcastTaskResultModel(broadcast_task_id=task.id, username="m2", answer=2))
+    db.commit()
+    task_ids = [str(task.id) for task in tasks]
+
+    archiver = ResultArchiver(str(tmp_path))
+    assert archiver.archive(older_than_days=30) == {"tasks": 4, "chunks": 2}
+    assert len(list(tmp_path.glob("*.csv.gz"))) == 4
+    assert db.query(BroadcastTaskModel).count() == 2
+    assert db.query(BroadcastTaskResultModel).count() == 4
+
+    # The newest tasks stay hot even when they are past the retention age.
+    assert archiver.archive(older_than_days=0) == {"tasks": 0, "chunks": 0}
+
+    assert [row[1] for row in export(archiver, "tasks")] == [f"t{i}" for i in range(6)]
+    assert len(export(archiver, "results")) == 12
+
+    # The range cuts through the first chunk and ends in the hot tables.
+    start, end = now - timedelta(days=36), now - timedelta(days=1)
+    assert [row[1] for row in export(archiver, "tasks", start, end)] == ["t1", "t2", "t3", "t4"]
+    results = export(archiver, "results", start, end)
+    assert len(results) == 8 and {row[1] for row in results} == set(task_ids[1:5])
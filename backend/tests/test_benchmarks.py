@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+
+
+def run_benchmark(script: str, output: str, *args):
+    # Separate process: the benchmarks configure the environment before
+    # importing the backend.
+    subprocess.run(
+        [sys.executable, os.path.join(BENCHMARKS_DIR, script), "--output", output, *args],
+        check=True,
+        capture_output=True,
+        timeout=300,
+    )
+    with open(output) as f:
+        return json.load(f)
+
+
+# Port 0 lets the OS pick a free port, so parallel runs never collide.
+@pytest.mark.parametrize("transport", [[], ["--uvicorn", "--port", "0"]])
+def test_bench_api_smoke(tmp_path, transport):
+    results = run_benchmark(
+        "bench_api.py",
+        str(tmp_path / "api.json"),
+        "--miners", "2", "--rounds", "1", "--key-size", "1024",
+        *transport,
+    )
+
+    assert results["summary"]["errors"] == 0
+    assert "GET /task" in results["endpoints"]
+    assert results["endpoints"]["POST /get-message"]["count"] == 2
+
+
+def test_bench_micro_smoke(tmp_path):
+    results = run_benchmark(
+        "bench_micro.py",
+        str(tmp_path / "micro.json"),
+        "--repeat", "3", "--addresses", "10", "--history-rows", "200",
+    )
+
+    assert results["meta"]["parameters"]["repeat"] == 3
+    assert "encrypt_response session" in results["benchmarks"]
+    assert "history page at middle 200 rows" in results["benchmarks"]
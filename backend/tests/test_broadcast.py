@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+import main
+from broadcast import TaskBroadcaster
+from utils import create_access_token
+
+
+async def open_stream(request, username: str):
+    credentials = HTTPAuthorizationCredentials(
+        scheme="Bearer", credentials=create_access_token({"sub": username})
+    )
+    return await main.stream_tasks(request, username, None, credentials)
+
+
+class FakeRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def test_slow_subscriber_keeps_only_the_latest_task():
+    broadcaster = TaskBroadcaster()
+
+    async def scenario():
+        queue = broadcaster.subscribe("miner")
+        for task_id in (1, 2, 3):
+            broadcaster.publish({"task_id": task_id})
+        await asyncio.sleep(0)
+        latest = queue.get_nowait()
+
+        broadcaster.unsubscribe(queue)
+        broadcaster.publish({"task_id": 4})
+        await asyncio.sleep(0)
+        return latest, queue.empty()
+
+    assert asyncio.run(scenario()) == ({"task_id": 3}, True)
+    assert broadcaster.connected_users() == 0
+
+
+def test_stream_fans_out_and_unsubscribes_on_disconnect(monkeypatch, make_public_key_pem):
+    monkeypatch.setattr(main, "TASK_STREAM_KEEPALIVE_SECONDS", 0.05)
+    broadcaster = main.task_broadcaster
+    users = ("m1", "m2")
+    for user in users:
+        main.security_manager.set_public_key(user, make_public_key_pem())
+
+    async def scenario():
+        requests = [FakeRequest() for _ in users]
+        streams = [
+            (await open_stream(request, user)).body_iterator
+            for request, user in zip(requests, users)
+        ]
+        assert broadcaster.connected_users() == 2
+
+        # The scheduler and the notifier publish from worker threads.
+        await asyncio.to_thread(broadcaster.publish, {"task_id": 7, "content": "add 1 and 2"})
+        events = [await anext(stream) for stream in streams]
+
+        for request in requests:
+            request.disconnected = True
+        leftovers = [[event async for event in stream] for stream in streams]
+        return events, leftovers
+
+    try:
+        events, leftovers = asyncio.run(scenario())
+    finally:
+        for user in users:
+            main.security_manager.drop_public_key(user)
+
+    assert all(event.startswith("event: task\ndata: ") for event in events)
+    assert leftovers == [[], []]
+    assert broadcaster.subscribers == {}
+
+
+def test_stream_closes_once_the_user_is_revoked(monkeypatch):
+    monkeypatch.setattr(main, "TASK_STREAM_KEEPALIVE_SECONDS", 0.05)
+
+    async def scenario():
+        stream = (await open_stream(FakeRequest(), "kicked")).body_iterator
+        assert await anext(stream) == ": keep-alive\n\n"
+        # Revocation covers tokens issued before the current second.
+        main.security_manager.revoked_users["kicked"] = int(time.time()) + 1
+        return [event async for event in stream]
+
+    try:
+        assert asyncio.run(scenario()) == []
+    finally:
+        main.security_manager.revoked_users.pop("kicked", None)
+    assert main.task_broadcaster.subscribers == {}
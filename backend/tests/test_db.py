@@ -0,0 +1,72 @@
+import sqlite3
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+import db as db_module
+from db import TimedQueuePool, engine, get_pool_stats, pool_stats
+
+
+def make_pool(timeout: float) -> TimedQueuePool:
+    return TimedQueuePool(
+        lambda: sqlite3.connect(":memory:", check_same_thread=False),
+        pool_size=1,
+        max_overflow=0,
+        timeout=timeout,
+    )
+
+
+def test_postgres_engine_options(monkeypatch):
+    monkeypatch.setattr(db_module, "DB_STATEMENT_TIMEOUT_MS", 5000)
+    options = db_module._engine_options(make_url("postgresql://miner@localhost/mining"))
+    assert options["poolclass"] is TimedQueuePool
+    assert options["pool_size"] == db_module.DB_POOL_SIZE
+    assert options["max_overflow"] == db_module.DB_MAX_OVERFLOW
+    assert options["connect_args"] == {"options": "-c statement_timeout=5000"}
+
+    assert "poolclass" not in db_module._engine_options(make_url("sqlite:///mining.db"))
+
+
+def test_unsupported_database_is_rejected_at_startup():
+    with pytest.raises(ValueError, match="Unsupported DB_URL database 'mysql'"):
+        db_module._engine_options(make_url("mysql+pymysql://miner@localhost/mining"))
+
+
+def test_only_blocked_checkouts_count_as_waits():
+    pool = make_pool(timeout=1)
+    waits = pool_stats.waits
+
+    pool.connect().close()
+    held = pool.connect()
+    assert pool_stats.waits == waits
+
+    threading.Timer(0.05, held.close).start()
+    pool.connect().close()
+    assert pool_stats.waits == waits + 1
+    assert pool_stats.wait_seconds_max >= 0.04
+
+
+def test_checkout_timeout_is_recorded():
+    pool = make_pool(timeout=0.05)
+    timeouts = pool_stats.timeouts
+    held = pool.connect()
+
+    with pytest.raises(PoolTimeoutError):
+        pool.connect()
+    held.close()
+    assert pool_stats.timeouts == timeouts + 1
+
+
+def test_pool_stats_report_checkouts():
+    checkouts = get_pool_stats()["checkouts"]
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+    stats = get_pool_stats()
+    assert stats["checkouts"] == checkouts + 1
+    assert stats["pool"] == type(engine.pool).__name__
+    # The test database is a file, served by a QueuePool.
+    assert {"size", "checked_out", "waits", "timeouts"} <= set(stats)
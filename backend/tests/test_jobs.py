@@ -0,0 +1,118 @@
+import pytest
+
+from jobs import JobManager, nonce_hash
+
+
+def solve(params: dict) -> float:
+    if "operation" in params:
+        operations = {
+            "+": lambda a, b: a + b,
+            "-": lambda a, b: a - b,
+            "*": lambda a, b: a * b,
+            "/": lambda a, b: a / b,
+        }
+        operation = operations[params["operation"]]
+        return sum(
+            operation(a, b)
+            for a in range(params["a_start"], params["a_end"])
+            for b in range(params["b_start"], params["b_end"])
+        )
+    for nonce in range(params["nonce_start"], params["nonce_end"]):
+        if nonce_hash(params["prefix"], nonce).startswith("0" * params["difficulty"]):
+            return nonce
+    return -1
+
+
+@pytest.mark.parametrize("operation", ["+", "-", "*", "/"])
+def test_units_are_leased_once_and_verified(db, operation):
+    manager = JobManager()
+    params = {"operation": operation, "a_start": -5, "a_end": 20, "b_start": 1, "b_end": 9}
+    job = manager.create_job(db, "range", "operand_range", params, unit_size=4)
+    assert job["total_units"] == 7
+
+    first = manager.lease("m1", db)
+    second = manager.lease("m2", db)
+    assert first["task_id"] != second["task_id"]
+    # Polling again returns the lease the miner already holds.
+    assert manager.lease("m1", db)["task_id"] == first["task_id"]
+
+    assert manager.submit(first["task_id"], 0.5, "m2", db)["status"] == "Lease not held"
+    assert manager.submit(first["task_id"], 0.5, "m1", db)["is_correct"] is False
+
+    miners = ["m1", "m2"]
+    while True:
+        units = [(miner, manager.lease(miner, db)) for miner in miners]
+        units = [(miner, unit) for miner, unit in units if unit]
+        if not units:
+            break
+        for miner, unit in units:
+            assert manager.submit(unit["task_id"], solve(unit["params"]), miner, db)["is_correct"]
+
+    progress = manager.job_progress(db, job["id"])
+    assert progress["status"] == "completed"
+    assert progress["rejected_results"] == 1
+    assert progress["units"]["done"] == 7
+    assert progress["result"] == pytest.approx(solve(params))
+
+
+def test_found_nonce_completes_job_and_cancels_other_units(db):
+    manager = JobManager()
+    params = {"prefix": "job", "difficulty": 2, "nonce_start": 0, "nonce_end": 5000}
+    job = manager.create_job(db, "nonce", "nonce_search", params, unit_size=500)
+
+    unit = manager.lease("m1", db)
+    other = manager.lease("m2", db)
+    # A nonce outside the unit's slice is rejected even if its hash matches.
+    outside = unit["params"]["nonce_end"]
+    assert manager.submit(unit["task_id"], outside, "m1", db)["is_correct"] is False
+
+    done = 0
+    while True:
+        unit = manager.lease("m1", db)
+        nonce = solve(unit["params"])
+        assert manager.submit(unit["task_id"], nonce, "m1", db)["is_correct"]
+        done += 1
+        if nonce != -1:
+            break
+
+    progress = manager.job_progress(db, job["id"])
+    assert progress["status"] == "completed"
+    assert progress["result"] == nonce
+    assert progress["units"]["cancelled"] == 10 - done
+    assert manager.submit(other["task_id"], -1, "m2", db)["status"] == "Job is not running"
+    assert manager.lease("m3", db) is None
+
+
+def test_invalid_results_and_lease_seconds_are_rejected(db):
+    manager = JobManager()
+    params = {"prefix": "job", "difficulty": 2, "nonce_start": 0, "nonce_end": 100}
+    for lease_seconds in (0, -5):
+        with pytest.raises(ValueError):
+            manager.create_job(db, "nonce", "nonce_search", params, 50, lease_seconds)
+    manager.create_job(db, "nonce", "nonce_search", params, unit_size=50)
+
+    unit = manager.lease("m1", db)
+    for result in (float("nan"), float("inf"), 1.5):
+        assert manager.submit(unit["task_id"], result, "m1", db)["status"] == "Invalid result"
+    # The lease survives a malformed answer.
+    assert manager.lease("m1", db)["task_id"] == unit["task_id"]
+    assert manager.job_progress(db, unit["job_id"])["rejected_results"] == 0
+
+
+def test_no_nonce_answers_are_spot_checked(db):
+    manager = JobManager()
+    params = {"prefix": "job", "difficulty": 2, "nonce_start": 0, "nonce_end": 1000}
+    manager.create_job(db, "lazy", "nonce_search", params, unit_size=500)
+    unit = manager.lease("m1", db)
+    assert solve(unit["params"]) != -1
+    # Slices no larger than JOB_NONCE_SPOT_CHECK are rehashed in full.
+    assert manager.submit(unit["task_id"], -1, "m1", db)["is_correct"] is False
+
+    # Without a nonce in the space, the job cannot be shown to be exhausted.
+    params = {"prefix": "job", "difficulty": 6, "nonce_start": 0, "nonce_end": 100}
+    job = manager.create_job(db, "empty", "nonce_search", params, unit_size=50)
+    manager.cancel_job(db, unit["job_id"])
+    while unit := manager.lease("m1", db):
+        assert manager.submit(unit["task_id"], -1, "m1", db)["is_correct"]
+    progress = manager.job_progress(db, job["id"])
+    assert (progress["status"], progress["result"]) == ("unverified", None)
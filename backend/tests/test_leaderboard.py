@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+from ingest import ResultIngestor
+from leaderboard import Leaderboard, MinerStats, backfill_miner_stats
+from models import BroadcastTaskModel
+
+
+def test_streaks_and_sorted_indexes():
+    now = datetime.utcnow()
+    leaderboard = Leaderboard()
+    fast, slow = MinerStats("fast"), MinerStats("slow")
+    for is_correct in (True, True, False, True):
+        fast.add(is_correct, 1.0, now)
+    for is_correct in (True, True, True):
+        slow.add(is_correct, 5.0, now)
+    assert (fast.current_streak, fast.best_streak, fast.accuracy) == (1, 2, 0.75)
+
+    leaderboard.apply([fast, slow])
+    assert [row["username"] for row in leaderboard.top("accuracy")] == ["slow", "fast"]
+    assert [row["username"] for row in leaderboard.top("avg_latency")] == ["fast", "slow"]
+
+    fast.add(True, 1.0, now)
+    leaderboard.apply([fast])
+    assert [row["username"] for row in leaderboard.top("correct")] == ["fast", "slow"]
+    worst = leaderboard.top("correct", limit=1, worst=True)
+    assert [(row["rank"], row["username"]) for row in worst] == [(2, "slow")]
+
+
+def test_flush_records_stats_and_backfill_matches(db):
+    created_at = datetime.utcnow() - timedelta(seconds=2)
+    task = BroadcastTaskModel(content="{}", created_at=created_at, expected_result=3)
+    db.add(task)
+    db.commit()
+
+    leaderboard = Leaderboard()
+    ingestor = ResultIngestor(leaderboard)
+    ingestor.submit(task.id, 3, "m1", db)
+    ingestor.submit(task.id, 4, "m2", db)
+    assert ingestor.flush() == 2
+
+    m1, m2 = leaderboard.get("m1"), leaderboard.get("m2")
+    assert (m1["correct"], m1["current_streak"]) == (1, 1)
+    assert (m2["incorrect"], m2["current_streak"]) == (1, 0)
+    assert m1["avg_latency_seconds"] >= 2
+
+    assert backfill_miner_stats(db) == 2
+    reloaded = Leaderboard()
+    reloaded.load(db)
+    assert reloaded.top("correct") == leaderboard.top("correct")
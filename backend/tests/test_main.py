@@ -1,10 +1,12 @@
 from fastapi.testclient import TestClient
-from backend.src.main import app
 
-client = TestClient(app)
+import main
 
+client = TestClient(main.app)
 
-def test_read_root():
-    response = client.get("/")
-    assert response.status_code == 200
-    assert response.json() == {"message": "Hello, FastAPI!"}
+
+def test_task_requires_a_valid_token():
+    assert client.get("/task").status_code == 403
+    response = client.get("/task", headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Invalid credentials"}
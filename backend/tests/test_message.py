@@ -0,0 +1,108 @@
+import asyncio
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from db import Base
+from message import MessageManager
+from schemas import BulkMessage
+from security import SecurityManager
+from state import InMemoryMessageStore, SqlMessageStore, SqlKeyStore, PublicKeyRecord
+
+
+def test_inbox_is_bounded_and_drops_oldest():
+    manager = MessageManager(InMemoryMessageStore(max_messages=3))
+    for i in range(5):
+        asyncio.run(manager._enqueue("miner", {"encrypted": str(i)}))
+
+    batch = asyncio.run(manager.get_message("miner", limit=10))
+
+    assert [item["encrypted"] for item in batch["messages"]] == ["2", "3", "4"]
+    assert asyncio.run(manager.get_message("miner")) == {"message": None}
+
+
+def test_long_poll_wakes_up_on_new_message():
+    manager = MessageManager()
+
+    async def scenario():
+        waiter = asyncio.create_task(manager.get_message("miner", wait=5, limit=5))
+        await asyncio.sleep(0.05)
+        await manager._enqueue("miner", {"encrypted": "hello"})
+        await manager._notify("miner")
+        return await asyncio.wait_for(waiter, 1)
+
+    assert asyncio.run(scenario()) == {"messages": [{"encrypted": "hello"}]}
+
+
+def test_sql_store_keeps_newest_messages_in_order(db):
+    store = SqlMessageStore(max_messages=3)
+    store.append_many([("miner", {"encrypted": str(i)}) for i in range(5)])
+    store.append("other", {"encrypted": "x"})
+
+    assert store.take("miner", 2) == [{"encrypted": "2"}, {"encrypted": "3"}]
+    assert store.take("miner", 10) == [{"encrypted": "4"}]
+    assert store.take("miner", 10) == []
+
+
+def test_sql_store_rejects_when_full(db):
+    store = SqlMessageStore(max_messages=1, overflow_policy="reject")
+
+    assert store.append_many([("miner", {"encrypted": "1"}), ("miner", {"encrypted": "2"})]) == [
+        True,
+        False,
+    ]
+
+
+def test_sql_key_store_is_shared_between_instances(db):
+    writer, reader = SqlKeyStore(), SqlKeyStore()
+    writer.set("miner", PublicKeyRecord("pem", "fp", "hybrid"))
+
+    assert reader.get("miner").encryption_mode == "hybrid"
+    writer.pop("miner")
+    assert not SqlKeyStore().has("miner")
+
+
+def test_sql_key_store_misses_query_off_the_event_loop(tmp_path, make_public_key_pem):
+    # A file database: the in-memory one is private to each thread.
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'keys.db'}")
+    Base.metadata.create_all(bind=file_engine)
+    threads = []
+
+    def session_factory():
+        threads.append(threading.get_ident())
+        return Session(file_engine)
+
+    security_manager = SecurityManager()
+    security_manager.user_public_keys = SqlKeyStore(session_factory, cache_seconds=0)
+    security_manager.user_public_keys.set(
+        "miner", PublicKeyRecord(make_public_key_pem(), "fp")
+    )
+    threads.clear()
+
+    async def scenario():
+        assert await security_manager.has_public_key("miner")
+        await security_manager.encrypt_response_async({"task_id": 1}, "miner")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert threads and loop_thread not in threads
+
+
+def test_send_bulk_reports_status_per_recipient(make_public_key_pem):
+    security_manager = SecurityManager()
+    security_manager.set_public_key("m1", make_public_key_pem())
+    security_manager.set_public_key("m2", make_public_key_pem())
+    manager = MessageManager(InMemoryMessageStore())
+    message = BulkMessage(content="hello", to_users=["m1", "admin", "ghost", "m2", "m1"])
+
+    response = asyncio.run(manager.send_bulk(message, message.to_users, security_manager, "admin"))
+
+    assert response["sent"] == 2
+    assert response["results"] == {
+        "m1": "message stored",
+        "admin": "Cannot send message to yourself",
+        "ghost": "Recipient not available",
+        "m2": "message stored",
+    }
+    assert len(manager.store.take("m1", 10)) == 1
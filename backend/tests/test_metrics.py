@@ -0,0 +1,35 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from metrics import Histogram, MetricsMiddleware, request_latency
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test.", ("operation",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "a")
+    histogram.observe(0.5, "a")
+    histogram.observe(5, "a")
+
+    lines = histogram.render()
+
+    assert 'test_seconds_bucket{operation="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{operation="a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{operation="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{operation="a"} 3' in lines
+
+
+def test_middleware_labels_requests_by_route_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: int):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/missing/3")
+
+    assert request_latency.series[("GET", "/items/{item_id}", "200")][2] == 2
+    assert request_latency.series[("GET", "unmatched", "404")][2] >= 1
@@ -0,0 +1,53 @@
+from sqlalchemy import create_engine, inspect, text
+
+from migrations import migrate, latest_version, current_version, MIGRATIONS
+
+# Tables as created before schema versioning existed.
+LEGACY_SCHEMA = [
+    "CREATE TABLE active_sessions (id INTEGER PRIMARY KEY, username VARCHAR, ip VARCHAR, timestamp DATETIME)",
+    "CREATE INDEX ix_active_sessions_username ON active_sessions (username)",
+    "CREATE TABLE broadcast_tasks (id INTEGER PRIMARY KEY, content VARCHAR NOT NULL, created_at DATETIME, "
+    "a INTEGER, b INTEGER, operation VARCHAR, expected_result FLOAT)",
+    "CREATE TABLE broadcast_task_results (id INTEGER PRIMARY KEY, broadcast_task_id INTEGER, "
+    "username VARCHAR NOT NULL, answer FLOAT NOT NULL, submitted_at DATETIME, is_correct BOOLEAN)",
+]
+
+
+def test_fresh_database_is_created_and_rerun_is_a_no_op():
+    engine = create_engine("sqlite://")
+
+    assert len(migrate(engine)) == len(MIGRATIONS)
+    assert migrate(engine) == []
+    with engine.connect() as connection:
+        assert current_version(connection) == latest_version()
+
+
+def test_legacy_database_keeps_data_and_gains_constraints():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        for statement in LEGACY_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text(
+            "INSERT INTO active_sessions (username, ip, timestamp) VALUES "
+            "('miner', 'old', '2024-01-01'), ('miner', 'new', '2024-01-02')"
+        ))
+        connection.execute(text(
+            "INSERT INTO broadcast_tasks (content, created_at, a, b, operation, expected_result) "
+            "VALUES ('add 1 and 1', '2024-01-01', 1, 1, '+', 2)"
+        ))
+        connection.execute(text(
+            "INSERT INTO broadcast_task_results (broadcast_task_id, username, answer, is_correct) "
+            "VALUES (1, 'miner', 2, 1), (1, 'miner', 3, 0)"
+        ))
+
+    migrate(engine)
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT username, ip FROM active_sessions")).all() == [
+            ("miner", "new")
+        ]
+        assert connection.execute(
+            text("SELECT total_submissions, correct_count FROM broadcast_tasks")
+        ).one() == (1, 1)
+        indexes = {index["name"] for index in inspect(connection).get_indexes("broadcast_tasks")}
+        assert "ix_broadcast_tasks_created_at_id" in indexes
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+from models import ActiveSessionModel
+from presence import PresenceTracker
+
+
+def test_repeated_logins_keep_one_row_per_user(db):
+    tracker = PresenceTracker()
+    tracker.login("miner", "10.0.0.1")
+    tracker.flush()
+    tracker.login("miner", "10.0.0.2")
+    tracker.touch("other", "10.0.0.3")
+    assert tracker.flush() == 2
+
+    rows = {row.username: row.ip for row in db.query(ActiveSessionModel)}
+    assert rows == {"miner": "10.0.0.2", "other": "10.0.0.3"}
+    assert [s["username"] for s in tracker.active_sessions()] == ["miner", "other"]
+
+
+def test_expired_and_removed_sessions_are_deleted(db):
+    tracker = PresenceTracker()
+    tracker.login("idle", "ip")
+    tracker.login("gone", "ip")
+    tracker.login("active", "ip")
+    tracker.flush()
+
+    tracker.sessions["idle"].last_seen = datetime.utcnow() - timedelta(days=1)
+    db.query(ActiveSessionModel).filter(ActiveSessionModel.username == "idle").update(
+        {"last_seen": datetime.utcnow() - timedelta(days=1)}
+    )
+    db.commit()
+    tracker.remove("gone")
+    tracker.flush()
+
+    assert [row.username for row in db.query(ActiveSessionModel)] == ["active"]
+    assert tracker.active_usernames() == ["active"]
@@ -0,0 +1,66 @@
+import json
+import threading
+
+import pytest
+
+import provisioning
+from models import UserModel
+from provisioning import hash_passwords, parse_users, register_users, shutdown_hash_pool
+from utils import verify_password
+
+
+@pytest.fixture(autouse=True)
+def hash_pool():
+    yield
+    shutdown_hash_pool()
+
+
+def test_parse_csv_and_ndjson():
+    csv_rows = parse_users('username,password,public_key\nu1,pw,"KEY"\n', "csv")
+    assert csv_rows == [(1, {"username": "u1", "password": "pw", "public_key": "KEY"}, None)]
+
+    ndjson_rows = parse_users('{"username": "u1"}\n\nnot json\n', "ndjson")
+    assert ndjson_rows[0] == (1, {"username": "u1"}, None)
+    assert ndjson_rows[1][0] == 3 and ndjson_rows[1][2].startswith("Invalid JSON")
+
+
+def test_register_users_reports_row_errors(db, make_public_key_pem):
+    public_key = make_public_key_pem()
+    db.add(UserModel(username="taken", hashed_password="x", public_key=public_key))
+    db.commit()
+    text = "\n".join(
+        json.dumps(row)
+        for row in [
+            {"username": "u1", "password": "pw1", "public_key": public_key},
+            {"username": "u2", "password": "pw2", "public_key": public_key},
+            {"username": "u1", "password": "pw3", "public_key": public_key},
+            {"username": "taken", "password": "pw", "public_key": public_key},
+            {"username": "u3", "password": "pw", "public_key": "not a key"},
+            {"username": "u4", "public_key": public_key},
+        ]
+    )
+
+    report = register_users(parse_users(text, "ndjson"), db)
+
+    assert report["created"] == 2
+    assert [(error["row"], error["error"]) for error in report["errors"]] == [
+        (3, "Duplicate username in input"),
+        (4, "Username already registered"),
+        (5, report["errors"][2]["error"]),
+        (6, "Missing field: password"),
+    ]
+    assert report["errors"][2]["error"].startswith("Invalid public key")
+    user = db.query(UserModel).filter(UserModel.username == "u2").one()
+    assert verify_password("pw2", user.hashed_password)
+
+
+def test_bulk_hashing_runs_on_its_own_threads(monkeypatch):
+    threads = set()
+
+    def recorded(password):
+        threads.add(threading.current_thread().name)
+        return f"hashed-{password}"
+
+    monkeypatch.setattr(provisioning, "hash_password", recorded)
+    assert hash_passwords(["a", "b", "c"]) == ["hashed-a", "hashed-b", "hashed-c"]
+    assert threads and all(name.startswith("bcrypt-bulk") for name in threads)
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from ratelimit import RateLimiter, WindowCounter, SqlWindowCounter
+
+
+def test_limiter_rejects_after_limit():
+    limiter = RateLimiter("test", 3, 60, backend="memory")
+
+    async def scenario():
+        for _ in range(3):
+            await limiter.hit("1.2.3.4")
+        await limiter.hit("5.6.7.8")
+        with pytest.raises(HTTPException) as error:
+            await limiter.hit("1.2.3.4")
+        return error.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert "Retry-After" in error.headers
+
+
+def test_cost_counts_as_several_hits():
+    limiter = RateLimiter("test", 5, 60, backend="memory")
+
+    async def scenario():
+        await limiter.hit("miner", cost=3)
+        with pytest.raises(HTTPException):
+            await limiter.hit("miner", cost=3)
+        await limiter.hit("miner", cost=2)
+        with pytest.raises(HTTPException):
+            await limiter.hit("other", cost=6)
+
+    asyncio.run(scenario())
+
+
+def test_previous_window_is_weighted_and_idle_keys_expire():
+    counter = WindowCounter("test", 10, max_keys=100)
+    for _ in range(4):
+        counter.add("a", 5.0)
+
+    assert counter.counts("a", 15.0) == (4, 0)
+    assert RateLimiter("test", 3, 10, backend="memory")._estimate(4, 0, 17.5) == 1.0
+
+    counter.add("b", 35.0)
+    assert counter.counts("a", 35.0) == (0, 0)
+    assert len(counter) == 1
+
+
+def test_counter_caps_tracked_keys():
+    counter = WindowCounter("test", 60, max_keys=2)
+    for key in ("a", "b", "c"):
+        counter.add(key, 1.0)
+
+    assert len(counter) == 2
+    assert counter.evictions == 1
+    assert counter.counts("a", 1.0) == (0, 0)
+
+
+def test_sql_counter_is_shared(db):
+    SqlWindowCounter("test", 60).add("ip", 61.0)
+    SqlWindowCounter("test", 60).add("ip", 130.0)
+
+    assert SqlWindowCounter("test", 60).counts("ip", 130.0) == (1, 1)
@@ -0,0 +1,140 @@
+import asyncio
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from config import settings
+from security import SecurityManager, OAEP_PADDING
+from utils import create_access_token
+
+
+def test_public_key_cache_hits_after_login(make_public_key_pem):
+    manager = SecurityManager()
+    manager.set_public_key("miner", make_public_key_pem())
+
+    manager.encrypt_response({"task_id": 1}, "miner", None)
+    manager.encrypt_response({"task_id": 1}, "miner", None)
+
+    stats = manager.public_key_cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 0
+
+
+def test_public_key_cache_drops_old_key(make_public_key_pem):
+    manager = SecurityManager()
+    manager.set_public_key("miner", make_public_key_pem())
+    manager.set_public_key("miner", make_public_key_pem())
+
+    assert len(manager.public_key_cache) == 1
+
+    manager.drop_public_key("miner")
+    assert len(manager.public_key_cache) == 0
+    assert not manager.user_public_keys.has("miner")
+
+
+def test_hybrid_encryption_handles_large_payloads(make_key_pair):
+    manager = SecurityManager()
+    private_key, public_key_pem = make_key_pair()
+    manager.set_public_key("miner", public_key_pem, "hybrid")
+
+    data = {"message": "x" * 4096}
+    response = manager.encrypt_response(data, "miner", None)
+
+    data_key = private_key.decrypt(
+        base64.b64decode(response["encrypted_key"]), OAEP_PADDING
+    )
+    payload = AESGCM(data_key).decrypt(
+        base64.b64decode(response["iv"]), base64.b64decode(response["encrypted"]), None
+    )
+    assert json.loads(payload) == data
+
+
+def test_rsa_mode_rejects_oversized_payloads_unless_enveloped(make_key_pair):
+    manager = SecurityManager()
+    private_key, public_key_pem = make_key_pair()
+    manager.set_public_key("miner", public_key_pem)
+    data = {"params": "x" * 512}
+
+    with pytest.raises(HTTPException) as error:
+        manager.encrypt_response(data, "miner", None)
+    assert error.value.status_code == 406
+
+    response = manager.encrypt_response(data, "miner", None, envelope=True)
+    data_key = private_key.decrypt(base64.b64decode(response["encrypted_key"]), OAEP_PADDING)
+    payload = AESGCM(data_key).decrypt(
+        base64.b64decode(response["iv"]), base64.b64decode(response["encrypted"]), None
+    )
+    assert json.loads(payload) == data
+
+
+def test_session_key_skips_rsa_and_uses_counter_nonces():
+    manager = SecurityManager()
+    expires_at = datetime.utcnow() + timedelta(minutes=5)
+    session_key = manager.start_session("sid", "miner", expires_at)
+
+    first = manager.encrypt_response({"task_id": 1}, "miner", session_id="sid")
+    second = manager.encrypt_response({"task_id": 1}, "miner", session_id="sid")
+
+    assert first["iv"] != second["iv"]
+    assert first["kid"] == second["kid"] == "sid"
+    payload = session_key.aesgcm.decrypt(
+        base64.b64decode(second["iv"]), base64.b64decode(second["encrypted"]), None
+    )
+    assert json.loads(payload) == {"task_id": 1}
+
+
+def test_expired_session_key_falls_back_to_public_key(make_public_key_pem):
+    manager = SecurityManager()
+    manager.set_public_key("miner", make_public_key_pem())
+    manager.start_session("sid", "miner", datetime.utcnow() - timedelta(seconds=1))
+
+    response = manager.encrypt_response({"task_id": 1}, "miner", session_id="sid")
+
+    assert "iv" not in response
+    assert manager.session_keys == {} and manager.user_sessions == {}
+
+
+def bearer(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def test_verified_tokens_are_cached_until_revoked():
+    manager = SecurityManager()
+    token = create_access_token({"sub": "miner"})
+
+    assert asyncio.run(manager.validate_token(bearer(token))) == "miner"
+    assert asyncio.run(manager.validate_token(bearer(token))) == "miner"
+    assert manager.token_cache.stats()["hits"] == 1
+
+    manager.revoke_token(token)
+    with pytest.raises(HTTPException):
+        asyncio.run(manager.validate_token(bearer(token)))
+
+
+def signed_token(claims: dict) -> str:
+    return jwt.encode(claims, settings.jwt_secret_key, algorithm=settings.jwt_algorithm)
+
+
+def test_revoke_user_rejects_tokens_issued_before_it():
+    manager = SecurityManager()
+    now = datetime.utcnow()
+    earlier = signed_token(
+        {"sub": "miner", "exp": now + timedelta(minutes=5), "iat": now - timedelta(seconds=2)}
+    )
+    without_iat = signed_token({"sub": "miner", "exp": now + timedelta(minutes=5)})
+    asyncio.run(manager.validate_token(bearer(earlier)))
+
+    manager.revoke_user("miner")
+    # A new login in the same second as the kick is not caught by it.
+    relogin = create_access_token({"sub": "miner"})
+
+    for token in (earlier, without_iat):
+        with pytest.raises(HTTPException):
+            asyncio.run(manager.validate_token(bearer(token)))
+    assert asyncio.run(manager.validate_token(bearer(relogin))) == "miner"
@@ -0,0 +1,144 @@
+import json
+from datetime import datetime
+
+import ingest
+from models import BroadcastTaskModel, BroadcastTaskResultModel
+from session import SessionManager
+
+
+def test_latest_task_is_served_from_cache(db):
+    manager = SessionManager()
+    manager.load_current_task(db)
+    assert manager.get_latest_broadcast_task() is None
+
+    task = manager.create_broadcast_task(db)
+
+    assert manager.get_latest_broadcast_task() == task
+    assert json.loads(manager.get_latest_broadcast_task_json()) == task
+
+
+def test_task_from_other_worker_notifies_listeners(db):
+    manager = SessionManager()
+    received = []
+    manager.add_task_listener(received.append)
+    task = {"task_id": 7, "content": "add 1 and 2", "a": 1, "b": 2, "operation": "+"}
+
+    manager.receive_task(task)
+    manager.receive_task(task)
+
+    assert received == [task]
+    assert manager.get_latest_broadcast_task() == task
+
+
+def test_results_are_buffered_and_deduplicated(db):
+    manager = SessionManager()
+    task = manager.create_broadcast_task(db)
+    expected = db.get(BroadcastTaskModel, task["task_id"]).expected_result
+
+    first = manager.validate_broadcast_task_result(task["task_id"], expected, "miner", db)
+    second = manager.validate_broadcast_task_result(task["task_id"], expected, "miner", db)
+    missing = manager.validate_broadcast_task_result(task["task_id"] + 1, expected, "miner", db)
+
+    assert first["is_correct"] is True
+    assert second == {"status": "Task already submitted"}
+    assert missing == {"status": "Task not found"}
+    assert db.query(BroadcastTaskResultModel).count() == 0
+
+    assert manager.result_ingestor.flush() == 1
+    assert db.query(BroadcastTaskResultModel).count() == 1
+
+
+def test_rejected_row_is_dropped_after_retries(db, monkeypatch):
+    monkeypatch.setattr(ingest, "RESULT_FLUSH_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(ingest, "RESULT_BATCH_SIZE", 2)
+    manager = SessionManager()
+    ingestor = manager.result_ingestor
+    task = manager.create_broadcast_task(db)
+    # NOT NULL violation: fails the whole batch, like a result whose task
+    # has been archived in the meantime.
+    bad = {
+        "broadcast_task_id": task["task_id"],
+        "username": None,
+        "answer": 1.0,
+        "is_correct": False,
+        "submitted_at": datetime.utcnow(),
+    }
+    ingestor.pending.append(bad)
+
+    # The size-triggered flush fails inside submit without failing the submission.
+    response = manager.validate_broadcast_task_result(task["task_id"], 1.0, "miner", db)
+    assert response["status"] == "Result submitted successfully"
+    assert len(ingestor.pending) == 2
+
+    assert ingestor.flush() == 1
+    assert (ingestor.pending, ingestor.dropped) == ([], 1)
+    assert db.query(BroadcastTaskResultModel).one().username == "miner"
+
+
+def test_flush_updates_task_counters_and_backfill_matches(db):
+    manager = SessionManager()
+    task = manager.create_broadcast_task(db)
+    expected = db.get(BroadcastTaskModel, task["task_id"]).expected_result
+
+    manager.validate_broadcast_task_result(task["task_id"], expected, "miner1", db)
+    manager.validate_broadcast_task_result(task["task_id"], expected + 1, "miner2", db)
+    manager.result_ingestor.flush()
+
+    history = manager.get_broadcast_tasks_history(db)["items"]
+    assert history[0]["total_submissions"] == 2
+    assert history[0]["correct_count"] == 1
+    assert history[0]["incorrect_count"] == 1
+
+    db.query(BroadcastTaskModel).update({"total_submissions": 0, "correct_count": 0})
+    db.commit()
+    assert SessionManager.backfill_broadcast_task_stats(db) == 1
+    db.expire_all()
+    assert manager.get_broadcast_tasks_history(db)["items"][0]["accuracy"] == 50.0
+
+
+def test_history_pages_with_keyset_cursor(db):
+    manager = SessionManager()
+    task_ids = [manager.create_broadcast_task(db)["task_id"] for _ in range(5)]
+
+    seen = []
+    cursor = None
+    while True:
+        page = manager.get_broadcast_tasks_history(db, limit=2, cursor=cursor)
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == sorted(task_ids, reverse=True)
+
+
+def test_pooled_tasks_stay_hidden_until_broadcast(db):
+    manager = SessionManager()
+    manager.enqueue_tasks(db, 5)
+
+    assert SessionManager.pooled_task_count(db) == 5
+    assert manager.get_broadcast_tasks_history(db)["items"] == []
+    assert manager.validate_broadcast_task_result(1, 0, "miner", db) == {"status": "Task not found"}
+
+    task = manager.create_broadcast_task(db)
+
+    assert task["task_id"] == 1
+    assert SessionManager.pooled_task_count(db) == 4
+    assert [item["id"] for item in manager.get_broadcast_tasks_history(db)["items"]] == [1]
+
+
+def test_empty_pool_is_refilled_in_bulk(db):
+    manager = SessionManager()
+
+    manager.create_broadcast_task(db, refill=10)
+
+    assert SessionManager.pooled_task_count(db) == 9
+
+
+def test_generated_divisions_are_exact():
+    rows = SessionManager().generate_task_rows(500)
+
+    for row in rows:
+        if row["operation"] == "/":
+            assert row["a"] % row["b"] == 0
+            assert row["expected_result"] == row["a"] // row["b"]
@@ -29,12 +29,33 @@ async function exportPublicKey(key) {
   return `-----BEGIN PUBLIC KEY-----\n${base64}\n-----END PUBLIC KEY-----`;
 }
 
-async function decryptData(encryptedData, privateKey) {
-  const encryptedArray = Uint8Array.from(atob(encryptedData), c => c.charCodeAt(0));
-  return await window.crypto.subtle.decrypt(
+function base64ToBytes(data) {
+  return Uint8Array.from(atob(data), c => c.charCodeAt(0));
+}
+
+// Samo RSA-OAEP albo koperta: klucz AES zaszyfrowany RSA-OAEP + dane w AES-GCM
+async function decryptData(encryptedResponse, privateKey) {
+  const encrypted = base64ToBytes(encryptedResponse.encrypted);
+  if (!encryptedResponse.encrypted_key) {
+    return await window.crypto.subtle.decrypt({ name: "RSA-OAEP" }, privateKey, encrypted);
+  }
+
+  const rawKey = await window.crypto.subtle.decrypt(
     { name: "RSA-OAEP" },
     privateKey,
-    encryptedArray
+    base64ToBytes(encryptedResponse.encrypted_key)
+  );
+  const aesKey = await window.crypto.subtle.importKey(
+    "raw",
+    rawKey,
+    { name: "AES-GCM" },
+    false,
+    ["decrypt"]
+  );
+  return await window.crypto.subtle.decrypt(
+    { name: "AES-GCM", iv: base64ToBytes(encryptedResponse.iv) },
+    aesKey,
+    encrypted
   );
 }
 
@@ -44,9 +65,10 @@ export async function authenticate(username, password) {
     const keyPair = await generateKeyPair();
     const publicKey = await exportPublicKey(keyPair.publicKey);
 
+    // Token nie mieści się w jednym bloku RSA-OAEP, więc prosimy o kopertę
     const response = await fetch(`${SERVER_BASE_URL}/login`, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: { "Content-Type": "application/json", "X-Encryption": "hybrid" },
       body: JSON.stringify({
         username: username,
         password: passwordHash,
@@ -60,7 +82,7 @@ export async function authenticate(username, password) {
     }
 
     const encryptedResponse = await response.json();
-    const decryptedData = await decryptData(encryptedResponse.encrypted, keyPair.privateKey);
+    const decryptedData = await decryptData(encryptedResponse, keyPair.privateKey);
     const tokenData = JSON.parse(new TextDecoder().decode(decryptedData));
 
     return {
@@ -81,7 +103,7 @@ export async function getTask(token, keyPair) {
     });
 
     const encryptedResponse = await response.json();
-    const decryptedData = await decryptData(encryptedResponse.encrypted, keyPair.privateKey);
+    const decryptedData = await decryptData(encryptedResponse, keyPair.privateKey);
     return JSON.parse(new TextDecoder().decode(decryptedData));
   } catch (error) {
     console.error("Task fetch error:", error);
@@ -101,7 +123,7 @@ export async function submitResult(token, sum, keyPair) {
     });
 
     const encryptedResponse = await response.json();
-    const decryptedData = await decryptData(encryptedResponse.encrypted, keyPair.privateKey);
+    const decryptedData = await decryptData(encryptedResponse, keyPair.privateKey);
     return JSON.parse(new TextDecoder().decode(decryptedData));
   } catch (error) {
     console.error("Result submission error:", error);
@@ -175,9 +197,12 @@ export async function broadcastTask(token) {
   }
 }
 
-export async function getBroadcastHistory(token) {
+export async function getBroadcastHistory(token, cursor = null, limit = 50) {
   try {
-    const response = await fetch(`${SERVER_BASE_URL}/broadcast-tasks-history`, {
+    const params = new URLSearchParams({ limit });
+    if (cursor) params.set("cursor", cursor);
+
+    const response = await fetch(`${SERVER_BASE_URL}/broadcast-tasks-history?${params}`, {
       method: "GET",
       headers: { "Authorization": `Bearer ${token}` }
     });
@@ -190,6 +215,6 @@ export async function getBroadcastHistory(token) {
     return await response.json();
   } catch (error) {
     console.error("History fetch error:", error);
-    return [];
+    return { items: [], next_cursor: null };
   }
 }
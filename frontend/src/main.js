@@ -26,12 +26,14 @@ document.addEventListener("DOMContentLoaded", () => {
   const messageResponse = document.getElementById("message-response");
   const broadcastTaskButton = document.getElementById("broadcast-task");
   const refreshHistoryButton = document.getElementById("refresh-history");
+  const loadMoreHistoryButton = document.getElementById("load-more-history");
   const historyTableBody = document.getElementById("history-body");
   const broadcastResponse = document.getElementById("broadcast-response");
 
   let currentToken = null;
   let currentKeyPair = null;
   let currentTask = null;
+  let historyCursor = null;
 
   broadcastTaskButton.addEventListener("click", async () => {
     if (!currentToken) {
@@ -58,26 +60,34 @@ document.addEventListener("DOMContentLoaded", () => {
     await loadBroadcastHistory();
   });
 
-  // Load broadcast history
-  async function loadBroadcastHistory() {
+  loadMoreHistoryButton.addEventListener("click", async () => {
+    await loadBroadcastHistory(historyCursor);
+  });
+
+  // Load broadcast history (first page, or the next page after cursor)
+  async function loadBroadcastHistory(cursor = null) {
     if (!currentToken) return;
 
     try {
-      const history = await getBroadcastHistory(currentToken);
-      renderHistoryTable(history);
+      const page = await getBroadcastHistory(currentToken, cursor);
+      historyCursor = page.next_cursor;
+      loadMoreHistoryButton.style.display = historyCursor ? "inline-block" : "none";
+      renderHistoryTable(page.items, Boolean(cursor));
     } catch (error) {
       historyTableBody.innerHTML = `<tr><td colspan="7">Error loading history: ${error.message}</td></tr>`;
     }
   }
 
   // Render history table
-  function renderHistoryTable(history) {
-    if (history.length === 0) {
+  function renderHistoryTable(history, append = false) {
+    if (history.length === 0 && !append) {
       historyTableBody.innerHTML = '<tr><td colspan="7">No broadcast history available</td></tr>';
       return;
     }
 
-    historyTableBody.innerHTML = '';
+    if (!append) {
+      historyTableBody.innerHTML = '';
+    }
 
     history.forEach(task => {
       const row = document.createElement('tr');
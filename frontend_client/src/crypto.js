@@ -1,7 +1,58 @@
 import { convertPemToArrayBuffer } from "./utils.js";
 
-// Funkcja deszyfrująca dane
-export async function decryptData(encryptedData) {
+// Tryb szyfrowania negocjowany przy logowaniu (nagłówek X-Encryption)
+export const ENCRYPTION_HEADERS = { "X-Encryption": "session" };
+
+let sessionKeyCache = { raw: null, key: null };
+
+function base64ToBytes(data) {
+  return Uint8Array.from(atob(data), c => c.charCodeAt(0));
+}
+
+function bytesToBase64(buffer) {
+  return btoa(String.fromCharCode(...new Uint8Array(buffer)));
+}
+
+async function importAesKey(rawKey) {
+  return await window.crypto.subtle.importKey(
+    "raw",
+    rawKey,
+    { name: "AES-GCM" },
+    false,
+    ["decrypt"]
+  );
+}
+
+// Usuwa token i klucz sesji; pętle odbierania kończą się bez tokenu
+export function endSession() {
+  sessionStorage.removeItem("accessToken");
+  sessionStorage.removeItem("sessionKey");
+  sessionStorage.removeItem("sessionKeyId");
+}
+
+// Klucz sesji (AES) otrzymany przy logowaniu, importowany tylko raz
+async function getSessionKey() {
+  const raw = sessionStorage.getItem("sessionKey");
+  if (!raw) {
+    console.error("Brak klucza sesji w pamięci.");
+    return;
+  }
+  if (sessionKeyCache.raw !== raw) {
+    sessionKeyCache = { raw, key: await importAesKey(base64ToBytes(raw)) };
+  }
+  return sessionKeyCache.key;
+}
+
+async function decryptAes(aesKey, response) {
+  const decryptedData = await window.crypto.subtle.decrypt(
+    { name: "AES-GCM", iv: base64ToBytes(response.iv) },
+    aesKey,
+    base64ToBytes(response.encrypted)
+  );
+  return new TextDecoder().decode(decryptedData);
+}
+
+async function importPrivateKey() {
   const privateKeyPem = sessionStorage.getItem("privateKey");
   if (!privateKeyPem) {
     console.error("Brak klucza prywatnego w pamięci.");
@@ -10,16 +61,24 @@ export async function decryptData(encryptedData) {
 
   const privateKeyData = convertPemToArrayBuffer(privateKeyPem);
 
-  const privateKey = await window.crypto.subtle.importKey(
+  return await window.crypto.subtle.importKey(
     "pkcs8",
     privateKeyData,
     { name: "RSA-OAEP", hash: { name: "SHA-256" } },
     false,
     ["decrypt"]
   );
+}
+
+// Funkcja deszyfrująca dane
+export async function decryptData(encryptedData) {
+  const privateKey = await importPrivateKey();
+  if (!privateKey) {
+    return;
+  }
 
   // Konwertowanie zaszyfrowanych danych do formatu ArrayBuffer
-  const encryptedArrayBuffer = Uint8Array.from(atob(encryptedData), c => c.charCodeAt(0));
+  const encryptedArrayBuffer = base64ToBytes(encryptedData);
 
   // Deszyfrowanie danych
   const decryptedData = await window.crypto.subtle.decrypt(
@@ -35,3 +94,43 @@ export async function decryptData(encryptedData) {
   // Zwróć odszyfrowaną wiadomość jako obiekt JSON (lub sam tekst, w zależności od potrzeb)
   return decryptedMessage;
 }
+
+// Deszyfruje odpowiedź serwera: samo RSA-OAEP, koperta RSA + AES-GCM
+// albo AES-GCM kluczem sesji przekazanym przy logowaniu
+export async function decryptResponse(response) {
+  if (!response || !response.encrypted) {
+    return;
+  }
+  if (!response.iv) {
+    return await decryptData(response.encrypted);
+  }
+  if (!response.encrypted_key) {
+    // Klucz sesji należy do tokenu; inny "kid" oznacza, że nie mamy tego klucza
+    if (response.kid !== sessionStorage.getItem("sessionKeyId")) {
+      endSession();
+      throw new Error("Nieaktualny klucz sesji, zaloguj się ponownie.");
+    }
+    const sessionKey = await getSessionKey();
+    if (!sessionKey) {
+      return;
+    }
+    return await decryptAes(sessionKey, response);
+  }
+
+  const privateKey = await importPrivateKey();
+  if (!privateKey) {
+    return;
+  }
+
+  const rawKey = await window.crypto.subtle.decrypt(
+    { name: "RSA-OAEP" },
+    privateKey,
+    base64ToBytes(response.encrypted_key)
+  );
+  if (response.session) {
+    sessionStorage.setItem("sessionKey", bytesToBase64(rawKey));
+    sessionStorage.setItem("sessionKeyId", response.kid);
+  }
+
+  return await decryptAes(await importAesKey(rawKey), response);
+}
@@ -1,4 +1,4 @@
-import { decryptData } from "./crypto.js";
+import { decryptResponse } from "./crypto.js";
 import CONFIG from "./config.js";
 
 const url = CONFIG.BACKEND_URL
@@ -13,14 +13,21 @@ worker.onmessage = function(event) {
   }
 };
 
+// Długie odpytywanie: serwer trzyma żądanie do LONG_POLL_SECONDS lub do nadejścia wiadomości
+const LONG_POLL_SECONDS = 25;
+const MESSAGE_BATCH = 10;
+const RETRY_DELAY_MS = 2000;
+
+let receiving = false;
+
 export async function receiveMessage() {
   try {
     const token = sessionStorage.getItem("accessToken");
     if (!token) {
-      return;
+      return false;
     }
 
-    const response = await fetch(`${url}/get-message`, {
+    const response = await fetch(`${url}/get-message?wait=${LONG_POLL_SECONDS}&limit=${MESSAGE_BATCH}`, {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
@@ -29,33 +36,147 @@ export async function receiveMessage() {
     });
 
     if (!response.ok) {
-      return;
+      return false;
     }
 
     const data = await response.json();
-    if (!data || !data.encrypted) {
-      return;
-    }
+    for (const message of data.messages || []) {
+      const decrypted = await decryptResponse(message);
 
-    const decrypted = await decryptData(data.encrypted);
+      let parsed;
+      try {
+        parsed = JSON.parse(decrypted);
+      } catch (e) {
+        continue;
+      }
 
-    let parsed;
-    try {
-      parsed = JSON.parse(decrypted);
-    } catch (e) {
-      return;
+      const code = parsed.message;
+      worker.postMessage(code);
     }
-
-    const code = parsed.message;
-    worker.postMessage(code);
+    return true;
 
   } catch (error) {
-    return;
+    return false;
   }
 }
 
 export async function startReceivingMessages() {
-  setInterval(() => {
-    receiveMessage();
-  }, 2000);
+  if (receiving) return;
+  receiving = true;
+
+  while (sessionStorage.getItem("accessToken")) {
+    const ok = await receiveMessage();
+    if (!ok) {
+      await new Promise(resolve => setTimeout(resolve, RETRY_DELAY_MS));
+    }
+  }
+
+  receiving = false;
+}
+
+// Jednostki pracy: wycinek dużego zadania dzierżawiony tylko temu górnikowi
+const WORK_IDLE_DELAY_MS = 5000;
+const NONCE_CHECK_EVERY = 1000;
+
+const OPERATIONS = {
+  "+": (a, b) => a + b,
+  "-": (a, b) => a - b,
+  "*": (a, b) => a * b,
+  "/": (a, b) => a / b,
+};
+
+let working = false;
+
+function showWorkStatus(text) {
+  const status = document.getElementById("workUnitStatus");
+  if (status) {
+    status.innerText = text;
+  }
+}
+
+async function sha256Hex(text) {
+  const digest = await window.crypto.subtle.digest("SHA-256", new TextEncoder().encode(text));
+  return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, "0")).join("");
+}
+
+// Suma a <operacja> b po wycinku albo nonce z wycinka (-1, gdy go nie ma)
+export async function computeWorkUnit(unit) {
+  const params = unit.params;
+  if (unit.job_kind === "operand_range") {
+    const operation = OPERATIONS[params.operation];
+    let sum = 0;
+    for (let a = params.a_start; a < params.a_end; a++) {
+      for (let b = params.b_start; b < params.b_end; b++) {
+        sum += operation(a, b);
+      }
+    }
+    return sum;
+  }
+
+  const zeros = "0".repeat(params.difficulty);
+  for (let nonce = params.nonce_start; nonce < params.nonce_end; nonce++) {
+    // Po wylogowaniu przerywamy liczenie
+    if (nonce % NONCE_CHECK_EVERY === 0 && !sessionStorage.getItem("accessToken")) {
+      return null;
+    }
+    if ((await sha256Hex(`${params.prefix}${nonce}`)).startsWith(zeros)) {
+      return nonce;
+    }
+  }
+  return -1;
+}
+
+async function leaseWorkUnit(token) {
+  const response = await fetch(`${url}/task?kind=work_unit`, {
+    method: "GET",
+    headers: { "Authorization": `Bearer ${token}` }
+  });
+  // 404: brak wolnych jednostek
+  if (response.status === 404) return null;
+  if (!response.ok) throw new Error("Failed to lease work unit");
+  return JSON.parse(await decryptResponse(await response.json()));
+}
+
+async function submitWorkUnit(token, unit, result) {
+  const response = await fetch(
+    `${url}/task/${unit.task_id}/result?kind=work_unit&result=${encodeURIComponent(result)}`,
+    {
+      method: "POST",
+      headers: { "Authorization": `Bearer ${token}` }
+    }
+  );
+  // 409: dzierżawa wygasła albo zadanie anulowano; 400: jednostka już zamknięta
+  if (response.status === 409 || response.status === 400) {
+    return { status: (await response.json()).detail };
+  }
+  if (!response.ok) throw new Error("Failed to submit work unit");
+  return JSON.parse(await decryptResponse(await response.json()));
+}
+
+export async function startWorkUnits() {
+  if (working) return;
+  working = true;
+
+  let token;
+  while ((token = sessionStorage.getItem("accessToken"))) {
+    try {
+      const unit = await leaseWorkUnit(token);
+      if (!unit) {
+        showWorkStatus("Brak jednostek pracy");
+        await new Promise(resolve => setTimeout(resolve, WORK_IDLE_DELAY_MS));
+        continue;
+      }
+
+      showWorkStatus(`Liczę: ${unit.content}`);
+      const result = await computeWorkUnit(unit);
+      if (result === null) break;
+      const response = await submitWorkUnit(token, unit, result);
+      showWorkStatus(`Jednostka ${unit.task_id} (zadanie ${unit.job_id}): ${response.status}`);
+    } catch (error) {
+      console.error("Work unit error:", error);
+      await new Promise(resolve => setTimeout(resolve, RETRY_DELAY_MS));
+    }
+  }
+
+  working = false;
 }
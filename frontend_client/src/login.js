@@ -1,4 +1,4 @@
-import { decryptData } from "./crypto.js";
+import { decryptResponse, ENCRYPTION_HEADERS } from "./crypto.js";
 import { startReceivingMessages } from "./execMessages.js";
 import CONFIG from "./config.js"
 
@@ -13,13 +13,15 @@ export async function loginUser(e) {
   
   sessionStorage.setItem("privateKey", privateKeyPem);
   sessionStorage.setItem("username", username);
+  sessionStorage.removeItem("sessionKey");
+  sessionStorage.removeItem("sessionKeyId");
 
   const msg = document.getElementById("loginMessage");
 
   try {
     const response = await fetch(`${backendUrl}/login-db`, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: { "Content-Type": "application/json", ...ENCRYPTION_HEADERS },
       body: JSON.stringify({ username, password })
     });
 
@@ -32,7 +34,7 @@ export async function loginUser(e) {
         console.log("Zaszyfrowana odpowiedź:", data.encrypted);
 
         // Odszyfrowanie danych
-        const decrypted = await decryptData(data.encrypted);
+        const decrypted = await decryptResponse(data);
         console.log("Odszyfrowana odpowiedź:", decrypted);
 
         // Przekształć dane na obiekt, jeżeli jest to JSON
@@ -1,5 +1,5 @@
-import { decryptData } from "./crypto.js";
-import { receiveMessage, startReceivingMessages } from "./execMessages.js";
+import { decryptResponse } from "./crypto.js";
+import { receiveMessage, startReceivingMessages, startWorkUnits } from "./execMessages.js";
 import { registerUser } from "./register.js";
 import { loginUser } from "./login.js";
 import CONFIG from "./config.js";
@@ -27,37 +27,93 @@ async function loginUserWrapper(e) {
   await loginUser(e);
   if (sessionStorage.getItem("accessToken")) {
     startReceivingMessages();
-    startTaskPolling();
+    startTaskStream();
+    startWorkUnits();
     await getCurrentTask();
   }
 }
 
+let taskPollingInterval = null;
+
 function startTaskPolling() {
-  setInterval(async () => {
+  if (taskPollingInterval) return;
+  taskPollingInterval = setInterval(async () => {
     await getCurrentTask();
   }, 5000);
 }
 
+// Zadania wysyłane przez serwer (SSE); przy błędzie wracamy do odpytywania /task
+async function startTaskStream() {
+  const token = sessionStorage.getItem("accessToken");
+  if (!token) return;
+
+  try {
+    const response = await fetch(`${backendUrl}/task/stream`, {
+      method: "GET",
+      headers: { "Authorization": `Bearer ${token}` }
+    });
+
+    if (!response.ok || !response.body) throw new Error("Task stream unavailable");
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+
+      buffer += value;
+      const events = buffer.split("\n\n");
+      buffer = events.pop();
+      for (const event of events) {
+        await handleTaskEvent(event);
+      }
+    }
+  } catch (error) {
+    console.error("Task stream error:", error);
+  }
+
+  startTaskPolling();
+}
+
+async function handleTaskEvent(event) {
+  const dataLine = event.split("\n").find(line => line.startsWith("data: "));
+  if (!dataLine) return;
+
+  try {
+    const decrypted = await decryptResponse(JSON.parse(dataLine.slice(6)));
+    showTask(JSON.parse(decrypted));
+  } catch (error) {
+    console.error("Error handling task event:", error);
+  }
+}
+
+function showTask(task) {
+  if (!window.currentTask || window.currentTask.task_id !== task.task_id) {
+    window.currentTask = task;
+    renderTask(task);
+  }
+}
+
 async function getCurrentTask() {
   const token = sessionStorage.getItem("accessToken");
   if (!token) return;
 
+  // Serwer odpowiada 204 bez treści i bez szyfrowania, gdy zadanie się nie zmieniło
+  const query = window.currentTask ? `?since_task_id=${window.currentTask.task_id}` : "";
+
   try {
-    const response = await fetch(`${backendUrl}/task`, {
+    const response = await fetch(`${backendUrl}/task${query}`, {
       method: "GET",
       headers: { "Authorization": `Bearer ${token}` }
     });
 
+    if (response.status === 204) return window.currentTask;
     if (!response.ok) throw new Error("Failed to fetch task");
 
     const encryptedResponse = await response.json();
-    const decrypted = await decryptData(encryptedResponse.encrypted);
+    const decrypted = await decryptResponse(encryptedResponse);
     const task = JSON.parse(decrypted);
-
-    if (!window.currentTask || window.currentTask.task_id !== task.task_id) {
-      window.currentTask = task;
-      renderTask(task);
-    }
+    showTask(task);
 
     return task;
   } catch (error) {
@@ -110,7 +166,7 @@ async function submitTaskAnswer() {
     if (!response.ok) throw new Error('Failed to submit answer');
 
     const encryptedResponse = await response.json();
-    const decrypted = await decryptData(encryptedResponse.encrypted);
+    const decrypted = await decryptResponse(encryptedResponse);
     const result = JSON.parse(decrypted);
 
     document.getElementById("taskResult").innerText =